@@ -4,7 +4,7 @@
     'name': 'WAHA Messaging',
     'category': 'Marketing/WhatsApp',
     'summary': 'WhatsApp Integration using WAHA (WhatsApp HTTP API)',
-    'version': '1.2',
+    'version': '1.5',
     'description': """
         This module integrates Odoo with WAHA (WhatsApp HTTP API) to use WhatsApp messaging service.
         WAHA is a self-hosted WhatsApp HTTP API that you can run on your own server.
@@ -40,6 +40,9 @@
         'views/waha_message_views.xml',
         'views/waha_template_views.xml',
         'views/res_partner_views.xml',
+        'views/waha_campaign_views.xml',
+        'views/waha_webhook_event_views.xml',
+        'views/waha_identity_views.xml',
         'views/waha_menus.xml',
     ],
     'demo': [
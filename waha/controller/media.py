@@ -0,0 +1,49 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+from odoo import http
+from odoo.http import request
+
+_logger = logging.getLogger(__name__)
+
+
+class WahaMediaController(http.Controller):
+
+    @http.route('/waha/media/<int:message_id>', type='http', auth='user')
+    def waha_media(self, message_id, **kwargs):
+        """
+        Open the media of a WhatsApp message
+
+        Media of accounts fetching on demand is downloaded, converted and
+        stored on first access; afterwards (and for media fetched at
+        reception) this redirects to the stored attachment.
+        """
+        message = request.env['waha.message'].browse(message_id).exists()
+        if not message:
+            raise request.not_found()
+        message.check_access('read')
+
+        message = message.sudo()
+        # Pending media belong to the media cron; text messages have none
+        if message.media_state in ('lazy', 'error') and message.content_type != 'text':
+            _logger.info('Fetching media of message %s on demand', message.id)
+            message._fetch_media_now()
+        attachment = message.media_attachment_id
+        if not attachment:
+            raise request.not_found()
+        return request.redirect('/web/content/%s' % attachment.id)
+
+    @http.route('/waha/file/<int:attachment_id>/<int:expiry>/<string:signature>',
+                type='http', auth='public', methods=['GET'])
+    def waha_file(self, attachment_id, expiry, signature, **kwargs):
+        """
+        Serve an outbound file to WAHA from a signed URL
+
+        The file is streamed from the filestore; see
+        ir.attachment._waha_get_signed_url.
+        """
+        attachment = request.env['ir.attachment'].sudo().browse(attachment_id).exists()
+        if not attachment or not attachment._waha_check_file_signature(expiry, signature):
+            raise request.not_found()
+        return request.env['ir.binary']._get_stream_from(attachment).get_response()
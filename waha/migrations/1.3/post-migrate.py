@@ -0,0 +1,15 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """
+    Migration script for waha module 1.3
+
+    Changes:
+    - Starts moving legacy payloads to waha.message.payload right away
+      instead of waiting for the next cron run
+    """
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['waha.message.payload']._trigger_legacy_migration()
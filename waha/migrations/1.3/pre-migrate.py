@@ -0,0 +1,26 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Migration script for waha module 1.3 (before the update)
+
+    Changes:
+    - waha.message.raw_payload is now stored compressed in
+      waha.message.payload: the column is kept as raw_payload_legacy
+      and moved in batches by the "Compress Legacy Payloads" cron
+    """
+    cr.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_name='waha_message'
+        AND column_name='raw_payload'
+    """)
+
+    if cr.fetchone():
+        cr.execute("ALTER TABLE waha_message RENAME COLUMN raw_payload TO raw_payload_legacy")
+        _logger.info('Renamed waha_message.raw_payload to raw_payload_legacy')
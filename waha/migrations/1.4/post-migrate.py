@@ -0,0 +1,33 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+from odoo import api, SUPERUSER_ID
+from odoo.tools.misc import split_every
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Migration script for waha module 1.4
+
+    Changes:
+    - Computes res.partner.wa_mobile_normalized and wa_phone_normalized
+      of the partners with a local number, left empty by the SQL backfill
+    """
+    env = api.Environment(cr, SUPERUSER_ID, {'active_test': False})
+    Partner = env['res.partner']
+    fnames = ['wa_mobile_normalized', 'wa_phone_normalized']
+    partner_ids = Partner.search([
+        '|',
+        '&', ('wa_mobile_normalized', '=', False), ('mobile', '!=', False),
+        '&', ('wa_phone_normalized', '=', False), ('phone', '!=', False),
+    ]).ids
+    for ids in split_every(1000, partner_ids):
+        partners = Partner.browse(ids)
+        for fname in fnames:
+            env.add_to_compute(Partner._fields[fname], partners)
+        partners.flush_recordset(fnames)
+        env.invalidate_all()
+    _logger.info('Normalized WhatsApp numbers of %d partners with local numbers', len(partner_ids))
@@ -0,0 +1,40 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Migration script for waha module 1.4 (before the update)
+
+    Changes:
+    - res.partner.wa_mobile_normalized and wa_phone_normalized are added:
+      the columns are created and filled in SQL for international numbers
+      (+ or 00 prefix), so the update does not compute them partner by
+      partner. Local numbers need the partner country and are computed
+      after the update.
+    """
+    for column, number in (('wa_mobile_normalized', 'mobile'), ('wa_phone_normalized', 'phone')):
+        cr.execute("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name='res_partner'
+            AND column_name=%s
+        """, [column])
+        if cr.fetchone():
+            continue
+
+        cr.execute(f"ALTER TABLE res_partner ADD COLUMN {column} varchar")
+        cr.execute(rf"""
+            UPDATE res_partner
+               SET {column} = NULLIF(
+                       CASE WHEN ltrim({number}) LIKE '+%'
+                            THEN regexp_replace({number}, '\D', '', 'g')
+                            ELSE substr(regexp_replace({number}, '\D', '', 'g'), 3)
+                       END, '')
+             WHERE ltrim({number}) LIKE '+%'
+                OR regexp_replace({number}, '\D', '', 'g') LIKE '00%'
+        """)
+        _logger.info('Normalized WhatsApp %s numbers of %d partners', number, cr.rowcount)
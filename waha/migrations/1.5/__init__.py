@@ -0,0 +1 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
@@ -0,0 +1,28 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+
+from odoo import api, SUPERUSER_ID
+from odoo.tools.sql import column_exists
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Migration script for waha module 1.5
+
+    Changes:
+    - Drops waha_message.raw_payload_legacy, emptied by the "Compress
+      Legacy Payloads" cron since 1.3. Payloads the cron did not move
+      yet (e.g. upgrade straight from before 1.3) are moved first.
+    """
+    if not column_exists(cr, 'waha_message', 'raw_payload_legacy'):
+        return
+
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    Payload = env['waha.message.payload']
+    Payload._cron_migrate_legacy_payloads(time_budget=float('inf'), auto_commit=False)
+    cr.execute("ALTER TABLE waha_message DROP COLUMN raw_payload_legacy")
+    env.registry.clear_cache()
+    _logger.info('Dropped waha_message.raw_payload_legacy')
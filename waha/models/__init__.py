@@ -3,9 +3,15 @@
 from . import waha_account
 from . import waha_chat
 from . import waha_partner
+from . import waha_identity
 from . import waha_message
+from . import waha_message_payload
 from . import waha_template
+from . import waha_campaign
+from . import waha_media_retention
 from . import waha_group
+from . import waha_webhook_event
+from . import ir_attachment
 from . import res_partner
 from . import res_users_settings
 from . import mail_thread
@@ -0,0 +1,181 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+import os
+import shutil
+import time
+
+from odoo import api, models
+from odoo.tools import SQL, consteq
+from odoo.tools.misc import hmac
+
+from odoo.addons.waha.tools.waha_media import remove_file
+
+_logger = logging.getLogger(__name__)
+
+# Default lifetime of signed file URLs in seconds, overridable with
+# waha.file_url_ttl
+DEFAULT_FILE_URL_TTL = 900
+
+
+class IrAttachment(models.Model):
+    _inherit = 'ir.attachment'
+
+    @api.model
+    def _waha_create_from_file(self, path, checksum, file_size, vals):
+        """
+        Create an attachment from a file on disk without loading it in memory
+
+        See _waha_create_from_files.
+
+        Returns:
+            ir.attachment record
+        """
+        return self._waha_create_from_files([(path, checksum, file_size, vals)])
+
+    @api.model
+    def _waha_create_from_files(self, files):
+        """
+        Create attachments from files on disk without loading them in memory
+
+        With file storage, each file is moved to its place in the filestore
+        (named after its sha1 like any attachment) and the rows, created
+        with one create(), only record the location. Other storages fall
+        back to a regular create.
+
+        Args:
+            files: list of (path, checksum, file_size, vals) where path is a
+                temporary file, consumed (moved or removed), checksum its
+                sha1 hex digest, file_size its size in bytes and vals the
+                other attachment values (name, mimetype, res_model, ...)
+
+        Returns:
+            ir.attachment recordset, in the order of files
+        """
+        if self._storage() != 'file':
+            vals_list = []
+            for path, _checksum, _file_size, vals in files:
+                with open(path, 'rb') as f:
+                    vals_list.append(dict(vals, raw=f.read()))
+            attachments = self.create(vals_list)
+            for path, *_rest in files:
+                remove_file(path)
+            return attachments
+
+        stored = []
+        for path, checksum, file_size, _vals in files:
+            fname = checksum[:2] + '/' + checksum
+            full_path = self._full_path(fname)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if os.path.exists(full_path):
+                # Same content already stored (or moved by a failed batch)
+                remove_file(path)
+            else:
+                shutil.move(path, full_path)
+                os.chmod(full_path, 0o644)
+                # In case the transaction aborts
+                self._mark_for_gc(fname)
+            stored.append((fname, checksum, file_size))
+
+        attachments = self.create([dict(vals, type='binary') for *_rest, vals in files])
+        attachments._waha_set_stored_files(stored)
+        return attachments
+
+    def _waha_copy_stored(self, vals):
+        """
+        Create another attachment on the stored file of this one
+
+        The file is shared, not read nor written again.
+
+        Args:
+            vals: Values overriding the copied ones (res_model, res_id, ...)
+
+        Returns:
+            ir.attachment record
+        """
+        self.ensure_one()
+        if not self.store_fname:
+            return self.copy(vals)
+        attachment = self.create(dict({
+            'name': self.name,
+            'mimetype': self.mimetype,
+            'type': 'binary',
+        }, **vals))
+        attachment._waha_set_stored_file(self.store_fname, self.checksum, self.file_size)
+        return attachment
+
+    def _waha_get_signed_url(self):
+        """
+        Get a short-lived URL serving this attachment without login
+
+        WAHA downloads outbound files from it (see controller/media.py),
+        so their content is streamed from the filestore instead of being
+        sent base64 encoded.
+
+        Returns:
+            str: Absolute URL, valid waha.file_url_ttl seconds
+        """
+        self.ensure_one()
+        ICP = self.env['ir.config_parameter'].sudo()
+        expiry = int(time.time()) + int(ICP.get_param('waha.file_url_ttl', DEFAULT_FILE_URL_TTL))
+        return '%s/waha/file/%s/%s/%s' % (
+            self.get_base_url(), self.id, expiry, self._waha_file_signature(expiry)
+        )
+
+    def _waha_file_signature(self, expiry):
+        """Signature of a file URL of this attachment"""
+        self.ensure_one()
+        return hmac(self.env, 'waha-file', (self.id, expiry))
+
+    def _waha_check_file_signature(self, expiry, signature):
+        """Whether a file URL of this attachment is authentic and not expired"""
+        self.ensure_one()
+        return expiry >= time.time() and consteq(self._waha_file_signature(expiry), signature)
+
+    def _waha_replace_content(self, raw):
+        """
+        Replace the content of this attachment only
+
+        Attachments sharing its stored file (other messages, possibly of
+        other accounts) keep the current content; the old file is
+        garbage collected once none of them references it.
+
+        Args:
+            raw: New content
+        """
+        self.ensure_one()
+        if not self.store_fname:
+            self.write({'raw': raw})
+            return
+        old_fname = self.store_fname
+        checksum = self._compute_checksum(raw)
+        fname = self._file_write(raw, checksum)
+        self._waha_set_stored_file(fname, checksum, len(raw))
+        self._file_delete(old_fname)
+
+    def _waha_set_stored_file(self, fname, checksum, file_size):
+        """Point this attachment to a file already in the filestore"""
+        self.ensure_one()
+        self._waha_set_stored_files([(fname, checksum, file_size)])
+
+    def _waha_set_stored_files(self, stored):
+        """
+        Point these attachments to files already in the filestore
+
+        Args:
+            stored: list of (fname, checksum, file_size), in the order of self
+        """
+        if not self:
+            return
+        # create()/write() drop the fields they compute from the content
+        self.flush_recordset(['store_fname', 'checksum', 'file_size'])
+        self.env.cr.execute(SQL("""
+            UPDATE ir_attachment a
+               SET store_fname = v.fname, checksum = v.checksum, file_size = v.file_size
+              FROM (VALUES %s) AS v(id, fname, checksum, file_size)
+             WHERE a.id = v.id
+        """, SQL(", ").join(
+            SQL("(%s, %s, %s, %s)", attachment.id, fname, checksum, file_size)
+            for attachment, (fname, checksum, file_size) in zip(self, stored)
+        )))
+        self.invalidate_recordset(['store_fname', 'checksum', 'file_size'])
@@ -66,7 +66,7 @@ class MailThread(models.AbstractModel):
                     _logger.warning('No waha.chat found for channel %s', self.id)
                     return result
                 
-                # Create waha.message (will be sent automatically via _compute_msg_uid)
+                # Create waha.message (queued, sent by the outbox dispatcher)
                 try:
                     _logger.info('Creating waha.message for outbound send')
                     
@@ -81,12 +81,13 @@ class MailThread(models.AbstractModel):
                         sender_phone = sender_phone.replace('+', '').replace(' ', '').replace('-', '')
                     
                     # Create waha.message with mail_message_id to prevent duplication
-                    # Auto-send will happen via _compute_msg_uid
+                    # Sending happens in the outbox dispatcher after commit
                     waha_message = self.env['waha.message'].sudo().create({
                         'wa_account_id': wa_account.id,
                         'message_type': 'outbound',
                         'content_type': 'text',
                         'state': 'outgoing',
+                        'priority': '1',
                         'body': message_body,
                         'raw_chat_id': waha_chat.wa_chat_id,
                         'raw_sender_phone': sender_phone,
@@ -95,7 +96,7 @@ class MailThread(models.AbstractModel):
 
                     _logger.info('mail_message_id: %s', isinstance(result, int) and result or (result.id if result else 'None'))
                     
-                    _logger.info('Created waha.message %s (auto-send via compute, mail_msg: %s)', 
+                    _logger.info('Created waha.message %s (queued in outbox, mail_msg: %s)', 
                                 waha_message.id, waha_message.mail_message_id.id if waha_message.mail_message_id else None)
                 except Exception as e:
                     _logger.warning('Error sending message: %s', str(e))
@@ -110,50 +111,52 @@ class MailThread(models.AbstractModel):
 
     def _message_send_whatsapp(self, template_id=None, numbers=None):
         """
-        Send WhatsApp message for this record
+        Queue a WhatsApp template message for these records
+        
+        Messages are created in one batch and sent by the outbox
+        dispatcher, at bulk priority.
         
         :param template_id: waha.template record ID
-        :param numbers: List of phone numbers to send to
+        :param numbers: List of phone numbers to send to (default: the
+                        template phone field of each record)
         :return: waha.message records created
         """
-        self.ensure_one()
-        
-        if not numbers and hasattr(self, 'mobile'):
-            numbers = [self.mobile] if self.mobile else []
-        
-        if not numbers:
-            return self.env['waha.message']
-        
-        # Get template
+        WahaMessage = self.env['waha.message']
         template = self.env['waha.template'].browse(template_id) if template_id else None
         
         if not template:
-            return self.env['waha.message']
+            return WahaMessage
         
         # Get account
         wa_account = template.wa_account_id
         if not wa_account or wa_account.status != 'connected':
-            return self.env['waha.message']
+            return WahaMessage
+        
+        phone_field = template.phone_field or 'mobile'
         
-        # Format body
-        body = template._get_formatted_body(self)
+        # Format bodies
+        bodies = template._render_bodies(self)
         
-        # Create messages
-        messages = self.env['waha.message']
-        for number in numbers:
-            message = self.env['waha.message'].create({
-                'wa_account_id': wa_account.id,
-                'mobile_number': number,
-                'wa_template_id': template.id,
-                'body': body,
-                'message_type': 'outbound',
-            })
-            messages |= message
+        recipients = []
+        for record in self:
+            record_numbers = numbers
+            if not record_numbers and phone_field in record._fields:
+                record_numbers = [record[phone_field]] if record[phone_field] else []
+            recipients += [(record, number) for number in record_numbers or []]
+        contact_jids = WahaMessage._get_outbound_jids(wa_account, [number for _record, number in recipients])
         
-        # Send messages
-        messages.action_send()
+        vals_list = []
+        for record, number in recipients:
+            vals = WahaMessage._prepare_outbound_vals(
+                wa_account, number, bodies[record.id],
+                contact_jids=contact_jids,
+                wa_template_id=template.id,
+                priority='0',
+            )
+            if vals:
+                vals_list.append(vals)
         
-        return messages
+        return WahaMessage.sudo().create(vals_list)
 
     def action_send_whatsapp(self):
         """Open WhatsApp composer wizard"""
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+import re
+
 from odoo import api, fields, models, _
+from odoo.addons.phone_validation.tools import phone_validation
 
 
 class ResPartner(models.Model):
@@ -18,6 +21,22 @@ class ResPartner(models.Model):
              'Automatically populated from the first received message.'
     )
     
+    wa_mobile_normalized = fields.Char(
+        string='WhatsApp Mobile',
+        compute='_compute_wa_numbers_normalized',
+        store=True,
+        index='btree_not_null',
+        help='Mobile in E.164 format, digits only, as WhatsApp identifies contacts. '
+             'WhatsApp messages are matched to contacts on this number, then on the phone.'
+    )
+    wa_phone_normalized = fields.Char(
+        string='WhatsApp Phone',
+        compute='_compute_wa_numbers_normalized',
+        store=True,
+        index='btree_not_null',
+        help='Phone in E.164 format, digits only, as WhatsApp identifies contacts.'
+    )
+    
     wa_group_ids = fields.Many2many(
         'waha.group',
         'waha_group_member_rel',
@@ -53,8 +72,11 @@ class ResPartner(models.Model):
         """Update discuss.channel names based on partner changes"""
         for partner in self:
             try:
-                # Update individual chat channels
+                # Update individual chat channels (described by their chat ID)
                 numbers = []
+                for number in (partner.wa_mobile_normalized, partner.wa_phone_normalized):
+                    if number:
+                        numbers += [number, f'{number}@c.us']
                 if partner.mobile:
                     numbers.append(partner.mobile.replace('+', ''))
                 if partner.phone:
@@ -78,6 +100,89 @@ class ResPartner(models.Model):
                 _logger = logging.getLogger(__name__)
                 _logger.exception('Error updating WhatsApp channels for partner %s: %s', partner.id, str(e))
 
+    @api.depends('mobile', 'phone', 'country_id', 'company_id.country_id')
+    def _compute_wa_numbers_normalized(self):
+        """Normalize mobile and phone to E.164 digits"""
+        for partner in self:
+            partner.wa_mobile_normalized = partner._wa_normalize_phone(partner.mobile)
+            partner.wa_phone_normalized = partner._wa_normalize_phone(partner.phone)
+
+    @api.model
+    def _wa_find_by_numbers(self, numbers):
+        """
+        Get the partners of normalized WhatsApp numbers, in one query
+
+        A number matching the mobile of a partner wins over one matching
+        the phone of another; the oldest partner wins among equals.
+
+        Args:
+            numbers: Iterable of numbers in E.164 digits
+
+        Returns:
+            dict: number -> res.partner record, for the numbers found
+        """
+        numbers = list(set(numbers))
+        if not numbers:
+            return {}
+        partners = self.search([
+            '|', ('wa_mobile_normalized', 'in', numbers), ('wa_phone_normalized', 'in', numbers),
+        ], order='id')
+        found = {}
+        for field in ('wa_mobile_normalized', 'wa_phone_normalized'):
+            for partner in partners:
+                if partner[field]:
+                    found.setdefault(partner[field], partner)
+        return {number: partner for number, partner in found.items() if number in numbers}
+
+    def _wa_get_country(self):
+        """
+        Country used to format the local numbers of this partner
+
+        Only depends on the partner: its country, the country of its
+        company, then the country of the main company.
+        """
+        self.ensure_one()
+        return (
+            self.country_id
+            or self.company_id.country_id
+            or self.env.ref('base.main_company', raise_if_not_found=False).sudo().country_id
+        )
+
+    def _wa_normalize_phone(self, number):
+        """
+        Normalize a phone number of this partner to E.164 digits
+        
+        International numbers (+ or 00 prefix) only lose their formatting;
+        local ones are formatted with the country given by _wa_get_country.
+        
+        Args:
+            number: Phone number as typed
+        
+        Returns:
+            str: Digits without +, or False
+        """
+        digits = re.sub(r'\D', '', number or '')
+        if not digits:
+            return False
+        if number.lstrip().startswith('+'):
+            return digits
+        if digits.startswith('00'):
+            return digits[2:] or False
+        
+        country = self._wa_get_country()
+        if country:
+            formatted = phone_validation.phone_format(
+                number,
+                country.code,
+                country.phone_code,
+                force_format='E164',
+                raise_exception=False
+            )
+            formatted_digits = re.sub(r'\D', '', formatted or '')
+            if formatted_digits:
+                return formatted_digits
+        return digits
+
     @api.depends('waha_message_ids')
     def _compute_waha_messages_count(self):
         """Count WhatsApp messages"""
@@ -177,8 +282,8 @@ class ResPartner(models.Model):
             # Get the updated contact info for display
             from odoo.addons.waha.tools.waha_api import WahaApi
             api = WahaApi(account)
-            phone_clean = phone.replace('+', '').replace(' ', '')
-            contact_info = api.get_contact(phone_clean)
+            phone_clean = self.wa_mobile_normalized or self.wa_phone_normalized or phone.replace('+', '').replace(' ', '')
+            contact_info = self.env['waha.identity'].sudo()._get_contact(api, account, phone_clean)
             
             if not contact_info:
                 return {
@@ -275,11 +380,11 @@ class ResPartner(models.Model):
                 _logger.warning('Partner %s has no phone number for WAHA enrichment', self.id)
                 return
             
-            phone = phone.replace('+', '').replace(' ', '')
+            phone = self.wa_mobile_normalized or self.wa_phone_normalized or phone.replace('+', '').replace(' ', '')
             
-            # Call WAHA API
+            # Call WAHA API (with the JID known for the phone, if any)
             api = WahaApi(account)
-            contact_info = api.get_contact(phone)
+            contact_info = self.env['waha.identity'].sudo()._get_contact(api, account, phone)
             
             if not contact_info:
                 _logger.debug('No contact info found from WAHA for %s', phone)
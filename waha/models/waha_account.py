@@ -6,12 +6,31 @@ import string
 import requests
 from datetime import timedelta
 
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.addons.waha.tools.concurrency import PG_CONCURRENCY_ERRORS
+from odoo.addons.waha.tools.rate_limit import TokenBucket
 from odoo.addons.waha.tools.waha_api import WahaApi
+from odoo.addons.waha.tools.waha_jid import normalize_jid
 
 _logger = logging.getLogger(__name__)
 
+MEDIA_POLICIES = [
+    ('eager', 'At Reception'),
+    ('lazy', 'When Opened'),
+]
+MEDIA_POLICY_HELP = ('At Reception: download inbound media as soon as it arrives.\n'
+                     'When Opened: only keep the WAHA reference and download the '
+                     'file the first time someone opens it.')
+
+
+def _get_msg_uid(msg):
+    """Message id of a WAHA message payload"""
+    msg_id = msg.get('id', {})
+    if isinstance(msg_id, dict):
+        return msg_id.get('id', '') or msg_id.get('_serialized', '')
+    return str(msg_id)
+
 
 class WahaAccount(models.Model):
     _name = 'waha.account'
@@ -70,6 +89,71 @@ class WahaAccount(models.Model):
         readonly=True,
         copy=False
     )
+    webhook_mode = fields.Selection([
+        ('sync', 'Immediate'),
+        ('queue', 'Queued'),
+    ], string="Webhook Processing", default='sync', required=True,
+        help='Immediate: process each webhook inside the HTTP request.\n'
+             'Queued: store the raw event and answer WAHA right away; '
+             'a scheduled action processes the queue in the background.'
+    )
+
+    # Outbound throttling
+    send_rate = fields.Float(
+        string="Send Rate",
+        default=1.0,
+        help='Maximum sustained number of messages sent per second. '
+             '0 pauses sending for this account.'
+    )
+    send_burst = fields.Integer(
+        string="Send Burst",
+        default=5,
+        help='Number of messages that may be sent back to back before '
+             'the send rate applies.'
+    )
+    # Send bucket level, shared by the dispatcher runs of all workers
+    send_tokens = fields.Float(string="Send Tokens", readonly=True, copy=False)
+    send_tokens_time = fields.Float(
+        string="Send Tokens Time",
+        readonly=True,
+        copy=False,
+        help='Time of the send tokens level, in seconds since the epoch (0 = full bucket)'
+    )
+    daily_send_limit = fields.Integer(
+        string="Daily Send Limit",
+        default=0,
+        help='Maximum number of messages sent per day (0 = unlimited).'
+    )
+    send_media_by_url = fields.Boolean(
+        string="Send Files by URL",
+        default=False,
+        help='WAHA downloads outbound files from a short-lived signed Odoo URL '
+             'instead of receiving them base64 encoded. Only enable it when WAHA '
+             'can reach Odoo at its web.base.url, as for webhooks.'
+    )
+
+    # Inbound media download policy, per content type
+    media_policy_image = fields.Selection(
+        MEDIA_POLICIES, string="Images", default='eager', required=True, help=MEDIA_POLICY_HELP
+    )
+    media_policy_sticker = fields.Selection(
+        MEDIA_POLICIES, string="Stickers", default='eager', required=True, help=MEDIA_POLICY_HELP
+    )
+    media_policy_audio = fields.Selection(
+        MEDIA_POLICIES, string="Audio", default='eager', required=True, help=MEDIA_POLICY_HELP
+    )
+    media_policy_video = fields.Selection(
+        MEDIA_POLICIES, string="Videos", default='eager', required=True, help=MEDIA_POLICY_HELP
+    )
+    media_policy_document = fields.Selection(
+        MEDIA_POLICIES, string="Documents", default='eager', required=True, help=MEDIA_POLICY_HELP
+    )
+    media_retention_ids = fields.One2many(
+        'waha.media.retention',
+        'wa_account_id',
+        string="Media Retention",
+        help='Rules reducing or removing stored media after some time'
+    )
 
     # QR Code for Connection
     qr_code = fields.Binary(
@@ -118,6 +202,44 @@ class WahaAccount(models.Model):
          "Session name must be unique")
     ]
 
+    # Fields cached by _get_session_info, any change clears the cache
+    _session_cache_fields = {'session_name', 'webhook_verify_token', 'webhook_mode', 'active'}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        accounts = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return accounts
+
+    def write(self, vals):
+        res = super().write(vals)
+        if self._session_cache_fields.intersection(vals):
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
+
+    @api.model
+    @tools.ormcache('session_name')
+    def _get_session_info(self, session_name):
+        """
+        Resolve a WAHA session name for the webhook hot path
+
+        Cached at registry level and cleared whenever an account is
+        created, deleted or one of the cached fields changes.
+
+        Returns:
+            tuple (account_id, webhook_verify_token, webhook_mode)
+            or None if no account uses this session
+        """
+        account = self.sudo().search([('session_name', '=', session_name)], limit=1)
+        if not account:
+            return None
+        return (account.id, account.webhook_verify_token, account.webhook_mode)
+
     @api.depends('session_name')
     def _compute_account_uid(self):
         """Generate account UID based on session name"""
@@ -156,6 +278,15 @@ class WahaAccount(models.Model):
             if len(account.notify_user_ids) < 1:
                 raise ValidationError(_("At least one user to notify is required"))
 
+    @api.constrains('send_rate', 'send_burst', 'daily_send_limit')
+    def _check_send_limits(self):
+        """Validate outbound throttling settings"""
+        for account in self:
+            if account.send_rate < 0 or account.daily_send_limit < 0:
+                raise ValidationError(_("Send rate and daily limit cannot be negative"))
+            if account.send_burst < 1:
+                raise ValidationError(_("Send burst must be at least 1"))
+
     def action_view_templates(self):
         """View templates for this account"""
         self.ensure_one()
@@ -369,6 +500,8 @@ class WahaAccount(models.Model):
         - Uses waha.chat.find_or_create() for chats
         - Creates messages with raw_chat_id and raw_sender_phone
         - Auto-compute handles all relationships automatically
+        - Messages of a chat are created at once; their media is queued for
+          the media cron, which downloads it in parallel
         """
         self.ensure_one()
         
@@ -450,24 +583,27 @@ class WahaAccount(models.Model):
                     # Sort messages by timestamp (oldest first) to maintain chronological order
                     messages = sorted(messages, key=lambda x: x.get('timestamp', 0))
                     
+                    # Skip messages already stored, one query per chat
+                    WahaMessage = self.env['waha.message']
+                    existing_uids = set(WahaMessage.search([
+                        ('msg_uid', 'in', [_get_msg_uid(msg) for msg in messages]),
+                        ('wa_account_id', '=', self.id),
+                    ]).mapped('msg_uid'))
+                    
+                    # Record the JIDs of the chat, resolving senders known by their LID
+                    identities = self.env['waha.identity'].sudo()._observe_payloads([
+                        (self, msg) for msg in messages if _get_msg_uid(msg) not in existing_uids
+                    ])
+                    
                     # Process each message
+                    vals_list = []
                     for msg in messages:
                         try:
                             # Extract message data
-                            msg_id = msg.get('id', {})
-                            if isinstance(msg_id, dict):
-                                msg_uid = msg_id.get('id', '') or msg_id.get('_serialized', '')
-                            else:
-                                msg_uid = str(msg_id)
-                            
-                            # Skip if message already exists
-                            existing = self.env['waha.message'].search([
-                                ('msg_uid', '=', msg_uid),
-                                ('wa_account_id', '=', self.id)
-                            ], limit=1)
-                            
-                            if existing:
+                            msg_uid = _get_msg_uid(msg)
+                            if msg_uid in existing_uids:
                                 continue
+                            existing_uids.add(msg_uid)
                             
                             # Extract sender info
                             from_obj = msg.get('from', '') or msg.get('author', '')
@@ -477,8 +613,10 @@ class WahaAccount(models.Model):
                                 sender_id = str(from_obj)
                             
                             # Normalize phone (remove @c.us, @g.us, etc)
-                            sender_phone = sender_id.replace('@c.us', '').replace('@lid', '').replace('@g.us', '')
-                            sender_phone = ''.join(filter(str.isdigit, sender_phone))
+                            sender_phone = identities.get((self.id, normalize_jid(sender_id)))
+                            if not sender_phone:
+                                sender_phone = sender_id.replace('@c.us', '').replace('@lid', '').replace('@g.us', '')
+                                sender_phone = ''.join(filter(str.isdigit, sender_phone))
                             
                             # Extract message content
                             body = msg.get('body', '') or msg.get('text', {}).get('body', '') or ''
@@ -502,7 +640,7 @@ class WahaAccount(models.Model):
                                 wa_timestamp = fields.Datetime.now()
                             
                             # Create message with raw fields (auto-compute handles rest)
-                            vals = {
+                            vals_list.append({
                                 'wa_account_id': self.id,
                                 'msg_uid': msg_uid,
                                 'message_type': message_type,
@@ -512,32 +650,40 @@ class WahaAccount(models.Model):
                                 'raw_chat_id': chat_id,
                                 'raw_sender_phone': sender_phone,
                                 'wa_timestamp': wa_timestamp,
-                                'raw_payload': msg,
-                            }
-                            
-                            # Create message - auto-compute will handle:
-                            # 1. waha_chat_id
-                            # 2. partner_id
-                            # 3. mail_message_id (Discuss message)
-                            waha_msg = self.env['waha.message'].create(vals)
-                            
-                            if waha_msg:
-                                messages_created += 1
-                                
-                                # Process media if present
-                                if content_type != 'text' and msg:
-                                    try:
-                                        waha_msg._process_media_from_payload(msg, content_type)
-                                    except Exception as e:
-                                        _logger.warning('Failed to process media for %s: %s', msg_uid, str(e))
-                            
+                                'raw_payload': WahaMessage._slim_payload(msg),
+                            })
                         except Exception as e:
-                            _logger.warning('Failed to create message %s: %s', msg.get('id'), str(e))
+                            _logger.warning('Failed to read message %s: %s', msg.get('id'), str(e))
                             continue
                     
-                    # Update chat metadata
-                    if waha_chat:
-                        waha_chat.update_last_message()
+                    # Create messages of the chat at once - auto-compute will handle:
+                    # 1. waha_chat_id
+                    # 2. partner_id
+                    # 3. mail_message_id (Discuss message)
+                    try:
+                        with self.env.cr.savepoint():
+                            waha_msgs = WahaMessage.create(vals_list)
+                    except Exception as e:
+                        _logger.warning('Failed to create messages of chat %s at once, '
+                                        'creating them one by one: %s', chat_id, str(e))
+                        waha_msgs = WahaMessage
+                        for vals in vals_list:
+                            try:
+                                with self.env.cr.savepoint():
+                                    waha_msgs |= WahaMessage.create(vals)
+                            except Exception as e:
+                                _logger.warning('Failed to create message %s: %s', vals['msg_uid'], str(e))
+                    messages_created += len(waha_msgs)
+                    
+                    # Queue media downloads of the chat, fetched in parallel by the media cron
+                    waha_msgs.filtered(lambda m: m.content_type != 'text').process_payload_media()
+                    
+                    # Update chat metadata, once for all the messages of the chat
+                    if waha_chat and waha_msgs:
+                        counters = {}
+                        for waha_msg in waha_msgs:
+                            waha_chat._add_to_counters(counters, waha_chat.id, waha_msg.wa_timestamp)
+                        waha_chat._apply_counters(counters)
                     
                 except Exception as e:
                     _logger.exception('Error processing chat %s: %s', chat_id, str(e))
@@ -634,8 +780,10 @@ class WahaAccount(models.Model):
                     _logger.error('Phone number normalization failed for: %s', number)
                     raise UserError(_('Invalid phone number format: %s') % number)
                 
-                # Format number to WhatsApp chat ID - try @c.us first
-                chat_id = f"{phone_clean}@c.us"
+                # Use the JID the contact was seen with, @c.us otherwise
+                chat_id = self.env['waha.identity'].sudo()._get_contact_jids(
+                    self, [phone_clean]
+                ).get(phone_clean) or f"{phone_clean}@c.us"
                 _logger.info('Constructed chat_id: %s', chat_id)
             
             # Validate message data
@@ -677,25 +825,29 @@ class WahaAccount(models.Model):
                 result = api.send_image(
                     chat_id,
                     kwargs.get('media_data'),
-                    kwargs.get('caption')
+                    kwargs.get('caption'),
+                    url=kwargs.get('media_url')
                 )
             elif message_type == 'document':
                 result = api.send_file(
                     chat_id,
                     kwargs.get('media_data'),
                     kwargs.get('filename'),
-                    kwargs.get('mimetype')
+                    kwargs.get('mimetype'),
+                    url=kwargs.get('media_url')
                 )
             elif message_type == 'video':
                 result = api.send_video(
                     chat_id,
                     kwargs.get('media_data'),
-                    kwargs.get('caption')
+                    kwargs.get('caption'),
+                    url=kwargs.get('media_url')
                 )
             elif message_type == 'audio':
                 result = api.send_audio(
                     chat_id,
-                    kwargs.get('media_data')
+                    kwargs.get('media_data'),
+                    url=kwargs.get('media_url')
                 )
             else:
                 raise UserError(_('Unsupported message type: %s') % message_type)
@@ -760,6 +912,85 @@ class WahaAccount(models.Model):
         _logger.info('Final normalized phone: %s', clean)
         return clean
 
+    # ============================================================
+    # SEND THROTTLING
+    # ============================================================
+
+    def _get_send_bucket(self):
+        """
+        Get the token bucket limiting outbound sends of this account
+
+        The bucket starts at the level stored by the last dispatcher
+        run, whatever the worker; store it back with _save_send_bucket.
+
+        Returns:
+            TokenBucket
+        """
+        self.ensure_one()
+        if not self.send_tokens_time:
+            return TokenBucket(self.send_rate, self.send_burst)
+        return TokenBucket(self.send_rate, self.send_burst, self.send_tokens, self.send_tokens_time)
+
+    def _save_send_bucket(self, bucket):
+        """
+        Store the level of the send bucket of this account
+
+        The row is updated without the ORM (no tracking, no cache reset
+        of the account). A concurrent update of the account only loses
+        this level: the sends recorded in the transaction must not fail
+        because of it.
+
+        Args:
+            bucket: TokenBucket from _get_send_bucket
+        """
+        self.ensure_one()
+        tokens, updated = bucket.get_state()
+        try:
+            with self.env.cr.savepoint(flush=False):
+                self.env.cr.execute("""
+                    UPDATE waha_account
+                       SET send_tokens = %s, send_tokens_time = %s
+                     WHERE id = %s
+                """, [tokens, updated, self.id])
+        except PG_CONCURRENCY_ERRORS as e:
+            _logger.info('Could not store the send tokens of account %s: %s', self.name, str(e))
+        self.invalidate_recordset(['send_tokens', 'send_tokens_time'])
+
+    def _get_daily_send_count(self):
+        """
+        Count messages sent by this account since midnight (UTC)
+
+        Returns:
+            int: Number of outbound messages sent today
+        """
+        self.ensure_one()
+        today = fields.Datetime.to_datetime(fields.Date.today())
+        return self.env['waha.message'].search_count([
+            ('wa_account_id', '=', self.id),
+            ('message_type', '=', 'outbound'),
+            ('sent_date', '>=', today),
+        ])
+
+    # ============================================================
+    # MEDIA POLICY
+    # ============================================================
+
+    def _get_media_policy(self, content_type):
+        """
+        Get when inbound media of a content type is downloaded
+
+        Args:
+            content_type: Content type of the message (image, audio, ...)
+
+        Returns:
+            str: 'eager' (at reception) or 'lazy' (when first opened)
+        """
+        self.ensure_one()
+        field_name = 'media_policy_%s' % content_type
+        if field_name not in self._fields:
+            field_name = 'media_policy_document'
+        return self[field_name] or 'eager'
+
     # ============================================================
     # CRON AND MAINTENANCE
     # ============================================================
@@ -0,0 +1,324 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+import time
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+from odoo.tools.safe_eval import safe_eval
+
+_logger = logging.getLogger(__name__)
+
+# Defaults, overridable with the waha.campaign_* system parameters
+DEFAULT_CAMPAIGN_BATCH_SIZE = 500
+
+
+class WahaCampaign(models.Model):
+    """
+    WAHA Campaign - Bulk send of a template to an audience
+
+    Responsibilities:
+    - Select the audience (domain on the template model)
+    - Render bodies and queue outbound messages in batches
+    - Resume where it stopped (cursor on the last record id queued)
+    - Pause/resume sending of queued messages
+    - Report progress from the message states
+
+    Delegates:
+    - Sending, rate limiting → waha.message outbox dispatcher
+    """
+    _name = 'waha.campaign'
+    _description = 'WhatsApp Campaign'
+    _inherit = ['mail.thread']
+    _order = 'id desc'
+
+    # ============================================================
+    # FIELDS
+    # ============================================================
+
+    name = fields.Char(string="Name", required=True, tracking=True)
+
+    wa_account_id = fields.Many2one(
+        'waha.account',
+        string="WhatsApp Account",
+        required=True,
+        ondelete='cascade',
+        tracking=True
+    )
+
+    template_id = fields.Many2one(
+        'waha.template',
+        string="Template",
+        required=True,
+        ondelete='restrict',
+        domain="[('wa_account_id', '=', wa_account_id), ('model_id', '!=', False)]",
+        tracking=True
+    )
+
+    model_name = fields.Char(related='template_id.model_name', string="Model")
+
+    domain = fields.Char(
+        string="Audience",
+        default='[]',
+        help="Records of the template model receiving the message"
+    )
+
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('running', 'Running'),
+        ('paused', 'Paused'),
+        ('done', 'Done'),
+        ('cancel', 'Cancelled'),
+    ], string="State", default='draft', required=True, tracking=True, index=True)
+
+    # Resume cursor: audience records are queued in id order
+    last_res_id = fields.Integer(
+        string="Last Queued Record",
+        readonly=True,
+        copy=False,
+        help="Id of the last audience record queued, the next batch starts after it"
+    )
+    enqueue_done = fields.Boolean(
+        string="All Messages Queued",
+        readonly=True,
+        copy=False
+    )
+
+    date_start = fields.Datetime(string="Started On", readonly=True, copy=False)
+    date_done = fields.Datetime(string="Finished On", readonly=True, copy=False)
+
+    message_ids = fields.One2many('waha.message', 'campaign_id', string="Messages")
+
+    # Progress
+    recipient_count = fields.Integer(string="Recipients", compute='_compute_recipient_count')
+    skipped_count = fields.Integer(
+        string="Skipped",
+        readonly=True,
+        copy=False,
+        help="Audience records without a valid phone number"
+    )
+    queued_count = fields.Integer(string="Queued", compute='_compute_statistics')
+    sent_count = fields.Integer(string="Sent", compute='_compute_statistics')
+    delivered_count = fields.Integer(string="Delivered", compute='_compute_statistics')
+    read_count = fields.Integer(string="Read", compute='_compute_statistics')
+    failed_count = fields.Integer(string="Failed", compute='_compute_statistics')
+
+    # ============================================================
+    # COMPUTE METHODS
+    # ============================================================
+
+    @api.depends('template_id', 'domain')
+    def _compute_recipient_count(self):
+        """Count audience records"""
+        for campaign in self:
+            if campaign.model_name:
+                campaign.recipient_count = self.env[campaign.model_name].search_count(
+                    campaign._get_audience_domain()
+                )
+            else:
+                campaign.recipient_count = 0
+
+    def _compute_statistics(self):
+        """Count campaign messages per state in one query"""
+        counts = {}
+        if self.ids:
+            groups = self.env['waha.message']._read_group(
+                [('campaign_id', 'in', self.ids)],
+                groupby=['campaign_id', 'state'],
+                aggregates=['__count'],
+            )
+            for campaign, state, count in groups:
+                counts[(campaign.id, state)] = count
+
+        for campaign in self:
+            get = lambda *states: sum(counts.get((campaign.id, state), 0) for state in states)
+            campaign.queued_count = get('outgoing')
+            campaign.sent_count = get('sent', 'delivered', 'read')
+            campaign.delivered_count = get('delivered', 'read')
+            campaign.read_count = get('read')
+            campaign.failed_count = get('error')
+
+    # ============================================================
+    # ACTIONS
+    # ============================================================
+
+    def action_start(self):
+        """Start queueing and sending the campaign"""
+        for campaign in self:
+            if not campaign.template_id.model_name:
+                raise UserError(_('The template of campaign %s does not apply to any model.', campaign.name))
+            if campaign.wa_account_id.status != 'connected':
+                raise UserError(_('WhatsApp account %s is not connected.', campaign.wa_account_id.name))
+        self.filtered(lambda c: not c.date_start).write({'date_start': fields.Datetime.now()})
+        self.write({'state': 'running'})
+        self._trigger_processing()
+
+    def action_pause(self):
+        """Stop queueing and sending, queued messages are kept"""
+        self.filtered(lambda c: c.state == 'running').write({'state': 'paused'})
+
+    def action_resume(self):
+        """Continue a paused campaign where it stopped"""
+        campaigns = self.filtered(lambda c: c.state == 'paused')
+        campaigns.write({'state': 'running'})
+        campaigns._trigger_processing()
+        self.env['waha.message']._trigger_outbox()
+
+    def action_cancel(self):
+        """Cancel the campaign and the messages not sent yet"""
+        self.env['waha.message'].search([
+            ('campaign_id', 'in', self.ids),
+            ('state', '=', 'outgoing'),
+            ('msg_uid', '=', False),
+        ]).write({'state': 'cancel'})
+        self.write({'state': 'cancel'})
+
+    def action_reset_to_draft(self):
+        """Back to draft, to queue the audience from the start again"""
+        self.write({
+            'state': 'draft',
+            'last_res_id': 0,
+            'enqueue_done': False,
+            'skipped_count': 0,
+            'date_start': False,
+            'date_done': False,
+        })
+
+    def action_view_messages(self):
+        """View messages of this campaign"""
+        self.ensure_one()
+        return {
+            'name': _('Messages'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'waha.message',
+            'view_mode': 'list,form',
+            'domain': [('campaign_id', '=', self.id)],
+        }
+
+    # ============================================================
+    # PROCESSING
+    # ============================================================
+
+    def _get_audience_domain(self):
+        """Audience domain, evaluated"""
+        self.ensure_one()
+        return safe_eval(self.domain or '[]', {'uid': self.env.uid})
+
+    @api.model
+    def _get_batch_size(self):
+        """Number of audience records queued per batch"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        return int(ICP.get_param('waha.campaign_batch_size', DEFAULT_CAMPAIGN_BATCH_SIZE))
+
+    @api.model
+    def _trigger_processing(self):
+        """Run the campaign cron as soon as the current transaction commits"""
+        cron = self.env.ref('waha.ir_cron_waha_process_campaigns', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+
+    @api.model
+    def _cron_process_campaigns(self, time_budget=50, auto_commit=True):
+        """
+        Queue the messages of running campaigns
+
+        Each batch renders the template for the next audience records,
+        creates their outbound messages in one create() and moves the
+        cursor, then commits: a restart resumes after the last batch.
+        Running campaigns whose messages are all queued and processed by
+        the outbox are marked done.
+
+        Args:
+            time_budget: Seconds after which the run stops and re-schedules
+            auto_commit: Commit after each batch (disabled in tests)
+        """
+        deadline = time.monotonic() + time_budget
+        batch_size = self._get_batch_size()
+
+        for campaign in self.search([('state', '=', 'running')]):
+            while not campaign.enqueue_done:
+                if time.monotonic() >= deadline:
+                    self._trigger_processing()
+                    return
+                campaign._enqueue_batch(batch_size)
+                if auto_commit:
+                    self.env.cr.commit()
+                # Paused or cancelled meanwhile
+                campaign.invalidate_recordset(['state'])
+                if campaign.state != 'running':
+                    break
+
+            if campaign.enqueue_done and campaign.state == 'running' and not campaign._has_pending_messages():
+                campaign.write({'state': 'done', 'date_done': fields.Datetime.now()})
+                if auto_commit:
+                    self.env.cr.commit()
+
+    def _enqueue_batch(self, batch_size):
+        """
+        Queue messages for the next audience records
+
+        Args:
+            batch_size: Maximum number of audience records
+
+        Returns:
+            waha.message recordset: Messages created
+        """
+        self.ensure_one()
+
+        template = self.template_id
+        records = self.env[template.model_name].search(
+            self._get_audience_domain() + [('id', '>', self.last_res_id)],
+            order='id',
+            limit=batch_size,
+        )
+        if not records:
+            self.enqueue_done = True
+            return self.env['waha.message']
+
+        WahaMessage = self.env['waha.message']
+        phone_field = template.phone_field or 'mobile'
+        bodies = template._render_bodies(records)
+        numbers = {
+            record.id: record[phone_field] if phone_field in record._fields else False
+            for record in records
+        }
+        contact_jids = WahaMessage._get_outbound_jids(self.wa_account_id, numbers.values())
+        vals_list = []
+        skipped = 0
+        for record in records:
+            vals = WahaMessage._prepare_outbound_vals(
+                self.wa_account_id,
+                numbers[record.id],
+                bodies[record.id],
+                contact_jids=contact_jids,
+                wa_template_id=template.id,
+                campaign_id=self.id,
+                priority='0',
+            )
+            if vals:
+                vals_list.append(vals)
+            else:
+                skipped += 1
+
+        # New contacts are enriched from WAHA afterwards, not one HTTP call each here
+        messages = WahaMessage.sudo().with_context(waha_defer_enrich=True).create(vals_list)
+
+        self.write({
+            'last_res_id': records[-1].id,
+            'skipped_count': self.skipped_count + skipped,
+            'enqueue_done': len(records) < batch_size,
+        })
+
+        _logger.info(
+            'Campaign %s: queued %d messages (%d skipped), cursor at %s',
+            self.name, len(messages), skipped, self.last_res_id
+        )
+        return messages
+
+    def _has_pending_messages(self):
+        """Whether the outbox still has messages of this campaign to send"""
+        self.ensure_one()
+        return bool(self.env['waha.message'].search_count([
+            ('campaign_id', '=', self.id),
+            ('state', '=', 'outgoing'),
+        ], limit=1))
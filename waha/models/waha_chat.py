@@ -1,11 +1,17 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
 import logging
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import SQL
+from odoo.addons.waha.tools.concurrency import claim, create_or_retry
 
 _logger = logging.getLogger(__name__)
 
+# Fields updated in SQL by _apply_counters
+COUNTER_FIELDS = ['message_count', 'unread_count', 'last_message_time']
+
 
 class WahaChat(models.Model):
     """
@@ -164,26 +170,19 @@ class WahaChat(models.Model):
         For individual chats, tries to find partner from wa_chat_id
         For groups, partner is always False
         """
+        # Extract phones from chat_ids
+        phones = {
+            chat: chat.wa_chat_id.split('@')[0]
+            for chat in self
+            if chat.wa_chat_id and chat.chat_type != 'group'
+        }
+        
+        # Search for partners (exact match on the indexed normalized numbers)
+        partners = self.env['res.partner'].sudo()._wa_find_by_numbers(phones.values())
+        
         for chat in self:
-            if chat.chat_type == 'group':
-                chat.partner_id = False
-                continue
-            
-            if not chat.wa_chat_id:
-                chat.partner_id = False
-                continue
-            
-            # Extract phone from chat_id
-            phone = chat.wa_chat_id.split('@')[0]
-            
-            # Search for partner
-            partner = self.env['res.partner'].sudo().search([
-                '|',
-                ('mobile', 'ilike', phone),
-                ('phone', 'ilike', phone)
-            ], limit=1)
-            
-            chat.partner_id = partner if partner else False
+            phone = phones.get(chat)
+            chat.partner_id = partners.get(phone, False) if phone else False
 
     # ============================================================
     # CRUD & LIFECYCLE
@@ -202,40 +201,73 @@ class WahaChat(models.Model):
         Returns:
             waha.chat record
         """
-        # Search for existing chat
-        chat = self.search([
-            ('wa_chat_id', '=', chat_id),
-            ('wa_account_id', '=', wa_account.id),
-        ], limit=1)
-        
-        if chat:
-            _logger.info('Found existing waha.chat %s for chat_id %s', chat.id, chat_id)
-            return chat
-        
-        # Create new chat
-        is_group = '@g.us' in chat_id
-        
-        if is_group:
-            # For groups, get info from WAHA
-            chat_name = self._get_group_name_from_waha(wa_account, chat_id)
-        else:
-            # For 1-1 chats, use partner name
-            chat_name = partner.name if partner else chat_id
-        
-        vals = {
-            'name': chat_name,
-            'wa_chat_id': chat_id,
-            'wa_account_id': wa_account.id,
-            'chat_type': 'group' if is_group else 'individual',
-        }
+        key = (chat_id, wa_account.id)
+        return self._find_or_create_many({key: partner})[key]
+    
+    @api.model
+    def _find_or_create_many(self, keys):
+        """
+        Find or create many chats at once
+        
+        Existing chats are found with one query, missing ones created with
+        one create(), claimed first so that concurrent workers do not
+        create the same chat twice.
+        
+        Args:
+            keys: dict (chat_id, waha.account id) -> res.partner record or
+                None, the partner naming a new 1-1 chat
+            
+        Returns:
+            dict: (chat_id, account id) -> waha.chat record
+        """
+        chats = {}
+        if not keys:
+            return chats
+        
+        # Search for existing chats
+        for chat in self.search([
+            ('wa_chat_id', 'in', list({chat_id for chat_id, _account_id in keys})),
+            ('wa_account_id', 'in', list({account_id for _chat_id, account_id in keys})),
+        ]):
+            key = (chat.wa_chat_id, chat.wa_account_id.id)
+            if key in keys and key not in chats:
+                chats[key] = chat
+        
+        # Create new chats
+        missing = [key for key in keys if key not in chats]
+        
+        # Claim the new chats: a concurrent worker creating one of them
+        # makes this transaction retry instead of failing on the constraint
+        claim(self.env.cr, [f'waha.chat:{account_id}:{chat_id}' for chat_id, account_id in missing], 'WhatsApp chats')
+        
+        vals_list = []
+        for chat_id, account_id in missing:
+            is_group = '@g.us' in chat_id
+            
+            if is_group:
+                # For groups, get info from WAHA
+                chat_name = self._get_group_name_from_waha(self.env['waha.account'].browse(account_id), chat_id)
+            else:
+                # For 1-1 chats, use partner name
+                partner = keys[(chat_id, account_id)]
+                chat_name = partner.name if partner else chat_id
+            
+            vals_list.append({
+                'name': chat_name,
+                'wa_chat_id': chat_id,
+                'wa_account_id': account_id,
+                'chat_type': 'group' if is_group else 'individual',
+            })
         
         # Note: partner_id and discuss_channel_id will be computed automatically
         
-        chat = self.create(vals)
-        _logger.info('Created new waha.chat %s for chat_id %s (type=%s, channel auto-created)', 
-                     chat.id, chat_id, vals['chat_type'])
+        if vals_list:
+            with create_or_retry(self.env.cr, 'WhatsApp chats'):
+                created = self.create(vals_list)
+            chats.update(zip(missing, created))
+            _logger.info('Created %d new waha.chat (channels auto-created)', len(created))
         
-        return chat
+        return chats
     
     def _get_group_name_from_waha(self, wa_account, chat_id):
         """Get group name from WAHA API"""
@@ -436,23 +468,64 @@ class WahaChat(models.Model):
     
     def update_last_message(self, message_time=None):
         """Update last message timestamp and increment counter"""
-        self.ensure_one()
-        
-        vals = {
-            'message_count': self.message_count + 1,
-        }
+        message_time = message_time or fields.Datetime.now()
+        self._apply_counters({chat.id: (1, 0, message_time) for chat in self})
+    
+    def increment_unread(self, count=1):
+        """Increment unread message counter"""
+        self._apply_counters({chat.id: (0, count, None) for chat in self})
+    
+    @api.model
+    def _add_to_counters(self, counters, chat_id, message_time=None, messages=1, unread=0):
+        """
+        Add a message to pending chat counters
         
-        if message_time:
-            vals['last_message_time'] = message_time
-        else:
-            vals['last_message_time'] = fields.Datetime.now()
+        Ingestion accumulates counters for a whole batch, then applies
+        them with _apply_counters(): one row update per chat.
         
-        self.write(vals)
+        Args:
+            counters: dict chat id -> (messages, unread, last message time), updated
+            chat_id: waha.chat id
+            message_time: Time of the message
+            messages: Number of messages to add
+            unread: Number of unread messages to add
+        """
+        total_messages, total_unread, last_time = counters.get(chat_id, (0, 0, None))
+        if message_time and (not last_time or message_time > last_time):
+            last_time = message_time
+        counters[chat_id] = (total_messages + messages, total_unread + unread, last_time)
     
-    def increment_unread(self):
-        """Increment unread message counter"""
-        self.ensure_one()
-        self.write({'unread_count': self.unread_count + 1})
+    @api.model
+    def _apply_counters(self, counters):
+        """
+        Add to message/unread counters and move last message times, in SQL
+        
+        Counters are incremented in the database (no read-modify-write),
+        so concurrent workers do not lose updates, and the last message
+        time only moves forward (GREATEST). All chats are updated by a
+        single query.
+        
+        Args:
+            counters: dict chat id -> (messages, unread, last message time or None)
+        """
+        if not counters:
+            return
+        chats = self.browse(list(counters))
+        chats.flush_recordset(COUNTER_FIELDS)
+        self.env.cr.execute(SQL("""
+            UPDATE waha_chat c
+               SET message_count = COALESCE(c.message_count, 0) + v.messages,
+                   unread_count = COALESCE(c.unread_count, 0) + v.unread,
+                   last_message_time = GREATEST(c.last_message_time, v.last_time),
+                   write_uid = v.uid,
+                   write_date = now() at time zone 'UTC'
+              FROM (VALUES %s) AS v(id, messages, unread, last_time, uid)
+             WHERE c.id = v.id
+        """, SQL(", ").join(
+            SQL("(%s, %s, %s, %s::timestamp, %s)", chat_id, messages, unread, last_time, self.env.uid)
+            for chat_id, (messages, unread, last_time) in counters.items()
+        )))
+        chats.invalidate_recordset(COUNTER_FIELDS + ['write_uid', 'write_date'])
     
     def mark_as_read(self):
         """Reset unread counter"""
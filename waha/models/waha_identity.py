@@ -0,0 +1,267 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+from collections import defaultdict
+
+from odoo import api, fields, models
+from odoo.tools import SQL
+from odoo.addons.waha.tools.concurrency import PG_CONCURRENCY_ERRORS
+from odoo.addons.waha.tools.waha_jid import (
+    CHAT_CONTACT_PATHS, SENDER_PATHS, get_path, jid_phone, normalize_jid,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+class WahaIdentity(models.Model):
+    """
+    WAHA Identity - WhatsApp JIDs observed for a contact
+
+    WhatsApp identifies the same person as 123@c.us (phone), 987@lid
+    (linked identity, hiding the phone) or a bare number, depending on
+    the engine, the chat and the privacy settings. Every JID seen is
+    recorded with the phone of the contact it belongs to, when known.
+
+    Responsibilities:
+    - Record JIDs from webhook payloads and WAHA contact lookups
+    - Resolve a LID to the phone of the contact
+    - Give the JID to use for a phone (sending, contact lookups)
+    """
+    _name = 'waha.identity'
+    _description = 'WhatsApp Identity'
+    _rec_name = 'jid'
+    _order = 'wa_account_id, phone_number, id'
+
+    wa_account_id = fields.Many2one(
+        'waha.account',
+        string="WhatsApp Account",
+        required=True,
+        ondelete='cascade'
+    )
+    jid = fields.Char(
+        string="JID",
+        required=True,
+        help="Observed WhatsApp identifier (e.g. 123456@c.us or 987654@lid)"
+    )
+    phone_number = fields.Char(
+        string="Phone Number",
+        index='btree_not_null',
+        help="Phone of the contact (E.164 without +), empty while a LID is not resolved"
+    )
+    chat_jid = fields.Char(
+        string="Chat JID",
+        help="JID of the 1-1 chat with the contact, the one messages are sent to"
+    )
+
+    _sql_constraints = [
+        ('unique_jid_per_account',
+         'unique(wa_account_id, jid)',
+         "A JID is recorded once per WhatsApp account.")
+    ]
+
+    # ============================================================
+    # OBSERVATION
+    # ============================================================
+
+    @api.model
+    def _extract_payload_identities(self, payload):
+        """
+        Get the JIDs of the contact of a message payload
+
+        Args:
+            payload: WAHA message payload
+
+        Returns:
+            tuple: (JIDs of the contact, chat JID or False)
+        """
+        from_me = payload.get('fromMe', False)
+        chat_jid = payload.get('to') if from_me else payload.get('from')
+        if isinstance(chat_jid, dict):
+            chat_jid = chat_jid.get('_serialized')
+        is_group = '@g.us' in str(chat_jid or '')
+
+        paths = []
+        if not is_group:
+            paths += CHAT_CONTACT_PATHS
+        if not from_me:
+            # The sender of a message we sent is ourselves
+            paths += SENDER_PATHS
+
+        jids = [normalize_jid(chat_jid)] if not is_group else []
+        jids += [normalize_jid(get_path(payload, path)) for path in paths]
+        jids = list(dict.fromkeys(jid for jid in jids if jid))
+        return jids, (chat_jid if not is_group and normalize_jid(chat_jid) else False)
+
+    @api.model
+    def _observe_payloads(self, items):
+        """
+        Record the JIDs of message payloads
+
+        Args:
+            items: Iterable of (waha.account record, WAHA message payload)
+
+        Returns:
+            dict: (account id, JID) -> phone, for the JIDs whose phone is known
+        """
+        entries = defaultdict(list)  # account id -> [(jids, phone, chat jid)]
+        for account, payload in items:
+            jids, chat_jid = self._extract_payload_identities(payload or {})
+            if jids:
+                phone = next((jid_phone(jid) for jid in jids if jid_phone(jid)), False)
+                entries[account.id].append((jids, phone, chat_jid))
+        return self._observe(entries)
+
+    @api.model
+    def _observe(self, entries):
+        """
+        Record JIDs of contacts, one search and one insert for all
+
+        JIDs observed together belong to the same contact: a LID seen
+        with a phone JID is resolved to that phone.
+
+        Args:
+            entries: dict account id -> list of (JIDs, phone or False,
+                chat JID or False)
+
+        Returns:
+            dict: (account id, JID) -> phone, for the JIDs whose phone is known
+        """
+        if not entries:
+            return {}
+        all_jids = {jid for account_entries in entries.values() for jids, _p, _c in account_entries for jid in jids}
+        existing = {
+            (identity.wa_account_id.id, identity.jid): identity
+            for identity in self.search([
+                ('jid', 'in', list(all_jids)),
+                ('wa_account_id', 'in', list(entries)),
+            ])
+        }
+
+        phones = {}
+        new = {}  # (account id, jid) -> vals
+        for account_id, account_entries in entries.items():
+            for jids, phone, chat_jid in account_entries:
+                # Phone known from an earlier observation of one of the JIDs
+                phone = phone or next((
+                    existing[(account_id, jid)].phone_number
+                    for jid in jids
+                    if (account_id, jid) in existing and existing[(account_id, jid)].phone_number
+                ), False) or next((
+                    phones[(account_id, jid)] for jid in jids if (account_id, jid) in phones
+                ), False)
+                for jid in jids:
+                    key = (account_id, jid)
+                    identity = existing.get(key)
+                    if identity:
+                        vals = {}
+                        if phone and identity.phone_number != phone:
+                            vals['phone_number'] = phone
+                        if chat_jid and identity.chat_jid != chat_jid:
+                            vals['chat_jid'] = chat_jid
+                        if vals:
+                            identity.write(vals)
+                    else:
+                        vals = new.setdefault(key, {'wa_account_id': account_id, 'jid': jid})
+                        if phone:
+                            vals['phone_number'] = phone
+                        if chat_jid:
+                            vals['chat_jid'] = chat_jid
+                    if phone:
+                        phones[key] = phone
+
+        if new:
+            self._insert_identities(list(new.values()))
+        return phones
+
+    @api.model
+    def _insert_identities(self, vals_list):
+        """
+        Insert identities, skipping JIDs recorded by a concurrent worker
+
+        INSERT ... ON CONFLICT DO NOTHING, so two workers observing the
+        same new JID do not abort each other. A JID committed after our
+        snapshot still fails the insert (REPEATABLE READ): the batch is
+        dropped, identities are observed again with the next messages.
+
+        Args:
+            vals_list: List of dicts with wa_account_id, jid and optionally
+                phone_number and chat_jid
+        """
+        uid = self.env.uid
+        self.flush_model(['wa_account_id', 'jid', 'phone_number', 'chat_jid'])
+        try:
+            with self.env.cr.savepoint(flush=False):
+                self.env.cr.execute(SQL("""
+                    INSERT INTO waha_identity (wa_account_id, jid, phone_number, chat_jid,
+                                               create_uid, create_date, write_uid, write_date)
+                    VALUES %s
+                    ON CONFLICT (wa_account_id, jid) DO NOTHING
+                """, SQL(", ").join(
+                    SQL("(%s, %s, %s, %s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')",
+                        vals['wa_account_id'], vals['jid'], vals.get('phone_number'), vals.get('chat_jid'), uid, uid)
+                    for vals in vals_list
+                )))
+        except PG_CONCURRENCY_ERRORS as e:
+            _logger.info('Skipped recording %d WhatsApp identities: %s', len(vals_list), str(e))
+        self.invalidate_model(['wa_account_id', 'jid', 'phone_number', 'chat_jid'])
+
+    # ============================================================
+    # RESOLUTION
+    # ============================================================
+
+    @api.model
+    def _get_contact_jids(self, account, phones):
+        """
+        Get the JID to reach each phone number
+
+        The JID of the 1-1 chat is preferred, then the phone JID, then
+        a LID.
+
+        Args:
+            account: waha.account record
+            phones: Iterable of phone numbers (E.164 without +)
+
+        Returns:
+            dict: phone -> JID, for the phones observed before
+        """
+        phones = [phone for phone in set(phones) if phone]
+        if not phones:
+            return {}
+        ranked = defaultdict(list)
+        for identity in self.search([
+            ('phone_number', 'in', phones),
+            ('wa_account_id', '=', account.id),
+        ]):
+            rank = 0 if identity.chat_jid else 1 if identity.jid.endswith('@c.us') else 2
+            ranked[identity.phone_number].append((rank, identity.id, identity.chat_jid or identity.jid))
+        return {phone: min(candidates)[2] for phone, candidates in ranked.items()}
+
+    @api.model
+    def _get_contact(self, api, account, phone):
+        """
+        Get the WAHA contact of a phone number
+
+        The JID recorded for the phone is asked directly; only phones
+        never observed are probed in all JID formats. The JID answering
+        is recorded.
+
+        Args:
+            api: WahaApi of the account
+            account: waha.account record
+            phone: Phone number (E.164 without +)
+
+        Returns:
+            dict: Contact information, or None if not found
+        """
+        contact_jid = self._get_contact_jids(account, [phone]).get(phone)
+        contact_info = api.get_contact(phone, contact_id=contact_jid)
+        if contact_info and not contact_jid:
+            jid = normalize_jid(contact_info.get('id'))
+            # The phone probed as a LID says nothing about the contact
+            if jid and jid != f'{phone}@lid':
+                try:
+                    with self.env.cr.savepoint():
+                        self._observe({account.id: [([jid], phone, False)]})
+                except Exception as e:
+                    _logger.warning('Could not record JID %s of %s: %s', jid, phone, str(e))
+        return contact_info
@@ -0,0 +1,171 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+import time
+from datetime import timedelta
+
+from odoo import api, fields, models, _
+from odoo.exceptions import ValidationError
+
+_logger = logging.getLogger(__name__)
+
+# Defaults, overridable with the waha.media_retention_* system parameters
+DEFAULT_RETENTION_BATCH_SIZE = 200
+
+
+class WahaMediaRetention(models.Model):
+    """
+    WAHA Media Retention - Ageing rule for the stored media of an account
+
+    Responsibilities:
+    - Select the media of a content type older than a number of days
+    - Reduce their quality (images) or remove their file
+    - Work in batches, one transaction each
+
+    Delegates:
+    - Removing/reducing a file and keeping the history stub → waha.message
+    """
+    _name = 'waha.media.retention'
+    _description = 'WhatsApp Media Retention Rule'
+    _order = 'wa_account_id, sequence, id'
+
+    sequence = fields.Integer(default=10)
+    active = fields.Boolean(default=True)
+
+    wa_account_id = fields.Many2one(
+        'waha.account',
+        string="WhatsApp Account",
+        required=True,
+        ondelete='cascade'
+    )
+    content_type = fields.Selection([
+        ('image', 'Images'),
+        ('sticker', 'Stickers'),
+        ('audio', 'Audio'),
+        ('video', 'Videos'),
+        ('document', 'Documents'),
+    ], string="Media", required=True, default='video')
+    age_days = fields.Integer(
+        string="Older Than (Days)",
+        required=True,
+        default=90
+    )
+    action = fields.Selection([
+        ('reduce', 'Reduce Quality'),
+        ('remove', 'Remove File'),
+    ], string="Action", required=True, default='remove',
+        help="Reduce Quality: downscale and recompress images (JPEG/WebP).\n"
+             "Remove File: delete the file, the message stays in the history."
+    )
+    max_size = fields.Integer(
+        string="Max Size (px)",
+        default=1600,
+        help="Reduce Quality: maximum width/height of the image"
+    )
+    quality = fields.Integer(
+        string="Quality",
+        default=60,
+        help="Reduce Quality: compression quality, 1-95"
+    )
+    keep_preview = fields.Boolean(
+        string="Keep Preview",
+        default=True,
+        help="Remove File: keep the small preview of images and videos"
+    )
+
+    # ============================================================
+    # CONSTRAINTS
+    # ============================================================
+
+    @api.constrains('content_type', 'action', 'age_days', 'max_size', 'quality')
+    def _check_rule(self):
+        """Validate retention settings"""
+        for rule in self:
+            if rule.age_days < 1:
+                raise ValidationError(_("Retention age must be at least one day"))
+            if rule.action == 'reduce':
+                if rule.content_type != 'image':
+                    raise ValidationError(_("Only images can be reduced"))
+                if rule.max_size < 1 or not 1 <= rule.quality <= 95:
+                    raise ValidationError(_("Reduced images need a size and a quality between 1 and 95"))
+
+    # ============================================================
+    # PROCESSING
+    # ============================================================
+
+    @api.model
+    def _get_batch_size(self):
+        """Number of messages processed per transaction"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        return int(ICP.get_param('waha.media_retention_batch_size', DEFAULT_RETENTION_BATCH_SIZE))
+
+    @api.model
+    def _trigger_retention(self):
+        """Run the retention cron as soon as the current transaction commits"""
+        cron = self.env.ref('waha.ir_cron_waha_media_retention', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+
+    @api.model
+    def _cron_apply_retention(self, time_budget=50, auto_commit=True):
+        """
+        Apply the media retention rules
+
+        Each batch of expired media is processed and committed on its
+        own, so a long backlog is spread over several runs.
+
+        Args:
+            time_budget: Seconds after which the run stops and re-schedules
+            auto_commit: Commit after each batch (disabled in tests)
+        """
+        deadline = time.monotonic() + time_budget
+        batch_size = self._get_batch_size()
+
+        for rule in self.search([]):
+            # Messages failing in this run are retried by the next one
+            processed_ids = []
+            while True:
+                if time.monotonic() >= deadline:
+                    self._trigger_retention()
+                    return
+                messages = rule._get_expired_messages(batch_size, processed_ids)
+                if not messages:
+                    break
+                processed_ids += messages.ids
+                rule._apply(messages)
+                if auto_commit:
+                    self.env.cr.commit()
+
+    def _get_expired_messages(self, limit, exclude_ids=None):
+        """
+        Get messages whose media this rule applies to
+
+        Returns:
+            waha.message recordset
+        """
+        self.ensure_one()
+        tiers = ['original'] if self.action == 'reduce' else ['original', 'reduced']
+        return self.env['waha.message'].search([
+            ('wa_account_id', '=', self.wa_account_id.id),
+            ('content_type', '=', self.content_type),
+            ('media_state', '=', 'done'),
+            ('media_attachment_id', '!=', False),
+            ('media_tier', 'in', tiers),
+            ('create_date', '<', fields.Datetime.now() - timedelta(days=self.age_days)),
+            ('id', 'not in', exclude_ids or []),
+        ], order='id', limit=limit)
+
+    def _apply(self, messages):
+        """Reduce or remove the media of messages, one savepoint each"""
+        self.ensure_one()
+        for message in messages:
+            try:
+                with self.env.cr.savepoint():
+                    if self.action == 'reduce':
+                        message._reduce_media(self.max_size, self.quality)
+                    else:
+                        message._remove_media(keep_preview=self.keep_preview)
+            except Exception as e:
+                _logger.warning('Retention of media of message %s failed: %s', message.id, str(e))
+        _logger.info('Media retention (%s %s older than %d days, account %s): %d messages',
+                     self.action, self.content_type, self.age_days, self.wa_account_id.name, len(messages))
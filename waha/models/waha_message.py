@@ -1,18 +1,73 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
-import base64
-import io
 import logging
 import re
-import subprocess
-import tempfile
-from datetime import datetime
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta
+
+from markupsafe import Markup
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import html2plaintext, str2bool
+from odoo.addons.waha.tools.waha_api import MediaTooLarge
+from odoo.addons.waha.tools.audio_transcoder import DEFAULT_MAX_PROCESSES, DEFAULT_TIMEOUT, get_transcoder
+from odoo.addons.waha.tools.waha_media import (
+    DEFAULT_MAX_SIZES_MB, DEFAULT_PREVIEW_SIZE, fetch_media, needs_transcoding, reduce_image,
+    remove_file, transcode_media,
+)
+from odoo.addons.waha.tools.waha_payload import DEFAULT_SLIM_MIN_SIZE, strip_media_content, stripped_to_none
 
 _logger = logging.getLogger(__name__)
 
+# Default number of outbox threads, overridable with waha.send_workers
+DEFAULT_SEND_WORKERS = 4
+
+# Default number of media threads, overridable with waha.media_workers
+DEFAULT_MEDIA_WORKERS = 2
+
+# Discuss body shown until the media of a message is attached
+MEDIA_PLACEHOLDER = '<span class="o_waha_media_pending text-muted fst-italic">%s</span>'
+
+# Discuss link to media downloaded when first opened (see controller/media.py)
+MEDIA_LAZY_PLACEHOLDER = ('<span class="o_waha_media_pending">'
+                          '<a href="/waha/media/%s" target="_blank">%s</a></span>')
+# Discuss link to the full media when a preview is shown
+MEDIA_FULL_LINK = '<a class="o_waha_media_full" href="/waha/media/%s" target="_blank">%s</a>'
+MEDIA_FULL_LINK_RE = re.compile(r'<a[^>]*o_waha_media_full[^>]*>.*?</a>', re.DOTALL)
+
+# Discuss note left when the media file is removed (see waha.media.retention)
+MEDIA_REMOVED_NOTE = '<span class="o_waha_media_removed text-muted fst-italic">%s</span>'
+MEDIA_PLACEHOLDER_RE = re.compile(r'<span[^>]*o_waha_media_pending[^>]*>.*?</span>', re.DOTALL)
+
+
+def _send_requests(api, requests):
+    """
+    Perform prepared WAHA send calls one after the other
+
+    Runs in an outbox worker thread: no ORM access, only HTTP calls
+    through the shared WahaApi. Stops at the first failure: the next
+    messages of the chat are not sent before it, they stay queued.
+
+    Args:
+        api: WahaApi of the account
+        requests: list of (message_id, account_id, method, args) of one chat
+
+    Returns:
+        list: (message_id, result, error) tuples of the attempted sends,
+        in the same order
+    """
+    results = []
+    for message_id, _account_id, method, args in requests:
+        try:
+            results.append((message_id, getattr(api, method)(*args), None))
+        except Exception as e:
+            results.append((message_id, None, e))
+            break
+    return results
+
 
 class WahaMessage(models.Model):
     """
@@ -35,6 +90,9 @@ class WahaMessage(models.Model):
     _order = 'wa_timestamp desc, id desc'
     _rec_name = 'msg_uid'
 
+    # Retries of a failing media download before giving up
+    _media_max_attempts = 3
+
     # ============================================================
     # FIELDS
     # ============================================================
@@ -42,11 +100,8 @@ class WahaMessage(models.Model):
     # Core identification
     msg_uid = fields.Char(
         string="WhatsApp Message ID",
-        compute='_compute_msg_uid',
-        store=True,
-        readonly=False,
         index=True,
-        help="Unique message identifier from WAHA (auto-sent if missing)"
+        help="Unique message identifier from WAHA (set once the outbox has sent the message)"
     )
     
     wa_account_id = fields.Many2one(
@@ -95,9 +150,33 @@ class WahaMessage(models.Model):
     
     failure_reason = fields.Text(string="Failure Reason")
     
+    # Outbox priority: interactive replies are sent before bulk sends
+    priority = fields.Selection([
+        ('0', 'Bulk'),
+        ('1', 'Interactive'),
+    ], string="Send Priority", default='1', required=True,
+        help='Interactive messages (typed in Discuss) are dispatched before '
+             'bulk/template messages queued on the same account.')
+    
     # Content
     body = fields.Text(string="Message Content", required=True)
     
+    # Bulk sending
+    wa_template_id = fields.Many2one(
+        'waha.template',
+        string="Template",
+        ondelete='set null',
+        index='btree_not_null',
+        help="Template the message was rendered from"
+    )
+    
+    campaign_id = fields.Many2one(
+        'waha.campaign',
+        string="Campaign",
+        ondelete='set null',
+        index='btree_not_null'
+    )
+    
     # Raw WAHA identifiers (used to compute relationships)
     raw_chat_id = fields.Char(
         string="Raw Chat ID",
@@ -163,13 +242,58 @@ class WahaMessage(models.Model):
         string="Attachments"
     )
     
+    # Media download (background, see _cron_process_media)
+    media_state = fields.Selection([
+        ('none', 'No Media'),
+        ('lazy', 'When Opened'),
+        ('pending', 'Pending'),
+        ('done', 'Attached'),
+        ('error', 'Failed'),
+    ], string="Media", default='none', required=True, index=True, copy=False)
+    media_attempts = fields.Integer(string="Media Attempts", copy=False)
+    media_error = fields.Text(string="Media Error", copy=False)
+    media_key = fields.Char(
+        string="Media Key",
+        index='btree_not_null',
+        copy=False,
+        help="Stable WhatsApp identifier of the media file (file hash). "
+             "Media received again (forwards, stickers) reuses the stored file."
+    )
+    media_attachment_id = fields.Many2one(
+        'ir.attachment',
+        string="Media File",
+        ondelete='set null',
+        copy=False,
+        help="Stored media file, shared with the Discuss message"
+    )
+    media_preview_id = fields.Many2one(
+        'ir.attachment',
+        string="Media Preview",
+        ondelete='set null',
+        copy=False,
+        help="Small WebP image shown in Discuss instead of the full image or video"
+    )
+    media_tier = fields.Selection([
+        ('original', 'Original'),
+        ('reduced', 'Reduced'),
+        ('removed', 'Removed'),
+    ], string="Media Storage", default='original', required=True, copy=False,
+        help="Reduced or removed by the media retention rules of the account")
+    media_source_checksum = fields.Char(
+        string="Source Checksum",
+        index='btree_not_null',
+        copy=False,
+        help="Checksum of the media as received, when it was converted before "
+             "being stored. The same file received again reuses the conversion."
+    )
+    
     # Timestamps
     wa_timestamp = fields.Datetime(
         string="WhatsApp Timestamp",
         help="Original timestamp from WhatsApp"
     )
     
-    sent_date = fields.Datetime(string="Sent Date")
+    sent_date = fields.Datetime(string="Sent Date", index=True)
     delivered_date = fields.Datetime(string="Delivered Date")
     read_date = fields.Datetime(string="Read Date")
     
@@ -181,7 +305,16 @@ class WahaMessage(models.Model):
     
     raw_payload = fields.Json(
         string="Raw WAHA Payload",
-        help="Complete JSON payload from WAHA webhook"
+        compute='_compute_raw_payload',
+        inverse='_inverse_raw_payload',
+        help="JSON payload from WAHA webhook, stored compressed in waha.message.payload. "
+             "Media content (base64) is replaced by its size and hash once not needed "
+             "(see waha.payload_slimming)."
+    )
+    payload_ids = fields.One2many(
+        'waha.message.payload',
+        'message_id',
+        string="Stored Payload"
     )
     
     active = fields.Boolean(default=True)
@@ -192,10 +325,42 @@ class WahaMessage(models.Model):
          "Each WhatsApp message ID must be unique per account.")
     ]
 
+    # ============================================================
+    # CRUD
+    # ============================================================
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Wake up the outbox dispatcher for new outgoing messages"""
+        messages = super().create(vals_list)
+        if any(message._is_queued_for_send() for message in messages):
+            self._trigger_outbox()
+        return messages
+    
+    def write(self, vals):
+        """Wake up the outbox dispatcher when messages are (re)queued"""
+        res = super().write(vals)
+        if vals.get('state') == 'outgoing':
+            self._trigger_outbox()
+        return res
+
     # ============================================================
     # COMPUTED FIELDS - AUTO RELATIONSHIPS
     # ============================================================
     
+    def _compute_raw_payload(self):
+        """Decompress payloads from the side table, for all records at once"""
+        message_ids = [message.id for message in self if isinstance(message.id, int)]
+        payloads = self.env['waha.message.payload'].sudo()._get_payloads(message_ids) if message_ids else {}
+        for message in self:
+            message.raw_payload = payloads.get(message.id, False)
+    
+    def _inverse_raw_payload(self):
+        """Compress payloads into the side table"""
+        self.env['waha.message.payload'].sudo()._store_payloads({
+            message.id: message.raw_payload for message in self
+        })
+    
     @api.depends('raw_payload')
     def _compute_content_type(self):
         """
@@ -217,43 +382,24 @@ class WahaMessage(models.Model):
         Auto-compute chat relationship from raw_chat_id
         
         This ensures that waha_chat_id is always correctly set,
-        regardless of how the message was created.
+        regardless of how the message was created. Chats of all the
+        messages are resolved (or created) at once.
         """
+        keys = {}  # (chat_id, account id) -> partner of a new 1-1 chat
+        for message in self:
+            if message.raw_chat_id and message.wa_account_id:
+                key = (message.raw_chat_id, message.wa_account_id.id)
+                if not keys.get(key) and '@g.us' not in message.raw_chat_id:
+                    keys[key] = message.partner_id
+                else:
+                    keys.setdefault(key, None)
+        
+        chats = self.env['waha.chat']._find_or_create_many(keys)
         for message in self:
             if not message.raw_chat_id or not message.wa_account_id:
                 message.waha_chat_id = False
-                continue
-            
-            # Search for existing chat
-            chat = self.env['waha.chat'].search([
-                ('wa_chat_id', '=', message.raw_chat_id),
-                ('wa_account_id', '=', message.wa_account_id.id)
-            ], limit=1)
-            
-            if chat:
-                message.waha_chat_id = chat
             else:
-                # Auto-create chat if missing
-                _logger.info('Auto-creating chat for raw_chat_id: %s', message.raw_chat_id)
-                
-                # Determine partner for 1-1 chats
-                partner = None
-                if message.partner_id:
-                    partner = message.partner_id
-                elif message.raw_sender_phone and '@g.us' not in message.raw_chat_id:
-                    # Try to find partner for 1-1 chat
-                    partner = self.env['waha.partner'].find_or_create_by_phone(
-                        phone=message.raw_sender_phone,
-                        wa_account=message.wa_account_id,
-                        auto_enrich=False
-                    )
-                
-                chat = self.env['waha.chat'].find_or_create(
-                    wa_account=message.wa_account_id,
-                    chat_id=message.raw_chat_id,
-                    partner=partner
-                )
-                message.waha_chat_id = chat
+                message.waha_chat_id = chats[(message.raw_chat_id, message.wa_account_id.id)]
     
     @api.depends('raw_sender_phone', 'wa_account_id', 'message_type')
     def _compute_partner_id(self):
@@ -262,37 +408,26 @@ class WahaMessage(models.Model):
         
         For inbound messages: partner is the sender
         For outbound messages: partner is the recipient
+        
+        Partners of all the messages are resolved (or created) at once.
         """
+        def has_partner(message):
+            # Groups don't have partners
+            return (message.raw_sender_phone and message.wa_account_id
+                    and '@g.us' not in str(message.raw_sender_phone))
+        
+        # New contacts of bulk sends (waha_defer_enrich) are enriched later by a cron
+        partners = self.env['waha.partner']._find_or_create_by_phones(
+            [(message.raw_sender_phone, message.wa_account_id) for message in self if has_partner(message)],
+            auto_enrich=True
+        )
         for message in self:
-            if not message.raw_sender_phone or not message.wa_account_id:
-                message.partner_id = False
-                continue
-            
-            # Skip if this is a group ID (groups don't have partners)
-            if '@g.us' in str(message.raw_sender_phone):
-                message.partner_id = False
-                continue
-            
-            # Search for existing waha.partner
-            waha_partner = self.env['waha.partner'].search([
-                ('phone_number', '=', message.raw_sender_phone),
-                ('wa_account_id', '=', message.wa_account_id.id)
-            ], limit=1)
-            
-            if waha_partner:
-                message.partner_id = waha_partner.partner_id
+            if has_partner(message):
+                message.partner_id = partners[(message.raw_sender_phone, message.wa_account_id.id)]
             else:
-                # Auto-create partner if missing
-                _logger.info('Auto-creating partner for phone: %s', message.raw_sender_phone)
-                
-                partner = self.env['waha.partner'].find_or_create_by_phone(
-                    phone=message.raw_sender_phone,
-                    wa_account=message.wa_account_id,
-                    auto_enrich=True
-                )
-                message.partner_id = partner
+                message.partner_id = False
     
-    @api.depends('waha_chat_id', 'partner_id', 'body', 'wa_timestamp')
+    @api.depends('waha_chat_id', 'partner_id', 'body', 'wa_timestamp', 'campaign_id')
     def _compute_mail_message_id(self):
         """
         Auto-compute discuss message relationship
@@ -301,12 +436,18 @@ class WahaMessage(models.Model):
         - waha_chat_id exists (with discuss_channel_id)
         - partner_id exists (message author)
         - No mail_message_id exists yet
+        - The message is not part of a campaign (tracked on its own)
         """
         for message in self:
             # Skip if already has mail_message_id
             if message.mail_message_id:
                 continue
             
+            # Bulk sends (campaigns) are tracked on their own, not in Discuss
+            if message.campaign_id:
+                message.mail_message_id = False
+                continue
+            
             # Need chat and partner to create discuss message
             if not message.waha_chat_id or not message.partner_id:
                 message.mail_message_id = False
@@ -359,110 +500,6 @@ class WahaMessage(models.Model):
                 )
                 message.mail_message_id = False
     
-    @api.depends('waha_chat_id', 'partner_id', 'state', 'body', 'wa_account_id')
-    def _compute_msg_uid(self):
-        """
-        Auto-compute msg_uid by sending message through WAHA
-        
-        For outbound messages without msg_uid:
-        - Validates required fields
-        - Sends message through WAHA API
-        - Sets msg_uid from WAHA response
-        - Updates state to 'sent'
-        
-        For inbound messages or messages with msg_uid: keeps existing value
-        """
-        for message in self:
-            # Skip if already has msg_uid or is inbound
-            if message.msg_uid or message.message_type == 'inbound':
-                continue
-            
-            # Skip if not outgoing state
-            if message.state != 'outgoing':
-                continue
-            
-            # Need chat and account to send
-            if not message.waha_chat_id or not message.wa_account_id:
-                continue
-            
-            # Check account is connected
-            if message.wa_account_id.status != 'connected':
-                _logger.warning(
-                    'Cannot auto-send message %s: account not connected',
-                    message.id
-                )
-                continue
-            
-            # Auto-send through WAHA
-            _logger.info(
-                'Auto-sending message %s through WAHA (compute msg_uid)',
-                message.id
-            )
-            
-            try:
-                from odoo.addons.waha.tools.waha_api import WahaApi
-                api = WahaApi(message.wa_account_id)
-                
-                # Prepare message data
-                chat_wa_id = message.waha_chat_id.wa_chat_id
-                body_clean = re.sub(r'<[^>]+>', '', message.body or '').strip()
-                
-                if not body_clean and not message.attachment_ids:
-                    _logger.warning('Message %s has no body or attachments', message.id)
-                    continue
-                
-                # Send based on content type
-                result = None
-                
-                if message.content_type == 'text' or not message.attachment_ids:
-                    result = api.send_text(
-                        chat_wa_id,
-                        body_clean or '(empty)',
-                        message.reply_to_msg_uid
-                    )
-                else:
-                    # Handle media sending
-                    attachment = message.attachment_ids[0]
-                    result = api.send_file(
-                        chat_wa_id,
-                        attachment.datas,
-                        attachment.name,
-                        attachment.mimetype,
-                        body_clean
-                    )
-                
-                # Update with result
-                if result and result.get('id'):
-                    message.msg_uid = result.get('id')
-                    message.state = 'sent'
-                    message.sent_date = fields.Datetime.now()
-                    
-                    _logger.info(
-                        'Auto-sent message %s, got msg_uid: %s',
-                        message.id, message.msg_uid
-                    )
-                    
-                    # Update chat metadata
-                    if message.waha_chat_id:
-                        message.waha_chat_id.update_last_message()
-                
-            except Exception as e:
-                error_msg = str(e)
-                _logger.error('Failed to auto-send message %s: %s', message.id, error_msg)
-                
-                # Classify error
-                if 'No LID for user' in error_msg or 'not found' in error_msg.lower():
-                    failure_type = 'contact_not_found'
-                elif 'Invalid session' in error_msg or 'not connected' in error_msg.lower():
-                    failure_type = 'account'
-                else:
-                    failure_type = 'unknown'
-                
-                # Update state to error (but don't set msg_uid)
-                message.state = 'error'
-                message.failure_type = failure_type
-                message.failure_reason = error_msg
-
     # ============================================================
     # HELPER METHODS
     # ============================================================
@@ -494,196 +531,620 @@ class WahaMessage(models.Model):
     
     def process_payload_media(self):
         """
-        Public method to process media from raw_payload
+        Queue the media of raw_payload for background download
+        
+        The message and its discuss message exist right away; the media
+        cron downloads, converts and attaches the file afterwards so the
+        webhook never waits on WAHA or ffmpeg. Content types the account
+        fetches lazily are only downloaded when first opened.
         
-        Should be called after message creation when raw_payload contains media.
-        Automatically detects content type and creates attachments.
+        Works on a batch of messages (history sync queues a chat at once),
+        the media cron is woken up once.
         
         Returns:
-            list: IDs of created attachments
+            bool: True if media was queued or deferred
         """
-        self.ensure_one()
+        to_queue = to_defer = self.browse()
+        for message in self:
+            if not message.raw_payload:
+                _logger.warning('No raw_payload to process media from')
+                continue
+            
+            # Auto-detect content type from payload
+            detected_type = message._detect_content_type(message.raw_payload)
+            
+            # Skip if no media
+            if detected_type in ('text', 'location'):
+                continue
+            
+            if message.wa_account_id._get_media_policy(detected_type) == 'lazy':
+                to_defer |= message
+            else:
+                to_queue |= message
         
-        if not self.raw_payload:
-            _logger.warning('No raw_payload to process media from')
-            return []
+        to_defer._defer_media()
+        if to_queue:
+            to_queue._queue_media()
+        return bool(to_queue or to_defer)
+    
+    def _queue_media(self):
+        """Flag media as pending and wake up the media cron"""
+        self.write({
+            'media_state': 'pending',
+            'media_attempts': 0,
+            'media_error': False,
+        })
+        for message in self:
+            if not message.media_key:
+                message.media_key = message._get_media_key(message.raw_payload or {})
+            message._set_media_placeholder()
+        self._trigger_media()
+    
+    def _defer_media(self):
+        """
+        Keep the media reference only, the file is fetched when first opened
         
-        # Auto-detect content type from payload
-        detected_type = self._detect_content_type(self.raw_payload)
+        Media already received once is linked right away, it costs no
+        download.
+        """
+        for message in self:
+            if not message.media_key:
+                message.media_key = message._get_media_key(message.raw_payload or {})
+            known_attachment = message._find_known_media()
+            if known_attachment:
+                message._reuse_media(known_attachment)
+                continue
+            message.write({
+                'media_state': 'lazy',
+                'media_attempts': 0,
+                'media_error': False,
+            })
+            mail_message = message.mail_message_id.sudo()
+            if mail_message:
+                # Appended so that a caption stays visible
+                link = Markup(MEDIA_LAZY_PLACEHOLDER) % (message.id, _('Open %s', message.content_type))
+                mail_message.write({'body': Markup(mail_message.body or '') + link})
+    
+    def _set_media_placeholder(self):
+        """Show a placeholder in Discuss while the media is downloaded"""
+        self.ensure_one()
+        mail_message = self.mail_message_id.sudo()
+        if mail_message and not html2plaintext(mail_message.body or '').strip():
+            mail_message.write({
+                'body': Markup(MEDIA_PLACEHOLDER) % _('Receiving %s…', self.content_type),
+            })
+    
+    @api.model
+    def _get_media_key(self, payload):
+        """
+        Get the stable identifier of the media of a payload
         
-        # Skip if no media
-        if detected_type == 'text':
-            return []
+        WhatsApp keeps the hash of a file when it is forwarded, so the
+        same sticker or forwarded document always has the same key.
         
-        # Process media
-        return self._process_media_from_payload(self.raw_payload, detected_type)
+        Args:
+            payload: WAHA message payload
+            
+        Returns:
+            str: Media key, or False if the engine does not expose one
+        """
+        _data = payload.get('_data') or {}
+        return _data.get('filehash') or _data.get('mediaKey') or False
     
-    def _process_media_from_payload(self, payload, content_type):
+    def _find_known_media(self):
         """
-        Download and attach media from WAHA payload
+        Get the stored file of a previous message with the same media key
         
-        Creates attachment and links it directly to the mail.message
+        Returns:
+            ir.attachment record (empty if the media was never received)
+        """
+        self.ensure_one()
+        if not self.media_key:
+            return self.env['ir.attachment']
+        known = self.search([
+            ('media_key', '=', self.media_key),
+            ('media_state', '=', 'done'),
+            ('media_attachment_id', '!=', False),
+            ('media_tier', '=', 'original'),
+            ('id', '!=', self.id),
+        ], limit=1)
+        return known.media_attachment_id.sudo()
+    
+    @api.model
+    def _find_transcoded_media(self, source_checksum):
+        """
+        Get the stored conversion of a media file received before
         
         Args:
-            payload: WAHA payload with media info
-            content_type: Type of media (image, video, etc.)
+            source_checksum: sha1 of the file as received
             
         Returns:
-            list: IDs of created attachments
+            ir.attachment record (empty if the file was never converted)
+        """
+        known = self.search([
+            ('media_source_checksum', '=', source_checksum),
+            ('media_state', '=', 'done'),
+            ('media_attachment_id', '!=', False),
+            ('media_tier', '=', 'original'),
+        ], limit=1)
+        return known.media_attachment_id.sudo()
+    
+    @api.model
+    def _trigger_media(self):
+        """Run the media cron as soon as the current transaction commits"""
+        cron = self.env.ref('waha.ir_cron_waha_process_media', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+    
+    @api.model
+    def _get_media_workers(self):
+        """Number of threads downloading/converting media in parallel"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        return max(int(ICP.get_param('waha.media_workers', DEFAULT_MEDIA_WORKERS)), 1)
+    
+    @api.model
+    def _get_transcoder(self):
+        """Audio transcoder, limited to waha.ffmpeg_processes concurrent ffmpeg"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        return get_transcoder(
+            max(int(ICP.get_param('waha.ffmpeg_processes', DEFAULT_MAX_PROCESSES)), 1),
+            int(ICP.get_param('waha.ffmpeg_timeout', DEFAULT_TIMEOUT)),
+        )
+    
+    @api.model
+    def _cron_process_media(self, batch_size=20, time_budget=50, auto_commit=True):
+        """
+        Download, convert and attach pending media
+        
+        Jobs are prepared from the payloads by the cron thread, fetched
+        by a bounded thread pool (waha.media_workers), and attached back
+        in the cron thread, one savepoint and commit per message. A failed
+        message is retried on the next runs up to _media_max_attempts.
+        
+        Audio needing conversion goes back to the pool once fetched,
+        unless the same file was converted before: its conversion is
+        reused, ffmpeg does not run again.
+        
+        Args:
+            batch_size: Number of messages fetched per batch
+            time_budget: Seconds after which the run stops and re-schedules
+            auto_commit: Commit after each message (disabled in tests)
+        """
+        from odoo.addons.waha.tools.waha_api import WahaApi
+        
+        deadline = time.monotonic() + time_budget
+        processed_ids = []
+        apis = {}  # account id -> WahaApi
+        transcoder = self._get_transcoder()
+        
+        with ThreadPoolExecutor(max_workers=self._get_media_workers(),
+                                thread_name_prefix='waha-media') as executor:
+            while True:
+                if time.monotonic() >= deadline:
+                    self._trigger_media()
+                    break
+                # Messages failing in this run are retried by the next one
+                messages = self.search([
+                    ('media_state', '=', 'pending'),
+                    ('id', 'not in', processed_ids),
+                ], order='id', limit=batch_size)
+                if not messages:
+                    break
+                processed_ids += messages.ids
+                
+                futures = {}
+                for message in messages:
+                    # Already received once: reuse the stored file, no download
+                    known_attachment = message._find_known_media()
+                    if known_attachment:
+                        message._reuse_media(known_attachment)
+                        if auto_commit:
+                            self.env.cr.commit()
+                        continue
+                    try:
+                        job = message._prepare_media_job()
+                    except Exception as e:
+                        message._mark_media_failed(e)
+                        continue
+                    account = message.wa_account_id
+                    if account.id not in apis:
+                        apis[account.id] = WahaApi(account)
+                    futures[executor.submit(fetch_media, apis[account.id], job, transcoder)] = message
+                
+                while futures:
+                    done, _pending = wait(futures, return_when=FIRST_COMPLETED)
+                    fetched = []  # (message, media) to attach together
+                    for future in done:
+                        message = futures.pop(future)
+                        try:
+                            media = future.result()
+                        except MediaTooLarge as e:
+                            # Retrying would download the same file again
+                            message._mark_media_failed(e, retry=False)
+                        except Exception as e:
+                            message._mark_media_failed(e)
+                        else:
+                            if needs_transcoding(media['mimetype']) and 'source_checksum' not in media:
+                                converted = self._find_transcoded_media(media['checksum'])
+                                if not converted:
+                                    futures[executor.submit(transcode_media, transcoder, media)] = message
+                                    continue
+                                remove_file(media['path'])
+                                message._reuse_media(converted, source_checksum=media['checksum'])
+                            else:
+                                fetched.append((message, media))
+                    if fetched:
+                        self._attach_media_batch(fetched)
+                    if auto_commit:
+                        self.env.cr.commit()
+    
+    @api.model
+    def _attach_media_batch(self, fetched):
+        """
+        Store the media fetched for several messages together
+        
+        If storing the batch fails, each message is attached on its own so
+        that one bad file does not fail the others.
+        
+        Args:
+            fetched: list of (waha.message, media dict)
+        """
+        try:
+            with self.env.cr.savepoint():
+                self._store_media(fetched)
+        except Exception as e:
+            if len(fetched) == 1:
+                fetched[0][0]._mark_media_failed(e)
+            else:
+                _logger.warning('Failed to attach %d media at once, attaching them one by one: %s',
+                                len(fetched), str(e))
+                for message, media in fetched:
+                    try:
+                        with self.env.cr.savepoint():
+                            message._attach_media(media)
+                    except Exception as e:
+                        message._mark_media_failed(e)
+        finally:
+            for _message, media in fetched:
+                remove_file(media['path'])
+    
+    def _reuse_media(self, attachment, source_checksum=False):
+        """
+        Link an already stored media file to this message
+        
+        Args:
+            attachment: ir.attachment of another message holding the same media
+            source_checksum: Checksum of the received file, if it was converted
         """
         self.ensure_one()
+        owner = self._get_media_owner()
+        known_preview = self.search([
+            ('media_attachment_id', '=', attachment.id),
+            ('media_preview_id', '!=', False),
+        ], limit=1).media_preview_id.sudo()
+        try:
+            with self.env.cr.savepoint():
+                preview = known_preview._waha_copy_stored(owner) if known_preview else None
+                self._link_media(attachment._waha_copy_stored(owner), preview)
+                if source_checksum:
+                    self.media_source_checksum = source_checksum
+        except Exception as e:
+            self._mark_media_failed(e)
+    
+    @api.model
+    def _get_media_max_size(self, content_type):
+        """
+        Maximum size of downloaded media, per content type
         
-        if not self.mail_message_id:
-            _logger.warning('No mail_message_id to attach media to (waha.message=%s)', self.id)
-            return []
+        Returns:
+            int: Size in bytes, 0 for no limit
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        max_size_mb = ICP.get_param(
+            'waha.media_max_size_%s' % content_type,
+            DEFAULT_MAX_SIZES_MB.get(content_type, DEFAULT_MAX_SIZES_MB['document'])
+        )
+        return int(float(max_size_mb) * 1024 * 1024)
+    
+    @api.model
+    def _get_media_preview_size(self, content_type):
+        """
+        Size of the preview shown in Discuss instead of the media
         
-        media = payload.get('media', {})
-        if not media:
-            _logger.warning('No media in payload for %s', content_type)
-            return []
+        Returns:
+            int: Maximum width/height in pixels, 0 for no preview
+        """
+        if content_type not in ('image', 'video'):
+            return 0
+        ICP = self.env['ir.config_parameter'].sudo()
+        return int(ICP.get_param('waha.media_preview_size', DEFAULT_PREVIEW_SIZE))
+    
+    def _prepare_media_job(self):
+        """
+        Extract what is needed to fetch the media of this message
         
-        # Get media data
-        media_data = media.get('data')  # base64
-        media_url = media.get('url')    # HTTP URL
-        mimetype = media.get('mimetype') or self._get_default_mimetype(content_type)
-        filename = media.get('filename') or self._get_default_filename(content_type, mimetype)
+        Returns:
+            dict: Job for tools.waha_media.fetch_media
+        """
+        self.ensure_one()
+        
+        payload = self.raw_payload or {}
+        content_type = self._detect_content_type(payload)
+        media = payload.get('media') or {}
+        if not media:
+            raise ValueError('No media in payload for %s' % content_type)
         
         # For videos and images, always use URL (base64 in _data.body is just thumbnail)
         # For audio, prefer base64 if available (it's the full audio)
-        use_url_priority = content_type in ('image', 'video')
-        
-        # Check _data.body for base64 (WEBJS engine) only for audio
-        if not media_data and not use_url_priority:
-            _data = payload.get('_data', {})
-            media_data = _data.get('body')  # base64 from WEBJS
-            if media_data:
-                _logger.info('Using base64 from _data.body for content_type=%s', content_type)
-        
-        # Get binary data
-        import base64
-        import requests
-        import io
-        import subprocess
-        import tempfile
-        
-        media_binary = None
-        
-        # For videos and images, prioritize URL download over base64 (base64 is just thumbnail)
-        if use_url_priority and media_url:
-            _logger.info('%s detected, downloading from URL instead of using base64 thumbnail', content_type.capitalize())
-            try:
-                # Fix localhost URLs
-                if 'localhost' in media_url or '127.0.0.1' in media_url:
-                    media_url = media_url.replace(
-                        'http://localhost:3000',
-                        self.wa_account_id.waha_url.rstrip('/')
-                    )
-                
-                # Download with authentication
-                headers = {}
-                if self.wa_account_id.api_key:
-                    headers['X-Api-Key'] = self.wa_account_id.api_key
-                
-                _logger.info('Downloading %s from URL: %s', content_type, media_url)
-                timeout = 60 if content_type == 'video' else 30
-                response = requests.get(media_url, headers=headers, timeout=timeout)
-                response.raise_for_status()
-                media_binary = response.content
-                _logger.info('Downloaded %s: %d bytes', content_type, len(media_binary))
-            except Exception as e:
-                _logger.error('Failed to download %s from URL: %s', content_type, str(e))
+        prefer_url = content_type in ('image', 'video')
+        media_data = stripped_to_none(media.get('data'))
+        if not media_data and not prefer_url:
+            media_data = stripped_to_none(payload.get('_data', {}).get('body'))  # base64 from WEBJS
         
-        # For non-video types, try base64 first
-        elif media_data and not media_binary:
-            try:
-                media_binary = base64.b64decode(media_data)
-                _logger.info('Decoded base64 media: %d bytes, mimetype=%s', len(media_binary), mimetype)
-            except Exception as e:
-                _logger.error('Failed to decode base64 media: %s', str(e))
+        mimetype = media.get('mimetype') or self._get_default_mimetype(content_type)
+        return {
+            'content_type': content_type,
+            'max_size': self._get_media_max_size(content_type),
+            'url': media.get('url'),
+            'data': media_data,
+            'prefer_url': prefer_url,
+            'mimetype': mimetype,
+            'filename': media.get('filename') or self._get_default_filename(content_type, mimetype),
+            'timeout': 60 if content_type == 'video' else 30,
+            'preview_size': self._get_media_preview_size(content_type),
+        }
+    
+    def _get_media_owner(self):
+        """
+        Get the record owning the media attachment
         
-        # Fallback to URL if base64 failed or not available
-        elif media_url and not media_binary:
-            try:
-                # Fix localhost URLs
-                if 'localhost' in media_url or '127.0.0.1' in media_url:
-                    media_url = media_url.replace(
-                        'http://localhost:3000',
-                        self.wa_account_id.waha_url.rstrip('/')
-                    )
-                
-                # Download with authentication
-                headers = {}
-                if self.wa_account_id.api_key:
-                    headers['X-Api-Key'] = self.wa_account_id.api_key
-                
-                _logger.info('Downloading from URL: %s', media_url)
-                response = requests.get(media_url, headers=headers, timeout=30)
-                response.raise_for_status()
-                media_binary = response.content
-                _logger.info('Downloaded: %d bytes', len(media_binary))
-            except Exception as e:
-                _logger.error('Failed to download media from URL: %s', str(e))
+        The file is stored once: on the Discuss message when there is one
+        (so channel members can read it), else on the waha.message.
         
-        # Convert audio to MP3 if needed (for better browser compatibility)
-        if media_binary and mimetype and mimetype.startswith('audio/') and 'ogg' in mimetype.lower():
-            _logger.info('Converting audio from %s to MP3 for better compatibility', mimetype)
-            try:
-                media_binary = self._convert_audio_to_mp3(media_binary)
-                mimetype = 'audio/mpeg'
-                # Update filename extension
-                if filename.endswith('.ogg'):
-                    filename = filename[:-4] + '.mp3'
-                _logger.info('Audio converted to MP3 successfully: %d bytes', len(media_binary))
-            except Exception as e:
-                _logger.warning('Failed to convert audio to MP3, using original: %s', str(e))
+        Returns:
+            dict: res_model/res_id values of the attachment
+        """
+        self.ensure_one()
+        if self.mail_message_id:
+            return {'res_model': 'mail.message', 'res_id': self.mail_message_id.id}
+        return {'res_model': 'waha.message', 'res_id': self.id}
+    
+    def _attach_media(self, media):
+        """
+        Store fetched media, once, and link it to the message
         
-        # Create attachment
-        if media_binary:
-            try:
-                _logger.info('Creating attachment: name=%s, type=binary, mimetype=%s, size=%d bytes', 
-                            filename, mimetype, len(media_binary))
-                
-                # Create attachment linked to waha.message (for our records)
-                attachment_waha = self.env['ir.attachment'].sudo().create({
-                    'name': filename,
-                    'type': 'binary',
-                    'datas': base64.b64encode(media_binary),
-                    'mimetype': mimetype,
-                    'res_model': 'waha.message',
-                    'res_id': self.id,
-                })
-                
-                _logger.info('Attachment created for waha.message: id=%s', attachment_waha.id)
-                
-                # Create a COPY for mail.message (for Discuss UI)
-                if self.mail_message_id:
-                    attachment_mail = self.env['ir.attachment'].sudo().create({
-                        'name': filename,
-                        'type': 'binary',
-                        'datas': base64.b64encode(media_binary),
-                        'mimetype': mimetype,
-                        'res_model': 'mail.message',
-                        'res_id': self.mail_message_id.id,
-                    })
-                    _logger.info('Attachment created for mail.message: id=%s', attachment_mail.id)
-                    
-                    # Explicitly link attachment to mail.message.attachment_ids
-                    # This ensures Odoo Discuss renders it correctly
-                    self.mail_message_id.sudo().write({
-                        'attachment_ids': [(4, attachment_mail.id)]
-                    })
-                    _logger.info('Attachment %s linked to mail.message.attachment_ids', attachment_mail.id)
-                    
-                    return [attachment_waha.id, attachment_mail.id]
-                
-                _logger.info('Created attachment: %s (%s)', filename, content_type)
-                return [attachment_waha.id]
-                
-            except Exception as e:
-                _logger.error('Failed to create attachment: %s', str(e), exc_info=True)
-                return []
+        The temporary file is moved into the filestore, the content is
+        never loaded in memory.
+        
+        Args:
+            media: dict returned by tools.waha_media.fetch_media or transcode_media
+            
+        Returns:
+            ir.attachment record
+        """
+        self.ensure_one()
+        return self._store_media([(self, media)])[0]
+    
+    @api.model
+    def _store_media(self, fetched):
+        """
+        Store fetched media of several messages and link each to its message
+        
+        Attachments (and previews) are created with one create() each.
+        
+        Args:
+            fetched: list of (waha.message, media dict returned by
+                tools.waha_media.fetch_media or transcode_media)
+            
+        Returns:
+            list: ir.attachment records, in the order of fetched
+        """
+        Attachment = self.env['ir.attachment'].sudo()
+        
+        files = []
+        for message, media in fetched:
+            _logger.info('Creating attachment: name=%s, type=binary, mimetype=%s, size=%d bytes',
+                         media['filename'], media['mimetype'], media['size'])
+            files.append((
+                media['path'], media['checksum'], media['size'],
+                dict(message._get_media_owner(), name=media['filename'], mimetype=media['mimetype']),
+            ))
+        attachments = Attachment._waha_create_from_files(files)
+        
+        with_preview = [(message, media) for message, media in fetched if media.get('preview')]
+        previews = Attachment.create([
+            dict(
+                message._get_media_owner(),
+                name='%s.preview.webp' % media['filename'].rsplit('.', 1)[0],
+                mimetype='image/webp',
+                raw=media['preview'],
+            )
+            for message, media in with_preview
+        ])
+        preview_by_message = {message.id: preview for (message, _media), preview in zip(with_preview, previews)}
+        
+        for (message, media), attachment in zip(fetched, attachments):
+            message._link_media(attachment, preview_by_message.get(message.id))
+            if media.get('source_checksum'):
+                message.media_source_checksum = media['source_checksum']
+        return list(attachments)
+    
+    def _link_media(self, attachment, preview=None):
+        """
+        Reference a stored media file from the message and its Discuss message
+        
+        With a preview, Discuss shows the preview and links to the full
+        file, which is only loaded when clicked.
+        
+        Args:
+            attachment: ir.attachment holding the media
+            preview: ir.attachment holding its preview, if any
+        """
+        self.ensure_one()
+        
+        mail_message = self.mail_message_id.sudo()
+        if mail_message:
+            # Explicitly link attachment to mail.message.attachment_ids
+            # This ensures Odoo Discuss renders it correctly
+            vals = {'attachment_ids': [(4, (preview or attachment).id)]}
+            body = mail_message.body or ''
+            if 'o_waha_media_pending' in body:
+                body = vals['body'] = Markup(MEDIA_PLACEHOLDER_RE.sub('', body))
+            if preview:
+                vals['body'] = Markup(body) + Markup(MEDIA_FULL_LINK) % (self.id, _('Open full size'))
+            mail_message.write(vals)
+        
+        self.write({
+            'media_state': 'done',
+            'media_error': False,
+            'media_attachment_id': attachment.id,
+            'media_preview_id': preview.id if preview else False,
+        })
+        self._slim_raw_payload()
+        _logger.info('Media attachment %s linked to waha.message %s', attachment.id, self.id)
+    
+    @api.model
+    def _slim_payload(self, payload, media_stored=False):
+        """
+        Replace the media content of a payload by size/hash markers
+        
+        Until the media is stored, the content is only dropped when the
+        media can be downloaded from its URL instead.
+        
+        Args:
+            payload: WAHA message payload
+            media_stored: Whether the media is stored as attachment
+            
+        Returns:
+            dict: Slimmed payload (the payload itself if nothing changed)
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        if not payload or not str2bool(ICP.get_param('waha.payload_slimming', 'True')):
+            return payload
+        if not media_stored and not (payload.get('media') or {}).get('url'):
+            return payload
+        return strip_media_content(
+            payload, int(ICP.get_param('waha.payload_slim_min_size', DEFAULT_SLIM_MIN_SIZE))
+        )
+    
+    def _slim_raw_payload(self):
+        """Drop the media content of raw_payload, the media being stored"""
+        for message in self:
+            slimmed = message._slim_payload(message.raw_payload, media_stored=True)
+            if slimmed is not message.raw_payload:
+                message.raw_payload = slimmed
+    
+    def _mark_media_failed(self, error, retry=True):
+        """Count a failed media attempt, give up after _media_max_attempts"""
+        self.ensure_one()
+        attempts = self.media_attempts + 1
+        _logger.warning('Media of message %s failed (attempt %d): %s', self.id, attempts, error)
+        self.write({
+            'media_state': 'error' if not retry or attempts >= self._media_max_attempts else 'pending',
+            'media_attempts': attempts,
+            'media_error': str(error),
+        })
+    
+    def action_retry_media(self):
+        """Queue failed media downloads again"""
+        self.filtered(lambda m: m.media_state == 'error')._queue_media()
+    
+    def _reduce_media(self, max_size, quality):
+        """
+        Downscale and recompress the stored image of this message
+        
+        Only the attachment of this message is replaced, other messages
+        sharing the stored file keep the original.
         
-        return []
+        Args:
+            max_size: Maximum width/height in pixels
+            quality: Compression quality, 1-95
+        """
+        self.ensure_one()
+        attachment = self.media_attachment_id.sudo()
+        reduced = reduce_image(attachment.raw, max_size, quality)
+        if reduced:
+            _logger.info('Reduced media of message %s: %d -> %d bytes',
+                         self.id, attachment.file_size, len(reduced))
+            attachment._waha_replace_content(reduced)
+        self.media_tier = 'reduced'
+    
+    def _remove_media(self, keep_preview=True):
+        """
+        Delete the stored media file, the message stays in the history
+        
+        The Discuss message keeps its text (and preview) with a note that
+        the file was removed. The filestore file goes away once no other
+        message shares it.
+        
+        Args:
+            keep_preview: Keep the preview of images and videos
+        """
+        self.ensure_one()
+        to_unlink = self.media_attachment_id.sudo()
+        vals = {'media_tier': 'removed', 'media_attachment_id': False}
+        if not keep_preview:
+            to_unlink |= self.media_preview_id.sudo()
+            vals['media_preview_id'] = False
+        
+        mail_message = self.mail_message_id.sudo()
+        if mail_message:
+            body = MEDIA_FULL_LINK_RE.sub('', mail_message.body or '')
+            note = Markup(MEDIA_REMOVED_NOTE) % _('%s removed after the retention period', self.content_type)
+            mail_message.write({'body': Markup(body) + note})
+        
+        self.write(vals)
+        to_unlink.unlink()
+    
+    def action_fetch_media(self):
+        """Download media kept for on-demand fetching"""
+        for message in self.filtered(lambda m: m.media_state == 'lazy'):
+            message._fetch_media_now()
+    
+    def _fetch_media_now(self):
+        """
+        Download, convert and attach the media of this message in the current request
+        
+        Used when media fetched lazily is opened. Follows the same steps
+        as _cron_process_media, known media and conversions are reused.
+        
+        Returns:
+            ir.attachment record (empty if the media could not be fetched)
+        """
+        from odoo.addons.waha.tools.waha_api import WahaApi
+        
+        self.ensure_one()
+        
+        known_attachment = self._find_known_media()
+        if known_attachment:
+            self._reuse_media(known_attachment)
+            return self.media_attachment_id
+        
+        try:
+            media = fetch_media(WahaApi(self.wa_account_id), self._prepare_media_job(), self._get_transcoder())
+        except MediaTooLarge as e:
+            self._mark_media_failed(e, retry=False)
+            return self.env['ir.attachment']
+        except Exception as e:
+            self._mark_media_failed(e)
+            return self.env['ir.attachment']
+        
+        if needs_transcoding(media['mimetype']):
+            converted = self._find_transcoded_media(media['checksum'])
+            if converted:
+                remove_file(media['path'])
+                self._reuse_media(converted, source_checksum=media['checksum'])
+                return self.media_attachment_id
+            media = transcode_media(self._get_transcoder(), media)
+        
+        try:
+            with self.env.cr.savepoint():
+                self._attach_media(media)
+        except Exception as e:
+            self._mark_media_failed(e)
+        finally:
+            remove_file(media['path'])
+        return self.media_attachment_id
     
     def _get_default_mimetype(self, content_type):
         """Get default mimetype for content type"""
@@ -721,76 +1182,6 @@ class WahaMessage(models.Model):
         
         return 'text'
     
-    def _convert_audio_to_mp3(self, audio_binary):
-        """
-        Convert audio file to MP3 format using ffmpeg
-        
-        Args:
-            audio_binary: bytes - Original audio file content
-            
-        Returns:
-            bytes - MP3 audio file content
-        """
-        try:
-            # Create temporary files for input and output
-            with tempfile.NamedTemporaryFile(suffix='.ogg', delete=False) as input_file:
-                input_file.write(audio_binary)
-                input_path = input_file.name
-            
-            output_path = tempfile.mktemp(suffix='.mp3')
-            
-            try:
-                # Use ffmpeg to convert to MP3
-                # -y: overwrite output file without asking
-                # -i: input file
-                # -acodec libmp3lame: use MP3 codec
-                # -ab 128k: audio bitrate 128kbps (good quality for voice)
-                # -ar 44100: sample rate 44.1kHz
-                # -ac 1: mono channel (voice messages are mono)
-                cmd = [
-                    'ffmpeg',
-                    '-y',  # Overwrite output
-                    '-i', input_path,  # Input file
-                    '-acodec', 'libmp3lame',  # MP3 codec
-                    '-ab', '128k',  # Bitrate
-                    '-ar', '44100',  # Sample rate
-                    '-ac', '1',  # Mono
-                    output_path
-                ]
-                
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
-                
-                if result.returncode != 0:
-                    _logger.error('ffmpeg conversion failed: %s', result.stderr)
-                    raise Exception(f'ffmpeg failed with code {result.returncode}')
-                
-                # Read the converted file
-                with open(output_path, 'rb') as f:
-                    mp3_binary = f.read()
-                
-                return mp3_binary
-                
-            finally:
-                # Clean up temporary files
-                import os
-                try:
-                    os.unlink(input_path)
-                except:
-                    pass
-                try:
-                    os.unlink(output_path)
-                except:
-                    pass
-                    
-        except Exception as e:
-            _logger.error('Error converting audio to MP3: %s', str(e))
-            raise
-    
     def _get_default_filename(self, content_type, mimetype=None):
         """Get default filename for content type based on mimetype"""
         # Try to infer extension from mimetype
@@ -885,7 +1276,7 @@ class WahaMessage(models.Model):
                 'res_id': message.id,
             })
         
-        # Note: msg_uid will be computed automatically (auto-sends to WAHA)
+        # Note: msg_uid will be set by the outbox dispatcher once sent
         # Note: mail_message_id will be computed automatically
         # after waha_chat_id and partner_id are set
         
@@ -896,7 +1287,7 @@ class WahaMessage(models.Model):
         Send this message through WAHA API (manual/retry)
         
         Note: This is now mainly for manual retry actions.
-        Normal sending happens automatically via _compute_msg_uid.
+        Normal sending happens in the outbox dispatcher (_cron_dispatch_outbox).
         
         Returns:
             str: msg_uid from WAHA response
@@ -909,71 +1300,459 @@ class WahaMessage(models.Model):
         _logger.info('Manually sending message %s through WAHA', self.id)
         
         try:
-            from odoo.addons.waha.tools.waha_api import WahaApi
-            api = WahaApi(self.wa_account_id)
-            
-            # Prepare message data
-            chat_wa_id = self.waha_chat_id.wa_chat_id
-            body_clean = re.sub(r'<[^>]+>', '', self.body).strip()
-            
-            # Send based on content type
-            if self.content_type == 'text':
-                result = api.send_text(chat_wa_id, body_clean, self.reply_to_msg_uid)
-            else:
-                # Handle media sending
-                if self.attachment_ids:
-                    attachment = self.attachment_ids[0]
-                    result = api.send_file(
-                        chat_wa_id,
-                        attachment.datas,
-                        attachment.name,
-                        attachment.mimetype,
-                        body_clean
-                    )
-                else:
-                    # Fallback to text
-                    result = api.send_text(chat_wa_id, body_clean, self.reply_to_msg_uid)
-            
-            # Update message with result
-            msg_uid = result.get('id', '')
-            self.write({
-                'state': 'sent',
-                'msg_uid': msg_uid,
-                'sent_date': fields.Datetime.now(),
-            })
-            
-            _logger.info('Message sent successfully: %s', msg_uid)
-            
-            # Update chat
-            if self.waha_chat_id:
-                self.waha_chat_id.update_last_message()
-            
-            return msg_uid
-            
+            result = self._send_payload()
         except Exception as e:
-            error_msg = str(e)
-            _logger.error('Failed to send message: %s', error_msg)
+            self._mark_send_failed(e)
+            raise
+        
+        self._mark_sent(result)
+        return self.msg_uid
+
+    def _send_payload(self):
+        """
+        Perform the WAHA API call for this message
+        
+        Returns:
+            dict: WAHA response
+        """
+        self.ensure_one()
+        
+        from odoo.addons.waha.tools.waha_api import WahaApi
+        api = WahaApi(self.wa_account_id)
+        method, args = self._prepare_send_request()
+        return getattr(api, method)(*args)
+
+    def _prepare_send_request(self):
+        """
+        Build the WAHA call for this message
+        
+        Everything read from the database is resolved here, so the
+        returned call can be performed outside of the ORM (e.g. in a
+        worker thread of the outbox dispatcher).
+        
+        Returns:
+            tuple: (WahaApi method name, positional arguments)
+        """
+        self.ensure_one()
+        
+        # Prepare message data
+        chat_wa_id = self.waha_chat_id.wa_chat_id
+        body_clean = re.sub(r'<[^>]+>', '', self.body or '').strip()
+        
+        # Send based on content type
+        if self.content_type == 'text' or not self.attachment_ids:
+            return 'send_text', (chat_wa_id, body_clean or '(empty)', self.reply_to_msg_uid)
+        
+        # Handle media sending: WAHA downloads the file from a signed URL,
+        # else it is sent base64 encoded
+        attachment = self.attachment_ids[0]
+        if self.wa_account_id.send_media_by_url:
+            return 'send_file', (
+                chat_wa_id,
+                None,
+                attachment.name,
+                attachment.mimetype,
+                body_clean,
+                attachment.sudo()._waha_get_signed_url(),
+            )
+        return 'send_file', (
+            chat_wa_id,
+            attachment.datas.decode(),
+            attachment.name,
+            attachment.mimetype,
+            body_clean,
+        )
+
+    def _mark_sent(self, result):
+        """Store the WAHA message id after a successful send"""
+        self.ensure_one()
+        
+        self.write({
+            'state': 'sent',
+            'msg_uid': result.get('id', ''),
+            'sent_date': fields.Datetime.now(),
+        })
+        
+        _logger.info('Message %s sent successfully: %s', self.id, self.msg_uid)
+        
+        # Update chat
+        if self.waha_chat_id:
+            self.waha_chat_id.update_last_message()
+
+    def _mark_send_failed(self, error):
+        """Classify a send error and flag the message as failed"""
+        self.ensure_one()
+        
+        error_msg = str(error)
+        _logger.error('Failed to send message %s: %s', self.id, error_msg)
+        
+        # Classify error
+        if 'No LID for user' in error_msg or 'not found' in error_msg.lower():
+            failure_type = 'contact_not_found'
+        elif 'Invalid session' in error_msg or 'not connected' in error_msg.lower():
+            failure_type = 'account'
+        else:
+            failure_type = 'unknown'
+        
+        # Update state to error (but don't set msg_uid)
+        self.write({
+            'state': 'error',
+            'failure_type': failure_type,
+            'failure_reason': error_msg,
+        })
+
+    # ============================================================
+    # OUTBOX
+    # ============================================================
+    
+    def _is_queued_for_send(self):
+        """Whether the outbox dispatcher should pick this message up"""
+        self.ensure_one()
+        return self.message_type == 'outbound' and self.state == 'outgoing' and not self.msg_uid
+    
+    @api.model
+    def _get_outbound_jids(self, account, numbers):
+        """
+        Get the chat JIDs of recipients, with one query for all
+        
+        Args:
+            account: waha.account record sending the messages
+            numbers: Iterable of recipient phone numbers (any formatting)
             
-            # Classify error
-            if 'No LID for user' in error_msg or 'not found' in error_msg.lower():
-                failure_type = 'contact_not_found'
-            elif 'Invalid session' in error_msg or 'not connected' in error_msg.lower():
-                failure_type = 'account'
-            else:
-                failure_type = 'unknown'
+        Returns:
+            dict: normalized phone -> JID, for the contacts observed before
+        """
+        phones = {account._normalize_phone_number(number) for number in numbers if number}
+        return self.env['waha.identity'].sudo()._get_contact_jids(account, phones)
+    
+    @api.model
+    def _prepare_outbound_vals(self, account, number, body, contact_jids=None, **extra_vals):
+        """
+        Build the values of a queued outbound message to a phone number
+        
+        Args:
+            account: waha.account record sending the message
+            number: Recipient phone number (any formatting)
+            body: Message content
+            contact_jids: Chat JIDs of the batch (see _get_outbound_jids),
+                looked up for this number alone if not given
+            **extra_vals: Additional field values (template, campaign, priority...)
             
-            self.write({
-                'state': 'error',
-                'failure_type': failure_type,
-                'failure_reason': error_msg,
-            })
+        Returns:
+            dict: Values for create(), or None if the number is invalid
+        """
+        phone = account._normalize_phone_number(number)
+        if not phone:
+            return None
+        # Same chat as the messages received from the contact
+        if contact_jids is None:
+            contact_jids = self.env['waha.identity'].sudo()._get_contact_jids(account, [phone])
+        chat_id = contact_jids.get(phone)
+        return dict({
+            'wa_account_id': account.id,
+            'message_type': 'outbound',
+            'content_type': 'text',
+            'state': 'outgoing',
+            'body': body,
+            'raw_chat_id': chat_id or f'{phone}@c.us',
+            'raw_sender_phone': phone,
+        }, **extra_vals)
+    
+    @api.model
+    def _trigger_outbox(self):
+        """Run the outbox dispatcher as soon as the current transaction commits"""
+        cron = self.env.ref('waha.ir_cron_waha_dispatch_outbox', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+    
+    @api.model
+    def _get_send_workers(self):
+        """Number of threads sending to distinct chats in parallel"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        return max(int(ICP.get_param('waha.send_workers', DEFAULT_SEND_WORKERS)), 1)
+    
+    @api.model
+    def _cron_dispatch_outbox(self, batch_size=50, time_budget=50, auto_commit=True):
+        """
+        Send committed outgoing messages (transactional outbox)
+        
+        Creating an outbound message only queues it; this dispatcher
+        performs the WAHA calls outside of the creating transaction and
+        commits msg_uid/state once all the sends of a batch are done: the
+        claim locks of a batch are only released when every result is
+        written, so no message of it can be claimed and sent twice.
+        
+        Each batch is split per chat and the chats are sent in parallel by
+        a thread pool (waha.send_workers) over the pooled HTTP sessions.
+        Within a chat, messages are sent one after the other in creation
+        order; a chat whose send fails, or whose head message is held
+        elsewhere, is left alone for the rest of the run so that its next
+        messages are not sent before it. Threads only perform the HTTP calls: payloads are prepared
+        and results written by the cron thread, which owns the cursor.
+        
+        Sends are throttled per account by a token bucket (send_rate /
+        send_burst), whose level is stored on the account at each commit
+        so the next run continues from it, and the daily_send_limit. Chats with interactive
+        messages are served first; messages of paused campaigns wait.
+        Throttled accounts are skipped for the rest of the run and the
+        cron is re-scheduled for when their next token is available.
+        
+        Args:
+            batch_size: Number of messages fetched per batch
+            time_budget: Seconds after which the run stops and re-schedules
+            auto_commit: Commit after each batch (disabled in tests)
+        """
+        from odoo.addons.waha.tools.waha_api import WahaApi
+        
+        deadline = time.monotonic() + time_budget
+        throttled = {}  # account id -> seconds until it may send again
+        daily_remaining = {}  # account id -> sends left today (None = unlimited)
+        apis = {}  # account id -> WahaApi
+        buckets = {}  # account -> send TokenBucket
+        blocked_chats = set()  # chats whose next messages must wait
+        previous_ids = None
+        sent_count = 0
+        backlog = False
+        
+        with ThreadPoolExecutor(max_workers=self._get_send_workers(),
+                                thread_name_prefix='waha-send') as executor:
+            while True:
+                if time.monotonic() >= deadline:
+                    backlog = True
+                    break
+                messages = self._fetch_outbox_batch(
+                    batch_size,
+                    exclude_account_ids=list(throttled),
+                    exclude_chat_ids=list(blocked_chats),
+                )
+                if not messages or messages.ids == previous_ids:
+                    # Nothing left, or nothing of the last batch could be sent
+                    break
+                previous_ids = messages.ids
+                claimed = messages._claim_for_send()
+                
+                # Select what can be sent now, per chat in creation order
+                chat_requests = defaultdict(list)
+                for message in messages:
+                    account = message.wa_account_id
+                    chat_key = message.waha_chat_id.id
+                    if account.id in throttled or chat_key in blocked_chats:
+                        continue
+                    if message not in claimed:
+                        # Held elsewhere, later messages of the chat must wait for it
+                        blocked_chats.add(chat_key)
+                        continue
+                    
+                    if account.id not in daily_remaining:
+                        daily_remaining[account.id] = (
+                            account.daily_send_limit - account._get_daily_send_count()
+                            if account.daily_send_limit else None
+                        )
+                    if daily_remaining[account.id] is not None and daily_remaining[account.id] <= 0:
+                        _logger.info('Outbox: account %s reached its daily limit', account.name)
+                        throttled[account.id] = self._seconds_until_tomorrow()
+                        continue
+                    
+                    if not message._check_before_send():
+                        continue
+                    
+                    if account not in buckets:
+                        buckets[account] = account._get_send_bucket()
+                    wait = buckets[account].try_acquire()
+                    if wait:
+                        throttled[account.id] = wait
+                        continue
+                    
+                    try:
+                        method, args = message._prepare_send_request()
+                    except Exception as e:
+                        message._mark_send_failed(e)
+                        continue
+                    
+                    if account.id not in apis:
+                        apis[account.id] = WahaApi(account)
+                    chat_requests[chat_key].append((message.id, account.id, method, args))
+                    if daily_remaining[account.id] is not None:
+                        daily_remaining[account.id] -= 1
+                
+                if not chat_requests:
+                    if auto_commit:
+                        self._save_send_buckets(buckets)
+                        self.env.cr.commit()
+                    continue
+                
+                futures = {
+                    executor.submit(_send_requests, apis[requests[0][1]], requests): chat_key
+                    for chat_key, requests in chat_requests.items()
+                }
+                for future in as_completed(futures):
+                    for message_id, result, error in future.result():
+                        message = self.browse(message_id)
+                        if error:
+                            message._mark_send_failed(error)
+                            # The rest of the chat stays queued behind it
+                            blocked_chats.add(futures[future])
+                        else:
+                            message._record_send_result(result)
+                        sent_count += 1
+                # Every send of the batch is done and recorded: release the claims
+                if auto_commit:
+                    self._save_send_buckets(buckets)
+                    self.env.cr.commit()
+        
+        self._save_send_buckets(buckets)
+        _logger.info('Outbox: dispatched %d messages, %d accounts throttled', sent_count, len(throttled))
+        
+        if backlog:
+            self._trigger_outbox()
+        elif throttled:
+            # Paused accounts (send_rate 0) wait for the regular schedule
+            waits = [wait for wait in throttled.values() if wait != float('inf')]
+            cron = self.env.ref('waha.ir_cron_waha_dispatch_outbox', raise_if_not_found=False)
+            if cron and waits:
+                cron._trigger(at=fields.Datetime.now() + timedelta(seconds=max(min(waits), 1)))
+    
+    @api.model
+    def _save_send_buckets(self, buckets):
+        """
+        Store the send bucket levels of the accounts of a dispatcher run
+        
+        Args:
+            buckets: dict waha.account record -> TokenBucket
+        """
+        for account, bucket in buckets.items():
+            account._save_send_bucket(bucket)
+    
+    @api.model
+    def _fetch_outbox_batch(self, limit, exclude_account_ids=None, exclude_chat_ids=None):
+        """
+        Get the next queued messages to send
+        
+        Chats holding an interactive message come first, then chats by
+        their oldest queued message. Within a chat messages are returned
+        in creation order, so a batch only ever holds the head of a chat's
+        queue.
+        
+        Args:
+            limit: Maximum number of messages
+            exclude_account_ids: Accounts currently throttled
+            exclude_chat_ids: Chats whose queue is blocked for this run
             
-            raise
-
+        Returns:
+            waha.message recordset
+        """
+        # Results written earlier in the run may not be flushed yet
+        self.flush_model(['state', 'msg_uid', 'message_type', 'priority', 'waha_chat_id', 'campaign_id'])
+        self.env['waha.campaign'].flush_model(['state'])
+        self.env['waha.account'].flush_model(['status'])
+        self.env.cr.execute("""
+            SELECT id
+              FROM (
+                    SELECT message.id,
+                           MAX(message.priority) OVER chat AS chat_priority,
+                           MIN(message.id) OVER chat AS chat_first_id
+                      FROM waha_message message
+                      JOIN waha_account account ON account.id = message.wa_account_id
+                 LEFT JOIN waha_campaign campaign ON campaign.id = message.campaign_id
+                     WHERE message.state = 'outgoing'
+                       AND message.message_type = 'outbound'
+                       AND message.msg_uid IS NULL
+                       AND account.status = 'connected'
+                       AND (message.campaign_id IS NULL OR campaign.state = 'running')
+                       AND NOT (message.wa_account_id = ANY(%s))
+                       AND (message.waha_chat_id IS NULL OR NOT (message.waha_chat_id = ANY(%s)))
+                    WINDOW chat AS (PARTITION BY message.waha_chat_id)
+                   ) queued
+             ORDER BY chat_priority DESC, chat_first_id, id
+             LIMIT %s
+        """, [exclude_account_ids or [], [chat_id for chat_id in exclude_chat_ids or [] if chat_id], limit])
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+    
+    def _claim_for_send(self):
+        """
+        Lock these messages for sending
+        
+        Locks are held until the next commit. Messages already held by
+        a concurrent transaction (manual retry) or no longer queued are
+        left out.
+        
+        Returns:
+            waha.message recordset: The messages that are now locked
+        """
+        if not self:
+            return self
+        self.flush_model(['state', 'msg_uid'])
+        self.env.cr.execute("""
+            SELECT id
+              FROM waha_message
+             WHERE id IN %s
+               AND state = 'outgoing'
+               AND msg_uid IS NULL
+               FOR UPDATE SKIP LOCKED
+        """, [tuple(self.ids)])
+        self.invalidate_recordset(['state', 'msg_uid'])
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+    
+    @api.model
+    def _seconds_until_tomorrow(self):
+        """Seconds until the daily send limits reset (midnight UTC)"""
+        now = fields.Datetime.now()
+        tomorrow = fields.Datetime.to_datetime(fields.Date.today()) + timedelta(days=1)
+        return (tomorrow - now).total_seconds()
+    
+    def _check_before_send(self):
+        """
+        Validate a queued message before calling WAHA
+        
+        Messages that can never be sent are flagged right away.
+        
+        Returns:
+            bool: True if the message can be sent
+        """
+        self.ensure_one()
+        
+        # Need chat to send
+        if not self.waha_chat_id:
+            self._mark_send_failed(_('No chat to send the message to'))
+            return False
+        
+        body_clean = re.sub(r'<[^>]+>', '', self.body or '').strip()
+        if not body_clean and not self.attachment_ids:
+            _logger.warning('Message %s has no body or attachments', self.id)
+            self.write({'state': 'cancel'})
+            return False
+        
+        return True
+    
+    def _record_send_result(self, result):
+        """Store the outcome of a WAHA send call"""
+        self.ensure_one()
+        if result and result.get('id'):
+            self._mark_sent(result)
+        else:
+            self._mark_send_failed(_('WAHA did not return a message id'))
+    
     # ============================================================
     # STATUS UPDATES
     # ============================================================
     
+    # Map WAHA ACK to state
+    _ack_state_mapping = {
+        0: 'error',
+        1: 'outgoing',
+        2: 'sent',
+        3: 'delivered',
+        4: 'read',
+        5: 'read',
+    }
+
+    # Date field stamped the first time a message reaches a state
+    _state_date_fields = {
+        'sent': 'sent_date',
+        'delivered': 'delivered_date',
+        'read': 'read_date',
+    }
+
     def update_status_from_webhook(self, status_data):
         """
         Update message status from WAHA status webhook
@@ -982,33 +1761,35 @@ class WahaMessage(models.Model):
             status_data: Status webhook payload with 'ack' field
         """
         self.ensure_one()
+        self._update_status_from_acks({self.msg_uid: status_data.get('ack', 0)})
+
+    def _update_status_from_acks(self, acks):
+        """
+        Apply WAHA ACK values to a batch of messages
         
-        ack = status_data.get('ack', 0)
-        
-        # Map WAHA ACK to state
-        state_mapping = {
-            0: 'error',
-            1: 'outgoing',
-            2: 'sent',
-            3: 'delivered',
-            4: 'read',
-            5: 'read',
-        }
+        Messages are grouped by target state so each state costs one
+        write, plus one for the messages whose date must be stamped.
         
-        new_state = state_mapping.get(ack, self.state)
+        Args:
+            acks: dict mapping msg_uid to WAHA ACK value
+        """
+        by_state = defaultdict(lambda: self.browse())
+        for message in self:
+            new_state = self._ack_state_mapping.get(acks.get(message.msg_uid), message.state)
+            if new_state != message.state:
+                by_state[new_state] |= message
         
-        if new_state != self.state:
-            vals = {'state': new_state}
+        now = fields.Datetime.now()
+        for new_state, messages in by_state.items():
+            messages.write({'state': new_state})
             
-            if new_state == 'sent' and not self.sent_date:
-                vals['sent_date'] = fields.Datetime.now()
-            elif new_state == 'delivered' and not self.delivered_date:
-                vals['delivered_date'] = fields.Datetime.now()
-            elif new_state == 'read' and not self.read_date:
-                vals['read_date'] = fields.Datetime.now()
+            date_field = self._state_date_fields.get(new_state)
+            if date_field:
+                missing = messages.filtered(lambda m: not m[date_field])
+                if missing:
+                    missing.write({date_field: now})
             
-            self.write(vals)
-            _logger.info('Updated message %s status: %s → %s', self.id, self.state, new_state)
+            _logger.info('Updated %d messages status to %s', len(messages), new_state)
 
     # ============================================================
     # ACTIONS
@@ -1018,14 +1799,12 @@ class WahaMessage(models.Model):
         """Retry sending failed messages"""
         for message in self:
             if message.state == 'error' and message.message_type == 'outbound':
-                # Reset to outgoing to trigger auto-send via compute
+                # Back to the outbox, the dispatcher will send it again
                 message.write({
                     'state': 'outgoing',
                     'failure_type': False,
                     'failure_reason': False,
                 })
-                # Force recomputation of msg_uid (will auto-send)
-                message._compute_msg_uid()
     
     def action_view_discuss_message(self):
         """Open linked discuss message"""
@@ -0,0 +1,222 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import json
+import logging
+import time
+import zlib
+
+from odoo import api, fields, models, tools
+from odoo.tools.sql import column_exists
+
+_logger = logging.getLogger(__name__)
+
+# zlib level: 6 is the usual speed/ratio trade-off, JSON compresses 5-10x
+COMPRESSION_LEVEL = 6
+
+# waha_message column holding payloads stored before 1.3, emptied by
+# _cron_migrate_legacy_payloads and dropped by the 1.5 migration
+LEGACY_COLUMN = 'raw_payload_legacy'
+
+
+class WahaMessagePayload(models.Model):
+    """
+    WAHA Message Payload - Compressed raw payloads, off the message table
+
+    Responsibilities:
+    - Store the raw WAHA payload of a message, zlib compressed
+    - Decompress it when waha.message.raw_payload is read
+    - Move payloads stored in waha_message before 1.3 to this table
+
+    Keeping payloads out of waha_message keeps its rows small: list
+    views, queries and vacuum do not go through the JSON.
+    """
+    _name = 'waha.message.payload'
+    _description = 'WhatsApp Message Payload'
+    _rec_name = 'message_id'
+
+    message_id = fields.Many2one(
+        'waha.message',
+        string="Message",
+        required=True,
+        ondelete='cascade',
+        index=True
+    )
+    # Raw zlib bytes, not base64: the field is never sent to the web client
+    data = fields.Binary(string="Compressed Payload", attachment=False, required=True)
+    size = fields.Integer(string="Size", help="Size of the JSON payload in bytes")
+    compressed_size = fields.Integer(string="Compressed Size")
+
+    _sql_constraints = [
+        ('unique_message',
+         'unique(message_id)',
+         "A message has a single stored payload.")
+    ]
+
+    # ============================================================
+    # COMPRESSION
+    # ============================================================
+
+    @api.model
+    def _prepare_payload_vals(self, payload):
+        """
+        Compress a payload
+
+        Returns:
+            dict: data, size and compressed_size values
+        """
+        raw = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+        data = zlib.compress(raw, COMPRESSION_LEVEL)
+        return {
+            'data': data,
+            'size': len(raw),
+            'compressed_size': len(data),
+        }
+
+    def _decompress(self):
+        """
+        Get the payload of this record
+
+        Returns:
+            dict: The JSON payload
+        """
+        self.ensure_one()
+        return json.loads(zlib.decompress(self.with_context(bin_size=False).data))
+
+    @api.model
+    def _get_payloads(self, message_ids):
+        """
+        Get the payloads of messages, decompressed
+
+        Args:
+            message_ids: List of waha.message ids
+
+        Returns:
+            dict: message id -> payload, for the messages having one
+        """
+        records = self.with_context(bin_size=False).search([('message_id', 'in', message_ids)])
+        payloads = {record.message_id.id: record._decompress() for record in records}
+        missing_ids = [message_id for message_id in message_ids if message_id not in payloads]
+        if missing_ids:
+            payloads.update(self._read_legacy_payloads(missing_ids))
+        return payloads
+
+    @api.model
+    def _store_payloads(self, payloads):
+        """
+        Compress and store payloads, replacing the previous ones
+
+        Args:
+            payloads: dict message id -> payload (False removes it)
+        """
+        existing = {
+            record.message_id.id: record
+            for record in self.search([('message_id', 'in', list(payloads))])
+        }
+        to_remove = self.browse()
+        vals_list = []
+        for message_id, payload in payloads.items():
+            record = existing.get(message_id, self.browse())
+            if not payload:
+                to_remove |= record
+            elif record:
+                record.write(self._prepare_payload_vals(payload))
+            else:
+                vals_list.append(dict(self._prepare_payload_vals(payload), message_id=message_id))
+        to_remove.unlink()
+        self.create(vals_list)
+
+    # ============================================================
+    # LEGACY PAYLOADS
+    # ============================================================
+
+    @api.model
+    @tools.ormcache()
+    def _has_legacy_payloads(self):
+        """
+        Whether waha_message still holds payloads stored before 1.3
+
+        Cached at registry level: the column only goes away on upgrade,
+        and the migration cron clears the caches of all workers once it
+        has emptied it.
+        """
+        if not column_exists(self.env.cr, 'waha_message', LEGACY_COLUMN):
+            return False
+        self.env.cr.execute(f"SELECT 1 FROM waha_message WHERE {LEGACY_COLUMN} IS NOT NULL LIMIT 1")
+        return bool(self.env.cr.fetchone())
+
+    @api.model
+    def _read_legacy_payloads(self, message_ids):
+        """
+        Get payloads not moved to this table yet
+
+        Returns:
+            dict: message id -> payload
+        """
+        if not self._has_legacy_payloads():
+            return {}
+        self.env.cr.execute(f"""
+            SELECT id, {LEGACY_COLUMN}
+              FROM waha_message
+             WHERE id = ANY(%s) AND {LEGACY_COLUMN} IS NOT NULL
+        """, [list(message_ids)])
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _trigger_legacy_migration(self):
+        """Run the payload migration cron as soon as the current transaction commits"""
+        cron = self.env.ref('waha.ir_cron_waha_migrate_payloads', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+
+    @api.model
+    def _cron_migrate_legacy_payloads(self, batch_size=1000, time_budget=50, auto_commit=True):
+        """
+        Compress payloads stored in waha_message before 1.3 into this table
+
+        Each batch is compressed, stored and emptied from waha_message in
+        its own transaction. The emptied column is left in place: schema
+        changes lock the table, they are done by the 1.5 migration.
+
+        Args:
+            batch_size: Number of messages per batch
+            time_budget: Seconds after which the run stops and re-schedules
+            auto_commit: Commit after each batch (disabled in tests)
+        """
+        if not self._has_legacy_payloads():
+            return
+
+        deadline = time.monotonic() + time_budget
+        moved = 0
+        while True:
+            if time.monotonic() >= deadline:
+                self._trigger_legacy_migration()
+                break
+
+            self.env.cr.execute(f"""
+                SELECT id, {LEGACY_COLUMN}
+                  FROM waha_message
+                 WHERE {LEGACY_COLUMN} IS NOT NULL
+                 ORDER BY id
+                 LIMIT %s
+            """, [batch_size])
+            rows = self.env.cr.fetchall()
+            if not rows:
+                # Payload reads stop looking at the column, in every worker
+                self.env.registry.clear_cache()
+                _logger.info('Legacy payloads moved (%d this run), column %s is empty', moved, LEGACY_COLUMN)
+                if auto_commit:
+                    self.env.cr.commit()
+                break
+
+            # Payloads written since the upgrade are already in this table
+            message_ids = [message_id for message_id, _payload in rows]
+            stored_ids = set(self.search([('message_id', 'in', message_ids)]).message_id.ids)
+            self._store_payloads({
+                message_id: payload for message_id, payload in rows if message_id not in stored_ids
+            })
+            self.env.cr.execute(f"""
+                UPDATE waha_message SET {LEGACY_COLUMN} = NULL WHERE id = ANY(%s)
+            """, [message_ids])
+            moved += len(rows)
+            if auto_commit:
+                self.env.cr.commit()
@@ -1,12 +1,19 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
 import logging
+import time
+
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
 from odoo.addons.phone_validation.tools import phone_validation
+from odoo.addons.waha.tools.concurrency import claim, create_or_retry
+from odoo.addons.waha.tools.waha_jid import normalize_jid
 
 _logger = logging.getLogger(__name__)
 
+# Name of a new contact until its WhatsApp name is known
+DEFAULT_CONTACT_NAME = 'WhatsApp +%s'
+
 
 class WahaPartner(models.Model):
     """
@@ -91,6 +98,13 @@ class WahaPartner(models.Model):
         help="Indicates if contact info has been retrieved from WAHA"
     )
     last_sync_date = fields.Datetime(string="Last Sync Date")
+    enrich_pending = fields.Boolean(
+        string="Enrichment Pending",
+        default=False,
+        index=True,
+        copy=False,
+        help="Created by a bulk send, contact info is retrieved from WAHA in the background"
+    )
     
     active = fields.Boolean(default=True)
     
@@ -117,89 +131,184 @@ class WahaPartner(models.Model):
         Returns:
             res.partner record
         """
-        # Don't create partners for group IDs
-        if '@g.us' in str(phone):
-            _logger.warning('Attempted to create partner for group ID: %s', phone)
-            return self.env['res.partner']
+        partners = self._find_or_create_by_phones([(phone, wa_account)], auto_enrich=auto_enrich)
+        return partners[(phone, wa_account.id)]
+    
+    @api.model
+    def _find_or_create_by_phones(self, keys, auto_enrich=True):
+        """
+        Find or create the partners of many phone numbers at once
         
-        # Normalize phone number
-        normalized_phone = self._normalize_phone(phone, wa_account)
+        Known contacts are found with one query per model; missing
+        partners and waha.partner links are created with one create()
+        per model.
         
-        if not normalized_phone:
-            _logger.warning('Could not normalize phone: %s', phone)
-            return self.env['res.partner']
+        Args:
+            keys: Iterable of (phone in any format or LID, waha.account record)
+            auto_enrich: Whether to automatically enrich new contacts from WAHA;
+                with the waha_defer_enrich context key they are enriched
+                later by _cron_enrich_contacts instead
+            
+        Returns:
+            dict: (phone, account id) -> res.partner record (empty if the
+            phone is not valid)
+        """
+        Partner = self.env['res.partner'].sudo()
+        defer_enrich = auto_enrich and self.env.context.get('waha_defer_enrich')
+        if defer_enrich:
+            auto_enrich = False
+        keys = list(keys)
         
-        # Search for existing waha.partner
-        waha_partner = self.search([
-            ('phone_number', '=', normalized_phone),
-            ('wa_account_id', '=', wa_account.id),
-        ], limit=1)
+        # Resolve LIDs to the phone of their contact, when it was observed
+        lid_phones = {}  # (lid, account id) -> phone
+        lids = {normalize_jid(phone) for phone, _wa_account in keys if '@lid' in str(phone)}
+        if lids:
+            for identity in self.env['waha.identity'].sudo().search([
+                ('jid', 'in', list(lids)),
+                ('wa_account_id', 'in', list({wa_account.id for _phone, wa_account in keys})),
+                ('phone_number', '!=', False),
+            ]):
+                lid_phones[(identity.jid, identity.wa_account_id.id)] = identity.phone_number
         
-        if waha_partner:
-            _logger.info('Found existing waha.partner %s for phone %s', 
-                        waha_partner.id, normalized_phone)
-            return waha_partner.partner_id
+        # Normalize phone numbers
+        normalized = {}  # (phone, account id) -> normalized phone
+        accounts = {}
+        for phone, wa_account in keys:
+            key = (phone, wa_account.id)
+            if key in normalized:
+                continue
+            accounts[wa_account.id] = wa_account
+            # Don't create partners for group IDs
+            if '@g.us' in str(phone):
+                _logger.warning('Attempted to create partner for group ID: %s', phone)
+                normalized[key] = False
+                continue
+            normalized[key] = (
+                lid_phones.get((normalize_jid(phone), wa_account.id))
+                or self._normalize_phone(phone, wa_account)
+            )
+            if not normalized[key]:
+                _logger.warning('Could not normalize phone: %s', phone)
         
-        # Search for existing res.partner by phone
-        partner = self.env['res.partner'].sudo().search([
-            '|',
-            ('mobile', 'ilike', normalized_phone),
-            ('phone', 'ilike', normalized_phone),
-        ], limit=1)
+        wanted = {(number, account_id) for (_phone, account_id), number in normalized.items() if number}
+        found = {}  # (normalized phone, account id) -> res.partner
         
-        if not partner:
-            # Create new partner
-            contact_name = f"WhatsApp +{normalized_phone}"  # Default name with prefix
-            contact_image = None
-            
-            # Try to get contact info from WAHA before creating
-            if auto_enrich:
-                try:
-                    from odoo.addons.waha.tools.waha_api import WahaApi
-                    api = WahaApi(wa_account)
-                    contact_info = api.get_contact(normalized_phone)
-                    
-                    if contact_info:
-                        extracted_name = self._extract_contact_name(contact_info)
-                        if extracted_name:  # Only use if not empty
-                            contact_name = extracted_name
-                        contact_image = self._download_contact_avatar(
-                            wa_account, contact_info
-                        )
-                except Exception as e:
-                    _logger.warning('Could not enrich contact from WAHA: %s', str(e))
-            
-            # Create partner (name is guaranteed to be non-empty)
-            partner_vals = {
-                'name': contact_name,
-                'mobile': f"+{normalized_phone}",
-                'phone': f"+{normalized_phone}",
-            }
-            
-            if contact_image:
-                partner_vals['image_1920'] = contact_image
-            
-            partner = self.env['res.partner'].sudo().create(partner_vals)
-            _logger.info('Created new partner %s for phone %s', partner.id, normalized_phone)
+        # Search for existing waha.partner
+        if wanted:
+            for waha_partner in self.search([
+                ('phone_number', 'in', list({number for number, _account_id in wanted})),
+                ('wa_account_id', 'in', list(accounts)),
+            ]):
+                wanted_key = (waha_partner.phone_number, waha_partner.wa_account_id.id)
+                if wanted_key in wanted and wanted_key not in found:
+                    found[wanted_key] = waha_partner.partner_id
         
-        # Create waha.partner link
-        wa_contact_id = f"{normalized_phone}@c.us"
+        missing = sorted(wanted - set(found))
+        if missing:
+            numbers = sorted({number for number, _account_id in missing})
+            
+            # Claim the numbers before creating anything for them: a
+            # concurrent worker on the same contact makes this transaction
+            # retry instead of creating a duplicate partner
+            claim(self.env.cr, [f'waha.partner:{number}' for number in numbers], 'WhatsApp contacts')
+            
+            # Search for existing res.partner by mobile or phone (exact match, indexed)
+            by_number = Partner._wa_find_by_numbers(numbers)
+            
+            # Create new partners
+            to_create = [number for number in numbers if number not in by_number]
+            if to_create:
+                first_account = {}
+                for number, account_id in missing:
+                    first_account.setdefault(number, accounts[account_id])
+                new_partners = Partner.create([
+                    self._prepare_new_partner_vals(number, first_account[number], auto_enrich)
+                    for number in to_create
+                ])
+                by_number.update(zip(to_create, new_partners))
+                _logger.info('Created %d new partners for WhatsApp numbers', len(new_partners))
+            
+            # Create waha.partner links (one per partner and account)
+            linked = {
+                (waha_partner.partner_id.id, waha_partner.wa_account_id.id)
+                for waha_partner in self.search([
+                    ('partner_id', 'in', [partner.id for partner in by_number.values()]),
+                    ('wa_account_id', 'in', list(accounts)),
+                ])
+            }
+            link_vals = []
+            for number, account_id in missing:
+                partner = by_number[number]
+                found[(number, account_id)] = partner
+                if (partner.id, account_id) not in linked:
+                    linked.add((partner.id, account_id))
+                    link_vals.append({
+                        'partner_id': partner.id,
+                        'wa_account_id': account_id,
+                        'phone_number': number,
+                        'wa_contact_id': f"{number}@c.us",
+                        'enrich_pending': bool(defer_enrich),
+                    })
+            with create_or_retry(self.env.cr, 'WhatsApp contacts'):
+                waha_partners = self.create(link_vals)
+            _logger.info('Created %d waha.partner links', len(waha_partners))
+            
+            # Enrich if requested
+            if auto_enrich:
+                for waha_partner in waha_partners:
+                    waha_partner.enrich_from_waha()
+            elif defer_enrich and waha_partners:
+                self._trigger_enrich()
         
-        waha_partner_vals = {
-            'partner_id': partner.id,
-            'wa_account_id': wa_account.id,
-            'phone_number': normalized_phone,
-            'wa_contact_id': wa_contact_id,
+        return {
+            key: found.get((number, key[1]), Partner) if number else Partner
+            for key, number in normalized.items()
         }
+    
+    @api.model
+    def _prepare_new_partner_vals(self, normalized_phone, wa_account, auto_enrich=True):
+        """
+        Build the res.partner values of a new WhatsApp contact
         
-        waha_partner = self.create(waha_partner_vals)
-        _logger.info('Created waha.partner link %s', waha_partner.id)
+        Args:
+            normalized_phone: Phone number, normalized
+            wa_account: waha.account record
+            auto_enrich: Whether to get the name and avatar from WAHA
+            
+        Returns:
+            dict: res.partner values
+        """
+        contact_name = DEFAULT_CONTACT_NAME % normalized_phone
+        contact_image = None
         
-        # Enrich if requested
+        # Try to get contact info from WAHA before creating
         if auto_enrich:
-            waha_partner.enrich_from_waha()
+            try:
+                from odoo.addons.waha.tools.waha_api import WahaApi
+                api = WahaApi(wa_account)
+                contact_info = self.env['waha.identity'].sudo()._get_contact(api, wa_account, normalized_phone)
+                
+                if contact_info:
+                    extracted_name = self._extract_contact_name(contact_info)
+                    if extracted_name:  # Only use if not empty
+                        contact_name = extracted_name
+                    contact_image = self._download_contact_avatar(
+                        wa_account, contact_info
+                    )
+            except Exception as e:
+                _logger.warning('Could not enrich contact from WAHA: %s', str(e))
+        
+        # Name is guaranteed to be non-empty
+        partner_vals = {
+            'name': contact_name,
+            'mobile': f"+{normalized_phone}",
+            'phone': f"+{normalized_phone}",
+        }
+        
+        if contact_image:
+            partner_vals['image_1920'] = contact_image
         
-        return partner
+        return partner_vals
     
     def _normalize_phone(self, phone, wa_account):
         """
@@ -259,7 +368,9 @@ class WahaPartner(models.Model):
             api = WahaApi(self.wa_account_id)
             
             # Get contact info
-            contact_info = api.get_contact(self.phone_number)
+            contact_info = self.env['waha.identity'].sudo()._get_contact(
+                api, self.wa_account_id, self.phone_number
+            )
             
             if not contact_info:
                 _logger.warning('No contact info returned from WAHA for %s', 
@@ -308,7 +419,7 @@ class WahaPartner(models.Model):
             _logger.info('Enriched waha.partner %s from WAHA', self.id)
             
             # Update res.partner if we have better name
-            if wa_name and self.partner_id.name == self.phone_number:
+            if wa_name and self.partner_id.name in (self.phone_number, DEFAULT_CONTACT_NAME % self.phone_number):
                 self.partner_id.write({'name': wa_name})
                 _logger.info('Updated partner name to: %s', wa_name)
             
@@ -344,7 +455,6 @@ class WahaPartner(models.Model):
         """
         try:
             from odoo.addons.waha.tools.waha_api import WahaApi
-            import requests
             import base64
             
             api = WahaApi(wa_account)
@@ -365,26 +475,8 @@ class WahaPartner(models.Model):
             if not profile_pic_url:
                 return False
             
-            # Fix localhost URLs
-            if 'localhost' in profile_pic_url or '127.0.0.1' in profile_pic_url:
-                profile_pic_url = profile_pic_url.replace(
-                    'http://localhost:3000',
-                    wa_account.waha_url.rstrip('/')
-                )
-                profile_pic_url = profile_pic_url.replace(
-                    'http://127.0.0.1:3000',
-                    wa_account.waha_url.rstrip('/')
-                )
-            
-            # Download image
-            headers = {}
-            if wa_account.api_key:
-                headers['X-Api-Key'] = wa_account.api_key
-            
-            response = requests.get(profile_pic_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            return base64.b64encode(response.content)
+            # Download image through the pooled WAHA session
+            return base64.b64encode(api.download(profile_pic_url, timeout=10))
         
         except Exception as e:
             _logger.warning('Failed to download avatar: %s', str(e))
@@ -428,6 +520,41 @@ class WahaPartner(models.Model):
             _logger.error('Failed to validate phone: %s', str(e))
             return {'exists': False, 'error': str(e)}
     
+    @api.model
+    def _trigger_enrich(self):
+        """Run the contact enrichment cron as soon as the current transaction commits"""
+        cron = self.env.ref('waha.ir_cron_waha_enrich_contacts', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+    
+    @api.model
+    def _cron_enrich_contacts(self, batch_size=50, time_budget=50, auto_commit=True):
+        """
+        Enrich the contacts created by bulk sends from WAHA
+        
+        Campaigns create their new contacts without calling WAHA; their
+        name, avatar and business info are retrieved here, one commit
+        per batch. A contact is tried once, refresh_contact_info retries.
+        
+        Args:
+            batch_size: Number of contacts per batch
+            time_budget: Seconds after which the run stops and re-schedules
+            auto_commit: Commit after each batch (disabled in tests)
+        """
+        deadline = time.monotonic() + time_budget
+        while True:
+            contacts = self.search([('enrich_pending', '=', True)], order='id', limit=batch_size)
+            if not contacts:
+                return
+            if time.monotonic() >= deadline:
+                self._trigger_enrich()
+                return
+            for contact in contacts:
+                contact.enrich_from_waha()
+            contacts.write({'enrich_pending': False})
+            if auto_commit:
+                self.env.cr.commit()
+    
     def refresh_contact_info(self):
         """Manually refresh contact information from WAHA"""
         for record in self:
@@ -2,6 +2,10 @@
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
 import json
+import re
+
+# {{variable_name}} placeholders of a template body
+PLACEHOLDER_PATTERN = re.compile(r'\{\{(\w+)\}\}')
 
 
 class WahaTemplate(models.Model):
@@ -56,6 +60,8 @@ class WahaTemplate(models.Model):
                                domain=[('transient', '=', False)])
     model_name = fields.Char(related='model_id.model', string='Model Name', 
                              readonly=True, store=True)
+    phone_field = fields.Char('Phone Field', default='mobile',
+                              help='Field of the model holding the recipient phone number')
     
     # Statistics
     messages_count = fields.Integer('Messages', compute='_compute_messages_count')
@@ -103,12 +109,10 @@ class WahaTemplate(models.Model):
     def _extract_variables_from_body(self):
         """Extract {{variable}} placeholders from body and create variable records"""
         self.ensure_one()
-        import re
         
         # Find all {{variable_name}} patterns
         body_text = self.body or ''
-        pattern = r'\{\{(\w+)\}\}'
-        variables = re.findall(pattern, body_text)
+        variables = PLACEHOLDER_PATTERN.findall(body_text)
         
         # Get existing variables
         existing_vars = {var.name: var for var in self.variable_ids}
@@ -151,18 +155,73 @@ class WahaTemplate(models.Model):
         :return: Formatted text
         """
         self.ensure_one()
-        body = self.body or ''
         
         if not record:
-            return body
+            return self.body or ''
+        
+        return self._render_bodies(record)[record.id]
+
+    def _compile_body(self):
+        """
+        Split the body into literal and placeholder segments
+        
+        :return: list of (is_placeholder, text) tuples, text being the
+                 variable name for placeholders
+        """
+        self.ensure_one()
+        body = self.body or ''
+        segments = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(body):
+            if match.start() > position:
+                segments.append((False, body[position:match.start()]))
+            segments.append((True, match.group(1)))
+            position = match.end()
+        if position < len(body):
+            segments.append((False, body[position:]))
+        return segments
+
+    def _render_bodies(self, records):
+        """
+        Render the body for several records at once
+        
+        The body is compiled once into segments, the fields used by the
+        variables are fetched for all records in one go, and each body is
+        then assembled with a single join.
+        
+        :param records: Records to get values from
+        :return: dict mapping record id to formatted text
+        """
+        self.ensure_one()
+        
+        variables = {variable.name: variable for variable in self.variable_ids}
+        
+        # Prefetch the variable fields of all records
+        field_names = {
+            variable.field_name for variable in variables.values()
+            if variable.field_name and variable.field_name in records._fields
+        }
+        if field_names:
+            records.fetch(list(field_names))
+            for variable in variables.values():
+                if variable.field_type == 'many2one' and variable.field_name in field_names:
+                    records[variable.field_name].mapped('display_name')
         
-        # Replace variables
-        for variable in self.variable_ids:
-            placeholder = f'{{{{{variable.name}}}}}'
-            value = variable._get_value(record)
-            body = body.replace(placeholder, str(value or ''))
+        # Literal text stays a string, placeholders become value getters
+        parts = []
+        for is_placeholder, text in self._compile_body():
+            if not is_placeholder:
+                parts.append(text)
+            elif text in variables:
+                parts.append(variables[text]._get_formatter(records))
+            else:
+                # Unknown placeholder, kept as is
+                parts.append('{{%s}}' % text)
         
-        return body
+        return {
+            record.id: ''.join(part if isinstance(part, str) else part(record) for part in parts)
+            for record in records
+        }
 
 
 class WahaTemplateVariable(models.Model):
@@ -208,27 +267,44 @@ class WahaTemplateVariable(models.Model):
         :return: Formatted value
         """
         self.ensure_one()
+        return self._get_formatter(record)(record)
+
+    def _get_formatter(self, records):
+        """
+        Build the function formatting this variable for records
+        
+        Field name, type and demo value are resolved once, so the returned
+        function only reads the (prefetched) field and formats it.
+        
+        :param records: Records the function will be called with
+        :return: function(record) -> str
+        """
+        self.ensure_one()
+        
+        demo_value = self.demo_value or ''
+        field_name = self.field_name
+        if not records or not field_name or field_name not in records._fields:
+            return lambda record: demo_value
+        
+        # Format based on field type
+        if self.field_type == 'date':
+            format_value = lambda value: value.strftime('%d/%m/%Y') if value else ''
+        elif self.field_type == 'datetime':
+            format_value = lambda value: value.strftime('%d/%m/%Y %H:%M') if value else ''
+        elif self.field_type == 'many2one':
+            format_value = lambda value: value.display_name if value else ''
+        elif self.field_type == 'float':
+            format_value = lambda value: f'{value:.2f}'
+        else:
+            format_value = lambda value: str(value) if value else ''
         
-        if not record or not self.field_name:
-            return self.demo_value or ''
+        def formatter(record):
+            try:
+                return format_value(record[field_name])
+            except Exception:
+                return demo_value
         
-        try:
-            value = record[self.field_name]
-            
-            # Format based on field type
-            if self.field_type == 'date' and value:
-                return value.strftime('%d/%m/%Y')
-            elif self.field_type == 'datetime' and value:
-                return value.strftime('%d/%m/%Y %H:%M')
-            elif self.field_type == 'many2one' and value:
-                return value.display_name
-            elif self.field_type == 'float':
-                return f'{value:.2f}'
-            
-            return str(value) if value else ''
-            
-        except Exception:
-            return self.demo_value or ''
+        return formatter
 
 
 class WahaTemplateButton(models.Model):
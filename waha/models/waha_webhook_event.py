@@ -0,0 +1,626 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from psycopg2 import errors
+
+from odoo import models, fields, api
+from odoo.exceptions import ConcurrencyError
+from odoo.addons.waha.tools.concurrency import is_concurrency_error, try_lock
+from odoo.addons.waha.tools.waha_jid import normalize_jid
+
+_logger = logging.getLogger(__name__)
+
+# Unique constraint of waha.message on (msg_uid, wa_account_id)
+MESSAGE_UID_CONSTRAINT = 'waha_message_unique_msg_uid'
+
+
+class WahaWebhookEvent(models.Model):
+    """
+    WAHA Webhook Event - Durable staging queue for incoming webhooks
+
+    Responsibilities:
+    - Store raw webhook events as fast as possible (queued webhook mode)
+    - Drain pending events from a cron and dispatch them to the handlers
+    - Hold the ingestion logic shared by the queued and immediate modes
+    - Keep failed events around for inspection and retry
+
+    Delegates:
+    - Message creation → waha.message
+    - Status updates → waha.message / waha.account
+    """
+    _name = 'waha.webhook.event'
+    _description = 'WAHA Webhook Event'
+    _order = 'id'
+    _rec_name = 'event'
+
+    # Events are retried this many times before being marked as failed
+    _max_attempts = 3
+
+    # ============================================================
+    # FIELDS
+    # ============================================================
+
+    wa_account_id = fields.Many2one(
+        'waha.account',
+        string="WhatsApp Account",
+        ondelete='cascade',
+        index=True
+    )
+
+    session_name = fields.Char(string="Session Name", index=True)
+
+    event = fields.Char(
+        string="Event Type",
+        index=True,
+        help="WAHA event name (message, message.ack, session.status, ...)"
+    )
+
+    payload = fields.Json(
+        string="Raw Event",
+        help="Complete JSON body received from WAHA"
+    )
+
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Processed'),
+        ('error', 'Failed'),
+    ], string="State", default='pending', required=True, index=True)
+
+    attempts = fields.Integer(string="Attempts", default=0)
+    error_message = fields.Text(string="Error")
+    processed_date = fields.Datetime(string="Processed Date")
+
+    # ============================================================
+    # QUEUE
+    # ============================================================
+
+    @api.model
+    def _enqueue(self, data, account):
+        """
+        Stage a raw webhook event for asynchronous processing
+
+        Only inserts the row and wakes up the drain cron, so the
+        webhook can answer WAHA immediately.
+
+        Args:
+            data: Decoded webhook JSON
+            account: waha.account the event belongs to
+
+        Returns:
+            waha.webhook.event record
+        """
+        event = self.create({
+            'wa_account_id': account.id,
+            'session_name': data.get('session'),
+            'event': data.get('event'),
+            'payload': data,
+        })
+        cron = self.env.ref('waha.ir_cron_waha_process_webhook_events', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+        return event
+
+    @api.model
+    def _get_batch_size(self):
+        """Number of events drained per transaction (waha.webhook_batch_size)"""
+        return int(self.env['ir.config_parameter'].sudo().get_param('waha.webhook_batch_size', 200))
+
+    @api.model
+    def _cron_process_events(self, max_batches=10, auto_commit=True):
+        """
+        Cron job draining pending webhook events in arrival order
+
+        Events are processed in batches, one transaction per batch.
+
+        Args:
+            max_batches: Batches handled before yielding to other crons
+            auto_commit: Commit after each batch (disabled in tests)
+        """
+        batch_size = self._get_batch_size()
+
+        for _i in range(max_batches):
+            events = self.search([('state', '=', 'pending')], limit=batch_size)
+            if not events:
+                return
+
+            _logger.info('Processing batch of %d queued WAHA webhook events', len(events))
+            events._process_batch()
+
+            if auto_commit:
+                self.env.cr.commit()
+
+            if len(events) < batch_size:
+                return
+
+        # Keep draining while there is backlog
+        self.env.ref('waha.ir_cron_waha_process_webhook_events')._trigger()
+
+    def _process_batch(self):
+        """
+        Process a batch of events grouped by event type
+
+        Each group is first handled with bulk ORM operations inside one
+        savepoint. If that fails, the group falls back to one savepoint
+        per event so a single poison event doesn't roll back the others.
+        """
+        bulk_handlers = {
+            'message': '_process_message_events',
+            'message.ack': '_process_ack_events',
+            'session.status': '_process_session_status_events',
+        }
+
+        groups = defaultdict(lambda: self.browse())
+        for event in self:
+            groups[event.event] |= event
+
+        failures = {}
+        retry_later = self.browse()
+        for event_type, events in groups.items():
+            handler = bulk_handlers.get(event_type)
+            if not handler:
+                _logger.info('Unhandled event type: %s', event_type)
+                continue
+
+            try:
+                with self.env.cr.savepoint():
+                    # Handlers return the events to retry later, if any
+                    retry_later |= getattr(events, handler)() or self.browse()
+            except Exception as e:
+                _logger.warning(
+                    'Bulk processing of %d %s events failed (%s), retrying one by one',
+                    len(events), event_type, str(e)
+                )
+                for event in events:
+                    try:
+                        with self.env.cr.savepoint():
+                            self._process_event_data(event.payload or {}, event.wa_account_id)
+                    except Exception as e:
+                        if is_concurrency_error(e):
+                            # Not the event's fault: keep it pending, attempts untouched
+                            _logger.info('Queued webhook event %s conflicts with another worker, '
+                                         'retried on the next run: %s', event.id, str(e))
+                            retry_later |= event
+                            continue
+                        _logger.exception('Error processing queued webhook event %s: %s', event.id, str(e))
+                        failures[event] = str(e)
+
+        processed = self.filtered(lambda event: event not in failures and event not in retry_later)
+        processed.write({
+            'state': 'done',
+            'processed_date': fields.Datetime.now(),
+            'error_message': False,
+        })
+
+        for event, error in failures.items():
+            attempts = event.attempts + 1
+            event.write({
+                'state': 'error' if attempts >= self._max_attempts else 'pending',
+                'attempts': attempts,
+                'error_message': error,
+            })
+
+        if retry_later:
+            # Give the other worker time to commit
+            self.env.ref('waha.ir_cron_waha_process_webhook_events')._trigger(
+                fields.Datetime.now() + timedelta(seconds=10)
+            )
+
+    def _process_message_events(self):
+        """
+        Bulk-ingest 'message' events
+
+        One search for all msg_uids of the batch, one create() for all
+        new messages, then the per-message post-processing. Messages
+        claimed by another worker (duplicate deliveries) are left for
+        the next run, in case that worker rolls back.
+
+        Returns:
+            waha.webhook.event recordset: Events to keep pending
+        """
+        Message = self.env['waha.message']
+
+        keys = {}
+        for event in self:
+            payload = (event.payload or {}).get('payload', {})
+            if event.wa_account_id and payload.get('id'):
+                keys[event] = (event.wa_account_id.id, payload['id'])
+
+        # Single duplicate check for the whole batch
+        existing = set()
+        if keys:
+            for message in Message.search([
+                ('msg_uid', 'in', list({uid for _account_id, uid in keys.values()})),
+                ('wa_account_id', 'in', list({account_id for account_id, _uid in keys.values()})),
+            ]):
+                existing.add((message.wa_account_id.id, message.msg_uid))
+
+        identities = self.env['waha.identity']._observe_payloads([
+            (event.wa_account_id, event.payload.get('payload', {})) for event in keys
+        ])
+
+        # Messages of duplicate deliveries ingested by another worker right now
+        busy = try_lock(self.env.cr, [
+            f'waha.message:{account_id}:{uid}' for account_id, uid in keys.values() if (account_id, uid) not in existing
+        ])
+
+        vals_list = []
+        retry_later = self.browse()
+        for event, key in keys.items():
+            if key in existing:
+                _logger.info('Message already exists: %s', key[1])
+                continue
+            if f'waha.message:{key[0]}:{key[1]}' in busy:
+                _logger.info('Message %s is being ingested by another worker, retried later', key[1])
+                retry_later |= event
+                continue
+            # Also skip duplicates delivered twice within the batch
+            existing.add(key)
+            payload = event.payload.get('payload', {})
+            vals_list.append(self._prepare_message_vals(payload, event.wa_account_id, identities))
+
+        if not vals_list:
+            return retry_later
+
+        messages = self._create_messages(vals_list)
+        _logger.info('Created %d waha.message records from webhook batch', len(messages))
+
+        # Chat counters are applied once per chat for the whole batch
+        counters = {}
+        for message in messages:
+            self._post_process_message(message, counters)
+        self.env['waha.chat']._apply_counters(counters)
+        return retry_later
+
+    def _process_ack_events(self):
+        """Bulk-apply 'message.ack' events, last ACK per message wins"""
+        acks = {}
+        for event in self:
+            payload = (event.payload or {}).get('payload', {})
+            if event.wa_account_id and payload.get('id'):
+                acks[(event.wa_account_id.id, payload['id'])] = payload.get('ack', 0)
+
+        if not acks:
+            return
+
+        messages = self.env['waha.message'].search([
+            ('msg_uid', 'in', list({uid for _account_id, uid in acks})),
+            ('wa_account_id', 'in', list({account_id for account_id, _uid in acks})),
+        ])
+        messages._update_status_from_acks({
+            message.msg_uid: acks[(message.wa_account_id.id, message.msg_uid)]
+            for message in messages
+            if (message.wa_account_id.id, message.msg_uid) in acks
+        })
+
+    def _process_session_status_events(self):
+        """Apply only the latest 'session.status' event of each account"""
+        latest = {}
+        for event in self:
+            if event.wa_account_id:
+                latest[event.wa_account_id] = event
+
+        for account, event in latest.items():
+            self._handle_session_status(event.payload or {}, account)
+
+    @api.autovacuum
+    def _gc_processed_events(self):
+        """Remove processed events older than a week"""
+        limit_date = fields.Datetime.now() - timedelta(days=7)
+        self.search([
+            ('state', '=', 'done'),
+            ('processed_date', '<', limit_date),
+        ]).unlink()
+
+    def action_retry(self):
+        """Put failed events back in the queue"""
+        self.write({'state': 'pending', 'attempts': 0, 'error_message': False})
+        self.env.ref('waha.ir_cron_waha_process_webhook_events')._trigger()
+
+    # ============================================================
+    # EVENT HANDLERS
+    # ============================================================
+
+    @api.model
+    def _process_event_data(self, data, account):
+        """
+        Dispatch a webhook event to its handler
+
+        Args:
+            data: Decoded webhook JSON
+            account: waha.account the event belongs to
+        """
+        event = data.get('event')
+
+        if event == 'message':
+            self._handle_incoming_message(data, account)
+        elif event == 'message.ack':
+            self._handle_message_ack(data)
+        elif event == 'session.status':
+            self._handle_session_status(data, account)
+        else:
+            _logger.info('Unhandled event type: %s', event)
+
+    @api.model
+    def _handle_incoming_message(self, data, account):
+        """
+        Handle incoming message webhook
+
+        Creates waha.message from WAHA webhook payload.
+        Orchestrates the creation of message, chat, and partner records.
+        """
+        payload = data.get('payload', {})
+        msg_uid = payload.get('id')
+
+        _logger.info('=== Processing incoming message: %s ===', msg_uid)
+
+        if not account:
+            _logger.warning('No account found for session: %s', data.get('session'))
+            return
+
+        # Check if message already exists
+        existing = self.env['waha.message'].search([
+            ('msg_uid', '=', msg_uid),
+            ('wa_account_id', '=', account.id)
+        ], limit=1)
+
+        if existing:
+            _logger.info('Message already exists: %s', existing.id)
+            return
+
+        # Another worker is ingesting the same message (duplicate delivery):
+        # retry once it is done, in case it rolls back
+        if try_lock(self.env.cr, [f'waha.message:{account.id}:{msg_uid}']):
+            raise ConcurrencyError('Message %s is being ingested by another worker' % msg_uid)
+
+        identities = self.env['waha.identity']._observe_payloads([(account, payload)])
+        message = self._create_messages([self._prepare_message_vals(payload, account, identities)])
+        if not message:
+            return
+        _logger.info('Created waha.message: %s (type=%s, relations auto-computed)',
+                     message.id, message.message_type)
+
+        self._post_process_message(message)
+
+    @api.model
+    def _create_messages(self, vals_list):
+        """
+        Create waha.message records, skipping those ingested concurrently
+
+        Messages are created at once. If one of them was committed by
+        another worker after this transaction started, they are created
+        one by one, each in a savepoint, and the duplicates skipped: the
+        rest of the work is kept.
+
+        Returns:
+            waha.message recordset of the created messages
+        """
+        Message = self.env['waha.message']
+        try:
+            with self.env.cr.savepoint():
+                return Message.create(vals_list)
+        except errors.UniqueViolation as e:
+            if e.diag.constraint_name != MESSAGE_UID_CONSTRAINT:
+                raise
+
+        messages = Message
+        for vals in vals_list:
+            try:
+                with self.env.cr.savepoint():
+                    messages |= Message.create(vals)
+            except errors.UniqueViolation as e:
+                if e.diag.constraint_name != MESSAGE_UID_CONSTRAINT:
+                    raise
+                _logger.info('Message %s was ingested by another worker', vals.get('msg_uid'))
+        return messages
+
+    @api.model
+    def _prepare_message_vals(self, payload, account, identities=None):
+        """
+        Build waha.message values from a WAHA message payload
+
+        Only raw fields are set; relationships are auto-computed.
+
+        Args:
+            payload: WAHA message payload
+            account: waha.account record
+            identities: dict (account id, JID) -> phone of the observed
+                JIDs, resolving a sender known by its LID to its phone
+        """
+        context = self._extract_message_context(payload)
+        sender_jid = normalize_jid(context['participant'] if context['is_group'] else context['chat_id'])
+        if sender_jid and sender_jid.endswith('@lid'):
+            sender_phone = (identities or {}).get((account.id, sender_jid))
+            if sender_phone:
+                context['sender_phone'] = sender_phone
+
+        vals = {
+            'msg_uid': context['msg_uid'],
+            'wa_account_id': account.id,
+            'message_type': 'outbound' if context['from_me'] else 'inbound',
+            'state': 'sent' if context['from_me'] else 'received',
+            'body': context['body'],
+            'raw_chat_id': context['chat_id'],
+            'raw_sender_phone': context['sender_phone'],
+            'wa_timestamp': context['wa_timestamp'],
+            'raw_payload': self.env['waha.message']._slim_payload(payload),
+        }
+
+        if context['participant']:
+            vals['participant_id'] = context['participant']
+
+        return vals
+
+    @api.model
+    def _post_process_message(self, message, counters=None):
+        """
+        Finish ingestion of a freshly created waha.message
+
+        Checks the auto-computed relations, downloads media and updates
+        the chat metadata. Errors are logged, never raised: the message
+        itself is already stored.
+
+        Args:
+            message: waha.message record
+            counters: Pending chat counters of the batch (see
+                waha.chat._add_to_counters), None to update the chat now
+        """
+        try:
+            with self.env.cr.savepoint():
+                # Get auto-computed chat and partner
+                chat = message.waha_chat_id
+                partner = message.partner_id
+
+                _logger.info('Auto-computed relations: chat=%s, partner=%s, mail_message=%s',
+                             chat.id if chat else None,
+                             partner.id if partner else None,
+                             message.mail_message_id.id if message.mail_message_id else None)
+
+                if not chat:
+                    _logger.error('Failed to auto-compute chat for message %s', message.id)
+                    return
+
+                # Only create discuss.message for INBOUND messages
+                # Outbound messages already have mail_message_id from _compute_mail_message_id
+                if message.message_type == 'inbound':
+                    if not partner:
+                        _logger.warning('No partner for inbound message %s', message.id)
+
+                    # Create discuss.message in channel (auto-computed)
+                    discuss_channel = chat.discuss_channel_id
+                    if discuss_channel and message.mail_message_id:
+                        _logger.info('Discuss message auto-created: %s', message.mail_message_id.id)
+                    else:
+                        _logger.warning('Failed to auto-create discuss message for %s', message.id)
+                else:
+                    _logger.info('Skipping discuss.message for outbound message (already exists)')
+
+                # Queue media attachments (downloaded by the media cron)
+                message.process_payload_media()
+
+                # Update chat metadata
+                if counters is None:
+                    chat.update_last_message(message.wa_timestamp)
+                else:
+                    chat._add_to_counters(counters, chat.id, message.wa_timestamp)
+
+                _logger.info('Successfully processed incoming message: %s', message.id)
+        except Exception as e:
+            _logger.exception('Error post-processing message %s: %s', message.id, str(e))
+
+    @api.model
+    def _extract_message_context(self, payload):
+        """
+        Extract and normalize message context from WAHA payload
+
+        Returns:
+            dict with parsed message information
+        """
+        # Extract basic info
+        from_raw = payload.get('from', '')
+        from_me = payload.get('fromMe', False)
+        participant = payload.get('participant', '')
+
+        # Determine chat type
+        is_group = '@g.us' in from_raw
+        chat_id = from_raw
+
+        # Extract sender phone
+        if is_group and participant:
+            sender_phone = participant.split('@')[0]
+        else:
+            sender_phone = from_raw.split('@')[0]
+
+        # Extract content
+        body = payload.get('body', '')
+        if isinstance(body, dict):
+            body = body.get('text', '') or str(body)
+        elif not isinstance(body, str):
+            body = str(body) if body else ''
+
+        # Extract timestamp
+        timestamp_value = payload.get('timestamp')
+        wa_timestamp = None
+        if timestamp_value:
+            try:
+                wa_timestamp = datetime.fromtimestamp(int(timestamp_value))
+            except (ValueError, TypeError):
+                wa_timestamp = fields.Datetime.now()
+
+        return {
+            'msg_uid': payload.get('id'),
+            'from_me': from_me,
+            'chat_id': chat_id,
+            'is_group': is_group,
+            'sender_phone': sender_phone,
+            'participant': participant,
+            'body': body,
+            'wa_timestamp': wa_timestamp or fields.Datetime.now(),
+        }
+
+    @api.model
+    def _handle_message_ack(self, data):
+        """
+        Handle message acknowledgment webhook
+
+        ACK values:
+        - 0: ERROR
+        - 1: PENDING
+        - 2: SERVER
+        - 3: DEVICE
+        - 4: READ
+        - 5: PLAYED
+        """
+        payload = data.get('payload', {})
+        msg_uid = payload.get('id')
+
+        if not msg_uid:
+            _logger.warning('No message ID in ACK webhook')
+            return
+
+        # Find message by msg_uid
+        message = self.env['waha.message'].search([
+            ('msg_uid', '=', msg_uid)
+        ], limit=1)
+
+        if not message:
+            _logger.warning('Message not found for ACK: %s', msg_uid)
+            return
+
+        # Delegate to waha.message.update_status_from_webhook
+        message.update_status_from_webhook(payload)
+
+    @api.model
+    def _handle_session_status(self, data, account):
+        """
+        Handle session status change webhook
+
+        Status values:
+        - STOPPED
+        - STARTING
+        - SCAN_QR_CODE
+        - WORKING
+        - FAILED
+        """
+        payload = data.get('payload', {})
+        status = payload.get('status')
+
+        if not account:
+            _logger.warning('No account found for session: %s', data.get('session'))
+            return
+
+        # Map WAHA status to account status
+        status_mapping = {
+            'STOPPED': 'disconnected',
+            'STARTING': 'connecting',
+            'SCAN_QR_CODE': 'connecting',
+            'WORKING': 'connected',
+            'FAILED': 'error',
+        }
+
+        new_status = status_mapping.get(status)
+        if new_status and new_status != account.status:
+            account.write({'status': new_status})
+            _logger.info('Account %s status updated to: %s', account.name, new_status)
@@ -0,0 +1,8 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from . import test_waha_chat
+from . import test_waha_webhook_event
+from . import test_waha_message_payload
+from . import test_res_partner
+from . import test_concurrency
+from . import test_waha_outbox
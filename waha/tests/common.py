@@ -0,0 +1,49 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from unittest.mock import patch
+
+from odoo.tests.common import TransactionCase
+from odoo.addons.waha.tools.waha_api import WahaApi
+
+
+class WahaCommon(TransactionCase):
+    """
+    Account and chat shared by the WAHA tests
+
+    There is no WAHA server in tests: every API call answers as if
+    nothing was found (no contact, no group info).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.startClassPatcher(patch.object(WahaApi, '_make_request', return_value={}))
+
+        cls.account = cls.env['waha.account'].create({
+            'name': 'Test Account',
+            'session_name': 'waha_test',
+        })
+        cls.chat = cls.env['waha.chat'].create({
+            'name': 'Test Contact',
+            'wa_chat_id': '33600000001@c.us',
+            'wa_account_id': cls.account.id,
+        })
+
+    def _create_event(self, event, payload):
+        """Stage a webhook event of the test account, as _enqueue does"""
+        return self.env['waha.webhook.event'].create({
+            'wa_account_id': self.account.id,
+            'session_name': self.account.session_name,
+            'event': event,
+            'payload': {'event': event, 'session': self.account.session_name, 'payload': payload},
+        })
+
+    def _create_message_event(self, msg_uid, sender='33600000001', body='Hello'):
+        """Stage an inbound 'message' event"""
+        return self._create_event('message', {
+            'id': msg_uid,
+            'from': f'{sender}@c.us',
+            'fromMe': False,
+            'body': body,
+            'timestamp': 1700000000,
+        })
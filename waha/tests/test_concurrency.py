@@ -0,0 +1,76 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.exceptions import ConcurrencyError
+from odoo.sql_db import db_connect
+from odoo.tests import tagged
+from odoo.tools import mute_logger
+
+from odoo.addons.waha.tests.common import WahaCommon
+from odoo.addons.waha.tools.concurrency import try_lock
+
+
+@tagged('post_install', '-at_install')
+class TestWahaConcurrency(WahaCommon):
+    """Ingestion racing another worker, simulated with a second connection"""
+
+    def _get_messages(self, msg_uid):
+        return self.env['waha.message'].search([
+            ('msg_uid', '=', msg_uid),
+            ('wa_account_id', '=', self.account.id),
+        ])
+
+    def test_try_lock(self):
+        keys = ['waha.test:1', 'waha.test:2']
+        self.assertEqual(try_lock(self.env.cr, keys), set())
+        # Keys held by this transaction are not busy for it
+        self.assertEqual(try_lock(self.env.cr, keys + ['waha.test:3']), set())
+
+        with db_connect(self.env.cr.dbname).cursor() as other_cr:
+            self.assertEqual(try_lock(other_cr, keys + ['waha.test:4']), set(keys))
+
+    def test_chat_and_contact_created_by_other_worker(self):
+        chat_id = '33600000005@c.us'
+        with db_connect(self.env.cr.dbname).cursor() as other_cr:
+            try_lock(other_cr, [f'waha.chat:{self.account.id}:{chat_id}', 'waha.partner:33600000005'])
+
+            with self.assertRaises(ConcurrencyError):
+                self.env['waha.chat']._find_or_create_many({(chat_id, self.account.id): None})
+            with self.assertRaises(ConcurrencyError):
+                self.env['waha.partner']._find_or_create_by_phones([(chat_id, self.account)], auto_enrich=False)
+
+        self.assertFalse(self.env['waha.chat'].search([('wa_chat_id', '=', chat_id)]))
+
+    def test_message_ingested_by_other_worker(self):
+        busy_event = self._create_message_event('msg_busy')
+        free_event = self._create_message_event('msg_free')
+
+        with db_connect(self.env.cr.dbname).cursor() as other_cr:
+            try_lock(other_cr, [f'waha.message:{self.account.id}:msg_busy'])
+            (busy_event | free_event)._process_batch()
+
+            # Kept pending for the next run, not counted as a failed attempt
+            self.assertEqual(busy_event.state, 'pending')
+            self.assertEqual(busy_event.attempts, 0)
+            self.assertFalse(self._get_messages('msg_busy'))
+            self.assertEqual(free_event.state, 'done')
+            self.assertEqual(len(self._get_messages('msg_free')), 1)
+
+            with self.assertRaises(ConcurrencyError):
+                self.env['waha.webhook.event']._handle_incoming_message(busy_event.payload, self.account)
+
+    def test_create_messages_skips_duplicates(self):
+        self._create_message_event('msg_first')._process_batch()
+
+        WebhookEvent = self.env['waha.webhook.event']
+        vals_list = [
+            WebhookEvent._prepare_message_vals(
+                {'id': msg_uid, 'from': '33600000001@c.us', 'body': 'Hello', 'timestamp': 1700000000},
+                self.account,
+            )
+            for msg_uid in ('msg_first', 'msg_second')
+        ]
+        with mute_logger('odoo.sql_db'):
+            messages = WebhookEvent._create_messages(vals_list)
+
+        self.assertEqual(messages.mapped('msg_uid'), ['msg_second'])
+        self.assertEqual(len(self._get_messages('msg_first')), 1)
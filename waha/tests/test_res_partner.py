@@ -0,0 +1,68 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tests import tagged
+
+from odoo.addons.waha.tests.common import WahaCommon
+
+
+@tagged('post_install', '-at_install')
+class TestWahaPartnerNumbers(WahaCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.france = cls.env.ref('base.fr')
+        cls.belgium = cls.env.ref('base.be')
+
+    def test_international_numbers(self):
+        partner = self.env['res.partner'].create({
+            'name': 'International',
+            'mobile': '+33 6 12 34 56 78',
+            'phone': '0032 470 12 34 56',
+        })
+        self.assertEqual(partner.wa_mobile_normalized, '33612345678')
+        self.assertEqual(partner.wa_phone_normalized, '32470123456')
+
+        partner.mobile = False
+        self.assertFalse(partner.wa_mobile_normalized)
+        self.assertEqual(partner.wa_phone_normalized, '32470123456')
+
+    def test_local_numbers(self):
+        partner = self.env['res.partner'].create({
+            'name': 'Local',
+            'country_id': self.france.id,
+            'mobile': '06 12 34 56 78',
+        })
+        self.assertEqual(partner.wa_mobile_normalized, '33612345678')
+
+        # Without a country, the country of the partner's company applies,
+        # whatever the company of the user writing
+        company = self.env['res.company'].create({'name': 'Belgian Company', 'country_id': self.belgium.id})
+        partner.write({'country_id': False, 'company_id': company.id, 'mobile': '0470 12 34 56'})
+        self.assertEqual(partner.wa_mobile_normalized, '32470123456')
+        self.assertEqual(
+            partner.with_company(self.env.ref('base.main_company'))._wa_normalize_phone('0470 12 34 56'),
+            '32470123456',
+        )
+
+    def test_find_by_numbers(self):
+        Partner = self.env['res.partner']
+        by_phone = Partner.create({'name': 'By Phone', 'mobile': '+33 6 11 11 11 11', 'phone': '+33 6 22 22 22 22'})
+        by_mobile = Partner.create({'name': 'By Mobile', 'mobile': '+33 6 22 22 22 22'})
+
+        self.assertEqual(Partner._wa_find_by_numbers(['33611111111', '33622222222', '33600000009']), {
+            '33611111111': by_phone,
+            # The mobile of a newer partner wins over the phone of an older one
+            '33622222222': by_mobile,
+        })
+
+    def test_whatsapp_number_in_phone(self):
+        partner = self.env['res.partner'].create({
+            'name': 'Office Mobile',
+            'mobile': '+33 6 33 33 33 33',
+            'phone': '+33 6 44 44 44 44',
+        })
+        partners = self.env['waha.partner']._find_or_create_by_phones(
+            [('33644444444@c.us', self.account)], auto_enrich=False
+        )
+        self.assertEqual(partners[('33644444444@c.us', self.account.id)], partner)
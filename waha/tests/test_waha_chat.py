@@ -0,0 +1,76 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from datetime import datetime
+
+from odoo.tests import tagged
+
+from odoo.addons.waha.tests.common import WahaCommon
+
+
+@tagged('post_install', '-at_install')
+class TestWahaChatCounters(WahaCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.other_chat = cls.env['waha.chat'].create({
+            'name': 'Other Contact',
+            'wa_chat_id': '33600000002@c.us',
+            'wa_account_id': cls.account.id,
+        })
+        cls.earlier = datetime(2024, 1, 1, 9, 0, 0)
+        cls.later = datetime(2024, 1, 1, 10, 0, 0)
+
+    def test_update_last_message(self):
+        self.chat.update_last_message(self.later)
+        # A message delivered late does not move the last message time back
+        self.chat.update_last_message(self.earlier)
+
+        self.assertEqual(self.chat.message_count, 2)
+        self.assertEqual(self.chat.last_message_time, self.later)
+        self.assertEqual(self.chat.unread_count, 0)
+
+    def test_increment_unread(self):
+        self.chat.increment_unread()
+        self.chat.increment_unread(2)
+        self.assertEqual(self.chat.unread_count, 3)
+
+        # Pending ORM writes are flushed before the SQL increment
+        self.chat.mark_as_read()
+        self.chat.increment_unread()
+        self.assertEqual(self.chat.unread_count, 1)
+        self.assertEqual(self.chat.message_count, 0)
+
+    def test_add_to_counters(self):
+        Chat = self.env['waha.chat']
+        counters = {}
+        Chat._add_to_counters(counters, self.chat.id, self.later)
+        Chat._add_to_counters(counters, self.chat.id, self.earlier, unread=1)
+        Chat._add_to_counters(counters, self.other_chat.id, self.earlier)
+
+        self.assertEqual(counters, {
+            self.chat.id: (2, 1, self.later),
+            self.other_chat.id: (1, 0, self.earlier),
+        })
+
+    def test_apply_counters(self):
+        self.other_chat.write({'last_message_time': self.later, 'message_count': 5})
+
+        self.env['waha.chat']._apply_counters({
+            self.chat.id: (3, 2, self.earlier),
+            self.other_chat.id: (1, 1, self.earlier),
+        })
+
+        self.assertEqual(self.chat.message_count, 3)
+        self.assertEqual(self.chat.unread_count, 2)
+        self.assertEqual(self.chat.last_message_time, self.earlier)
+        self.assertEqual(self.other_chat.message_count, 6)
+        self.assertEqual(self.other_chat.unread_count, 1)
+        self.assertEqual(self.other_chat.last_message_time, self.later)
+
+    def test_apply_counters_without_time(self):
+        self.chat.last_message_time = self.later
+        self.env['waha.chat']._apply_counters({self.chat.id: (0, 1, None)})
+
+        self.assertEqual(self.chat.unread_count, 1)
+        self.assertEqual(self.chat.last_message_time, self.later)
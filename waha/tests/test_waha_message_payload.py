@@ -0,0 +1,75 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tests import tagged
+
+from odoo.addons.waha.models.waha_message_payload import LEGACY_COLUMN
+from odoo.addons.waha.tests.common import WahaCommon
+
+
+@tagged('post_install', '-at_install')
+class TestWahaMessagePayload(WahaCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.payload = {'id': 'msg_payload', 'from': '33600000001@c.us', 'body': 'Hello ' * 50}
+        cls.message = cls.env['waha.message'].create({
+            'wa_account_id': cls.account.id,
+            'message_type': 'outbound',
+            'state': 'sent',
+            'msg_uid': 'msg_payload',
+            'body': 'Hello',
+            'raw_payload': cls.payload,
+        })
+
+    def _get_record(self, message):
+        return self.env['waha.message.payload'].search([('message_id', '=', message.id)])
+
+    def test_round_trip(self):
+        self.env.invalidate_all()
+        self.assertEqual(self.message.raw_payload, self.payload)
+
+        record = self._get_record(self.message)
+        self.assertEqual(len(record), 1)
+        self.assertLess(record.compressed_size, record.size)
+
+        self.message.raw_payload = dict(self.payload, body='Edited')
+        self.env.invalidate_all()
+        self.assertEqual(self.message.raw_payload['body'], 'Edited')
+        self.assertEqual(self._get_record(self.message), record)
+
+        self.message.raw_payload = False
+        self.env.invalidate_all()
+        self.assertFalse(self.message.raw_payload)
+        self.assertFalse(record.exists())
+
+    def test_legacy_payloads(self):
+        Payload = self.env['waha.message.payload']
+        legacy_message = self.env['waha.message'].create({
+            'wa_account_id': self.account.id,
+            'message_type': 'outbound',
+            'state': 'sent',
+            'msg_uid': 'msg_legacy',
+            'body': 'Hello',
+        })
+        # Database upgraded from before 1.3, rolled back with the test
+        self.env.cr.execute(f"ALTER TABLE waha_message ADD COLUMN {LEGACY_COLUMN} jsonb")
+        self.env.cr.execute(
+            f"UPDATE waha_message SET {LEGACY_COLUMN} = %s::jsonb WHERE id = %s",
+            ['{"id": "msg_legacy", "body": "Old"}', legacy_message.id]
+        )
+        self.env.registry.clear_cache()
+        self.addCleanup(self.env.registry.clear_cache)
+
+        self.env.invalidate_all()
+        self.assertEqual(legacy_message.raw_payload, {'id': 'msg_legacy', 'body': 'Old'})
+        self.assertEqual(self.message.raw_payload, self.payload)
+
+        Payload._cron_migrate_legacy_payloads(auto_commit=False)
+
+        self.assertEqual(self._get_record(legacy_message)._decompress(), {'id': 'msg_legacy', 'body': 'Old'})
+        self.env.cr.execute(f"SELECT count(*) FROM waha_message WHERE {LEGACY_COLUMN} IS NOT NULL")
+        self.assertEqual(self.env.cr.fetchone()[0], 0)
+        self.assertFalse(Payload._has_legacy_payloads())
+        self.env.invalidate_all()
+        self.assertEqual(legacy_message.raw_payload, {'id': 'msg_legacy', 'body': 'Old'})
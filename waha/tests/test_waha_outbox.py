@@ -0,0 +1,167 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from unittest.mock import patch
+
+from odoo.tests import tagged
+from odoo.tools import mute_logger
+
+from odoo.addons.waha.tests.common import WahaCommon
+from odoo.addons.waha.tools.waha_api import WahaApi
+
+
+class WahaOutboxCommon(WahaCommon):
+    """
+    Outbox on a connected account
+
+    WahaApi.send_text records its calls and answers with a message id,
+    or fails for the texts listed in failing_texts.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.account.status = 'connected'
+
+    def setUp(self):
+        super().setUp()
+        self.sent_texts = []
+        self.failing_texts = set()
+
+        def send_text(chat_id, text, reply_to=None):
+            self.sent_texts.append((chat_id, text))
+            if text in self.failing_texts:
+                raise Exception('WAHA refused %s' % text)
+            return {'id': 'wamid_%s' % text}
+
+        patcher = patch.object(WahaApi, 'send_text', side_effect=send_text)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _queue(self, number, body, **extra_vals):
+        """Queue an outbound text message, as the composer does"""
+        Message = self.env['waha.message']
+        return Message.create(Message._prepare_outbound_vals(self.account, number, body, **extra_vals))
+
+    def _dispatch(self):
+        self.env['waha.message']._cron_dispatch_outbox(auto_commit=False)
+
+
+@tagged('post_install', '-at_install')
+class TestWahaOutbox(WahaOutboxCommon):
+
+    def test_send_from_outbox(self):
+        message = self._queue('+33 6 00 00 00 01', 'Hello')
+
+        # Creating the message only queues it
+        self.assertEqual(message.state, 'outgoing')
+        self.assertFalse(self.sent_texts)
+
+        self._dispatch()
+
+        self.assertEqual(self.sent_texts, [('33600000001@c.us', 'Hello')])
+        self.assertEqual(message.state, 'sent')
+        self.assertEqual(message.msg_uid, 'wamid_Hello')
+        self.assertTrue(message.sent_date)
+
+        # Sent once: the next run has nothing to do
+        self._dispatch()
+        self.assertEqual(len(self.sent_texts), 1)
+
+    def test_send_failure(self):
+        message = self._queue('+33 6 00 00 00 01', 'Refused')
+        self.failing_texts.add('Refused')
+
+        with mute_logger('odoo.addons.waha.models.waha_message'):
+            self._dispatch()
+
+        self.assertEqual(message.state, 'error')
+        self.assertFalse(message.msg_uid)
+        self.assertIn('WAHA refused', message.failure_reason)
+
+        # Failed messages wait for a manual retry
+        self._dispatch()
+        self.assertEqual(len(self.sent_texts), 1)
+
+    def test_claim_for_send(self):
+        queued = self._queue('+33 6 00 00 00 01', 'Queued')
+        sent = self._queue('+33 6 00 00 00 01', 'Sent elsewhere')
+        cancelled = self._queue('+33 6 00 00 00 01', 'Cancelled')
+        sent.write({'state': 'sent', 'msg_uid': 'wamid_other'})
+        cancelled.state = 'cancel'
+
+        self.assertEqual((queued | sent | cancelled)._claim_for_send(), queued)
+
+    def test_disconnected_account(self):
+        message = self._queue('+33 6 00 00 00 01', 'Hello')
+        self.account.status = 'disconnected'
+
+        self._dispatch()
+
+        self.assertFalse(self.sent_texts)
+        self.assertEqual(message.state, 'outgoing')
+
+
+@tagged('post_install', '-at_install')
+class TestWahaOutboxThrottle(WahaOutboxCommon):
+
+    def test_send_burst(self):
+        # The bucket does not refill during the test
+        self.account.write({'send_rate': 0.0001, 'send_burst': 2})
+        messages = self._queue('+33 6 00 00 00 01', 'First') \
+            | self._queue('+33 6 00 00 00 01', 'Second') \
+            | self._queue('+33 6 00 00 00 01', 'Third')
+
+        self._dispatch()
+
+        self.assertEqual(messages.mapped('state'), ['sent', 'sent', 'outgoing'])
+        self.assertLess(self.account.send_tokens, 1)
+        self.assertTrue(self.account.send_tokens_time)
+
+        # The next run continues from the stored level, not from a full bucket
+        self._dispatch()
+        self.assertEqual(len(self.sent_texts), 2)
+        self.assertEqual(messages[2].state, 'outgoing')
+
+    def test_paused_account(self):
+        self.account.send_rate = 0
+        message = self._queue('+33 6 00 00 00 01', 'Hello')
+
+        self._dispatch()
+
+        self.assertFalse(self.sent_texts)
+        self.assertEqual(message.state, 'outgoing')
+
+    def test_interactive_first(self):
+        self.account.write({'send_rate': 0.0001, 'send_burst': 1})
+        bulk = self._queue('+33 6 00 00 00 01', 'Bulk', priority='0')
+        reply = self._queue('+33 6 00 00 00 02', 'Reply', priority='1')
+
+        self._dispatch()
+
+        self.assertEqual(self.sent_texts, [('33600000002@c.us', 'Reply')])
+        self.assertEqual(reply.state, 'sent')
+        self.assertEqual(bulk.state, 'outgoing')
+
+
+@tagged('post_install', '-at_install')
+class TestWahaOutboxOrdering(WahaOutboxCommon):
+
+    def test_chat_order(self):
+        a1 = self._queue('+33 6 00 00 00 01', 'A1')
+        a2 = self._queue('+33 6 00 00 00 01', 'A2')
+        a3 = self._queue('+33 6 00 00 00 01', 'A3')
+        b1 = self._queue('+33 6 00 00 00 02', 'B1')
+        self.failing_texts.add('A2')
+
+        with mute_logger('odoo.addons.waha.models.waha_message'):
+            self._dispatch()
+
+        self.assertEqual(a1.state, 'sent')
+        self.assertEqual(a2.state, 'error')
+        # Never sent before the failed message it follows
+        self.assertEqual(a3.state, 'outgoing')
+        self.assertEqual(b1.state, 'sent')
+
+        chat_a_texts = [text for chat_id, text in self.sent_texts if chat_id == '33600000001@c.us']
+        self.assertEqual(chat_a_texts, ['A1', 'A2'])
+        self.assertIn(('33600000002@c.us', 'B1'), self.sent_texts)
@@ -0,0 +1,130 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+from unittest.mock import patch
+
+from odoo.tests import tagged
+from odoo.tools import mute_logger
+
+from odoo.addons.waha.tests.common import WahaCommon
+
+
+@tagged('post_install', '-at_install')
+class TestWahaWebhookBatch(WahaCommon):
+
+    def _get_messages(self, msg_uid):
+        return self.env['waha.message'].search([
+            ('msg_uid', '=', msg_uid),
+            ('wa_account_id', '=', self.account.id),
+        ])
+
+    def test_duplicate_deliveries_in_batch(self):
+        events = self._create_message_event('msg_dup') | self._create_message_event('msg_dup')
+        events._process_batch()
+
+        self.assertEqual(len(self._get_messages('msg_dup')), 1)
+        self.assertEqual(events.mapped('state'), ['done', 'done'])
+        self.assertEqual(self.chat.message_count, 1)
+
+    def test_existing_message_skipped(self):
+        self._create_message_event('msg_known')._process_batch()
+        message = self._get_messages('msg_known')
+        self.assertEqual(len(message), 1)
+
+        event = self._create_message_event('msg_known', body='Delivered again')
+        event._process_batch()
+
+        self.assertEqual(self._get_messages('msg_known'), message)
+        self.assertEqual(message.body, 'Hello')
+        self.assertEqual(event.state, 'done')
+        self.assertEqual(self.chat.message_count, 1)
+
+    def test_poison_event(self):
+        WebhookEvent = type(self.env['waha.webhook.event'])
+        prepare_message_vals = WebhookEvent._prepare_message_vals
+
+        def prepare_or_fail(model, payload, account, identities=None):
+            if payload.get('id') == 'msg_poison':
+                raise ValueError('Malformed payload')
+            return prepare_message_vals(model, payload, account, identities)
+
+        good_event = self._create_message_event('msg_good')
+        poison_event = self._create_message_event('msg_poison')
+        with patch.object(WebhookEvent, '_prepare_message_vals', prepare_or_fail), \
+                mute_logger('odoo.addons.waha.models.waha_webhook_event'):
+            (good_event | poison_event)._process_batch()
+
+        # The batch falls back to one event at a time, the good one is kept
+        self.assertEqual(good_event.state, 'done')
+        self.assertEqual(len(self._get_messages('msg_good')), 1)
+        self.assertEqual(poison_event.state, 'pending')
+        self.assertEqual(poison_event.attempts, 1)
+        self.assertEqual(poison_event.error_message, 'Malformed payload')
+
+        poison_event.attempts = poison_event._max_attempts - 1
+        with patch.object(WebhookEvent, '_prepare_message_vals', prepare_or_fail), \
+                mute_logger('odoo.addons.waha.models.waha_webhook_event'):
+            poison_event._process_batch()
+        self.assertEqual(poison_event.state, 'error')
+        self.assertFalse(self._get_messages('msg_poison'))
+
+
+@tagged('post_install', '-at_install')
+class TestWahaAckEvents(WahaCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.messages = cls.env['waha.message'].create([{
+            'wa_account_id': cls.account.id,
+            'message_type': 'outbound',
+            'state': 'sent',
+            'msg_uid': msg_uid,
+            'body': 'Hello',
+        } for msg_uid in ('out_1', 'out_2', 'out_3')])
+
+    def _create_ack_event(self, msg_uid, ack):
+        return self._create_event('message.ack', {'id': msg_uid, 'ack': ack})
+
+    def test_last_ack_wins(self):
+        message_1, message_2, message_3 = self.messages
+        events = (
+            self._create_ack_event('out_1', 3)
+            | self._create_ack_event('out_2', 3)
+            | self._create_ack_event('out_1', 4)
+            | self._create_ack_event('out_2', 2)
+        )
+        events._process_batch()
+
+        self.assertEqual(message_1.state, 'read')
+        self.assertTrue(message_1.read_date)
+        # Coalesced: the intermediate ACK is never applied
+        self.assertFalse(message_1.delivered_date)
+        self.assertEqual(message_2.state, 'sent')
+        self.assertFalse(message_2.delivered_date)
+        self.assertEqual(message_3.state, 'sent')
+        self.assertEqual(set(events.mapped('state')), {'done'})
+
+    def test_ack_of_unknown_message(self):
+        event = self._create_ack_event('unknown', 3)
+        event._process_batch()
+
+        self.assertEqual(event.state, 'done')
+        self.assertEqual(set(self.messages.mapped('state')), {'sent'})
+
+    def test_ack_per_account(self):
+        other_account = self.env['waha.account'].create({
+            'name': 'Other Account',
+            'session_name': 'waha_test_other',
+        })
+        other_message = self.env['waha.message'].create({
+            'wa_account_id': other_account.id,
+            'message_type': 'outbound',
+            'state': 'sent',
+            'msg_uid': 'out_1',
+            'body': 'Hello',
+        })
+        self._create_ack_event('out_1', 3)._process_batch()
+
+        self.assertEqual(self.messages[0].state, 'delivered')
+        self.assertTrue(self.messages[0].delivered_date)
+        self.assertEqual(other_message.state, 'sent')
@@ -2,3 +2,9 @@
 
 from . import waha_api
 from . import phone_validation
+from . import rate_limit
+from . import audio_transcoder
+from . import waha_media
+from . import waha_payload
+from . import waha_jid
+from . import concurrency
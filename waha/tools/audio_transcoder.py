@@ -0,0 +1,183 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+"""
+Audio transcoding for WAHA voice notes
+
+ffmpeg reads the source file on stdin and writes MP3 on stdout into
+the output file, the audio never goes through Python. A transcoder caps the number
+of ffmpeg processes running at once in the worker, so a burst of voice
+notes queues up instead of forking one ffmpeg each. Video poster frames
+are extracted through the same slots.
+
+Only depends on the standard library; run this file directly to
+benchmark conversions per second:
+
+    python audio_transcoder.py voice.ogg --count 50 --threads 4 --processes 2
+"""
+
+import logging
+import subprocess
+import threading
+
+_logger = logging.getLogger(__name__)
+
+# Defaults, overridable with the waha.ffmpeg_* system parameters
+DEFAULT_MAX_PROCESSES = 2
+DEFAULT_TIMEOUT = 30
+
+# -acodec libmp3lame: use MP3 codec
+# -ab 128k: audio bitrate 128kbps (good quality for voice)
+# -ar 44100: sample rate 44.1kHz
+# -ac 1: mono channel (voice messages are mono)
+FFMPEG_MP3_ARGS = [
+    'ffmpeg', '-hide_banner', '-loglevel', 'error',
+    '-i', 'pipe:0',
+    '-acodec', 'libmp3lame',
+    '-ab', '128k',
+    '-ar', '44100',
+    '-ac', '1',
+    '-f', 'mp3', 'pipe:1',
+]
+
+# Transcoders of this worker, per process limit
+_transcoders = {}
+_transcoders_lock = threading.Lock()
+
+
+class TranscodeError(Exception):
+    """ffmpeg failed to convert the audio"""
+
+
+class AudioTranscoder:
+    """
+    Converts audio to MP3 through ffmpeg pipes
+
+    At most max_processes ffmpeg run at the same time; other callers
+    wait for a slot.
+    """
+
+    def __init__(self, max_processes=DEFAULT_MAX_PROCESSES, timeout=DEFAULT_TIMEOUT):
+        self.max_processes = max_processes
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_processes)
+
+    def transcode_file(self, input_file, output_file):
+        """
+        Convert an open audio file to MP3
+
+        The file objects are handed to ffmpeg as its stdin/stdout, the
+        data does not go through Python.
+
+        Args:
+            input_file: Binary file object positioned at the start of the source
+            output_file: Binary file object receiving the MP3
+        """
+        with self._slots:
+            try:
+                result = subprocess.run(
+                    FFMPEG_MP3_ARGS,
+                    stdin=input_file,
+                    stdout=output_file,
+                    stderr=subprocess.PIPE,
+                    timeout=self.timeout,
+                )
+            except (OSError, subprocess.TimeoutExpired) as e:
+                raise TranscodeError(str(e)) from e
+        if result.returncode != 0:
+            _logger.error('ffmpeg conversion failed: %s', result.stderr.decode(errors='replace'))
+            raise TranscodeError('ffmpeg failed with code %s' % result.returncode)
+
+    def extract_frame(self, input_path, max_size):
+        """
+        Extract a representative frame of a video
+
+        Args:
+            input_path: Path of the video (seekable, unlike a pipe)
+            max_size: Maximum width of the frame in pixels
+
+        Returns:
+            bytes: PNG content
+        """
+        cmd = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-i', input_path,
+            # thumbnail: pick the most representative of the first frames
+            '-vf', "thumbnail,scale='min(%d,iw)':-2" % max_size,
+            '-frames:v', '1',
+            '-f', 'image2pipe', '-vcodec', 'png', 'pipe:1',
+        ]
+        with self._slots:
+            try:
+                result = subprocess.run(cmd, capture_output=True, timeout=self.timeout)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                raise TranscodeError(str(e)) from e
+        if result.returncode != 0 or not result.stdout:
+            _logger.error('ffmpeg frame extraction failed: %s', result.stderr.decode(errors='replace'))
+            raise TranscodeError('ffmpeg failed with code %s' % result.returncode)
+        return result.stdout
+
+
+def get_transcoder(max_processes=DEFAULT_MAX_PROCESSES, timeout=DEFAULT_TIMEOUT):
+    """
+    Get the transcoder of this worker for a process limit
+
+    Callers using the same limit share the same slots.
+
+    Returns:
+        AudioTranscoder
+    """
+    with _transcoders_lock:
+        transcoder = _transcoders.get(max_processes)
+        if transcoder is None:
+            transcoder = _transcoders[max_processes] = AudioTranscoder(max_processes, timeout)
+        transcoder.timeout = timeout
+        return transcoder
+
+
+def benchmark(path, count=20, threads=4, max_processes=DEFAULT_MAX_PROCESSES):
+    """
+    Measure transcoding throughput
+
+    Each conversion goes through transcode_file like in production:
+    the source file is opened and the MP3 written to a temporary file.
+
+    Args:
+        path: Source audio file
+        count: Number of conversions
+        threads: Number of concurrent callers
+        max_processes: ffmpeg process limit
+
+    Returns:
+        float: Conversions per second
+    """
+    import tempfile
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    transcoder = AudioTranscoder(max_processes)
+
+    def convert(_i):
+        with open(path, 'rb') as input_file, tempfile.TemporaryFile() as output_file:
+            transcoder.transcode_file(input_file, output_file)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _result in executor.map(convert, range(count)):
+            pass
+    return count / (time.monotonic() - start)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark voice note transcoding')
+    parser.add_argument('file', help='Audio file to convert (e.g. an OGG/Opus voice note)')
+    parser.add_argument('--count', type=int, default=20, help='Number of conversions')
+    parser.add_argument('--threads', type=int, default=4, help='Concurrent callers')
+    parser.add_argument('--processes', type=int, default=DEFAULT_MAX_PROCESSES,
+                        help='Maximum concurrent ffmpeg processes')
+    args = parser.parse_args()
+
+    rate = benchmark(args.file, args.count, args.threads, args.processes)
+    print('%d conversions, %d threads, %d ffmpeg processes: %.2f conversions/s'
+          % (args.count, args.threads, args.processes, rate))
@@ -0,0 +1,90 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+"""
+Concurrent ingestion helpers
+
+Several workers may ingest messages of the same chat at once (immediate
+webhooks on HTTP workers, the webhook queue cron, history sync). Records
+identified by a natural key (chat ID, phone, message ID) are claimed with
+transaction advisory locks before being created. A worker finding a key
+already claimed gives up at once with a ConcurrencyError instead of
+waiting for the other transaction and failing on a unique constraint at
+the end: Odoo retries the HTTP request with a fresh transaction, and the
+webhook queue keeps the event for its next run.
+
+Odoo transactions are REPEATABLE READ: a row committed by another worker
+after our snapshot stays invisible, so such creates are also reported as
+a ConcurrencyError, to be retried with a new snapshot.
+"""
+
+from contextlib import contextmanager
+
+from psycopg2 import errors
+
+from odoo.exceptions import ConcurrencyError
+
+# PostgreSQL errors solved by running the transaction again
+PG_CONCURRENCY_ERRORS = (
+    errors.SerializationFailure,
+    errors.DeadlockDetected,
+    errors.LockNotAvailable,
+)
+
+
+def try_lock(cr, keys):
+    """
+    Claim keys until the end of the current transaction, without waiting
+
+    Args:
+        cr: Database cursor
+        keys: Iterable of strings (e.g. 'waha.chat:1:123@c.us')
+
+    Returns:
+        set: Keys claimed by another transaction (not locked)
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return set()
+    cr.execute("""
+        SELECT key
+          FROM unnest(%s::text[]) AS key
+         WHERE NOT pg_try_advisory_xact_lock(hashtext(key))
+    """, [keys])
+    return {key for key, in cr.fetchall()}
+
+
+def claim(cr, keys, what):
+    """
+    Claim keys, raising if another transaction holds one of them
+
+    Args:
+        cr: Database cursor
+        keys: Iterable of strings
+        what: Description of the claimed records, for the error
+
+    Raises:
+        ConcurrencyError: A key is being processed by another transaction
+    """
+    busy = try_lock(cr, keys)
+    if busy:
+        raise ConcurrencyError('%s being created by another transaction: %s' % (what, ', '.join(sorted(busy))))
+
+
+@contextmanager
+def create_or_retry(cr, what):
+    """
+    Run creates in a savepoint, turning unique violations into ConcurrencyError
+
+    A unique violation after a successful claim means a concurrent
+    transaction committed the record after our snapshot was taken.
+    """
+    try:
+        with cr.savepoint():
+            yield
+    except errors.UniqueViolation as e:
+        raise ConcurrencyError('%s created by another transaction: %s' % (what, e.diag.constraint_name)) from e
+
+
+def is_concurrency_error(exc):
+    """Whether an exception is solved by running the transaction again"""
+    return isinstance(exc, (ConcurrencyError, *PG_CONCURRENCY_ERRORS))
@@ -0,0 +1,70 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+"""
+Rate limiting utilities for WAHA outbound sends
+
+The level of a bucket is kept by its owner between uses (waha.account
+stores it in the database, so that the limit holds across workers and
+cron runs). Times are wall-clock seconds for that reason.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Tokens refill continuously at `rate` per second up to `burst`;
+    each send consumes one token.
+    """
+
+    def __init__(self, rate, burst, tokens=None, updated=None):
+        """
+        Args:
+            rate: Tokens per second
+            burst: Bucket capacity
+            tokens: Level at `updated` (default: full)
+            updated: Time of that level, in seconds since the epoch
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst) if tokens is None else min(float(tokens), float(burst))
+        self.updated = time.time() if updated is None else updated
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        if self.rate > 0:
+            self.tokens = min(float(self.burst), self.tokens + max(now - self.updated, 0) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Consume tokens if available
+
+        Returns:
+            float: 0 if the tokens were acquired, otherwise the number of
+            seconds to wait before they will be available
+        """
+        with self.lock:
+            if self.rate <= 0:
+                # Paused: the tokens left from before do not allow a send either
+                return float('inf')
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def get_state(self):
+        """
+        Current level of the bucket, to be stored by its owner
+
+        Returns:
+            tuple: (tokens, time of the level in seconds since the epoch)
+        """
+        with self.lock:
+            self._refill()
+            return self.tokens, self.updated
@@ -1,12 +1,61 @@
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
+import hashlib
 import logging
+import threading
 import requests
 import base64
 import json
 
+from requests.adapters import HTTPAdapter
+
 _logger = logging.getLogger(__name__)
 
+# Defaults, overridable with the waha.http_* system parameters
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+
+# Media downloads are streamed by chunks of this size
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Keep-alive sessions shared by every WahaApi of this worker, per WAHA server
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_http_session(base_url, pool_size=DEFAULT_POOL_SIZE):
+    """
+    Get the pooled requests.Session for a WAHA server
+    
+    Sessions are created once per base URL and worker process and reused
+    across calls, so TCP/TLS connections are kept alive between requests.
+    
+    Args:
+        base_url: WAHA server URL
+        pool_size: Maximum number of connections kept open to the server
+        
+    Returns:
+        requests.Session
+    """
+    with _sessions_lock:
+        session, current_size = _sessions.get(base_url, (None, None))
+        if session is None or current_size != pool_size:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[base_url] = (session, pool_size)
+        return session
+
+
+class MediaTooLarge(Exception):
+    """Media file bigger than the configured limit"""
+
+    def __init__(self, size, max_size):
+        self.size = size
+        self.max_size = max_size
+        super().__init__('Media of %d bytes exceeds the limit of %d bytes' % (size, max_size))
+
 
 class WahaApi:
     """
@@ -29,6 +78,13 @@ class WahaApi:
         self.headers = {'Content-Type': 'application/json'}
         if self.api_key:
             self.headers['X-Api-Key'] = self.api_key
+        
+        ICP = account.env['ir.config_parameter'].sudo()
+        self.connect_timeout = float(ICP.get_param('waha.http_connect_timeout', DEFAULT_CONNECT_TIMEOUT))
+        self.session = get_http_session(
+            self.base_url,
+            int(ICP.get_param('waha.http_pool_size', DEFAULT_POOL_SIZE)),
+        )
 
     def _make_request(self, method, endpoint, data=None, files=None, timeout=30):
         """
@@ -39,7 +95,7 @@ class WahaApi:
             endpoint: API endpoint
             data: JSON data to send
             files: Files to upload
-            timeout: Request timeout in seconds
+            timeout: Read timeout in seconds
             
         Returns:
             dict: Response data
@@ -47,13 +103,13 @@ class WahaApi:
         url = f"{self.base_url}{endpoint}"
         
         try:
-            response = requests.request(
+            response = self.session.request(
                 method=method,
                 url=url,
                 json=data if data and not files else None,
                 files=files,
                 headers=self.headers,
-                timeout=timeout
+                timeout=(self.connect_timeout, timeout)
             )
             
             # Log request for debugging
@@ -99,6 +155,90 @@ class WahaApi:
             _logger.error('WAHA API Unexpected Error: %s %s - %s', method, url, str(e))
             raise
 
+    # ============================================================
+    # MEDIA DOWNLOAD
+    # ============================================================
+
+    def _fix_media_url(self, url):
+        """Point media URLs WAHA builds for itself (localhost) to the configured server"""
+        for local_url in ('http://localhost:3000', 'http://127.0.0.1:3000'):
+            if url.startswith(local_url):
+                return self.base_url + url[len(local_url):]
+        return url
+
+    def download(self, url, timeout=30):
+        """
+        Download a media file (message media, profile picture) from WAHA
+        
+        Uses the pooled session and the account API key.
+        
+        Args:
+            url: Media URL as returned by WAHA
+            timeout: Read timeout in seconds
+            
+        Returns:
+            bytes: File content
+        """
+        headers = {}
+        if self.api_key:
+            headers['X-Api-Key'] = self.api_key
+        
+        response = self.session.get(
+            self._fix_media_url(url),
+            headers=headers,
+            timeout=(self.connect_timeout, timeout)
+        )
+        response.raise_for_status()
+        return response.content
+
+    def download_to_file(self, url, fileobj, max_size=None, timeout=30, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        Stream a media file from WAHA into a file object
+        
+        The content is never held in memory as a whole: it is written
+        chunk by chunk and hashed on the fly.
+        
+        Args:
+            url: Media URL as returned by WAHA
+            fileobj: Binary file object to write to
+            max_size: Maximum size in bytes (None = unlimited)
+            timeout: Read timeout in seconds
+            chunk_size: Size of the chunks read from the socket
+            
+        Returns:
+            tuple: (size in bytes, sha1 hex digest)
+            
+        Raises:
+            MediaTooLarge: If the file exceeds max_size
+        """
+        headers = {}
+        if self.api_key:
+            headers['X-Api-Key'] = self.api_key
+        
+        with self.session.get(
+            self._fix_media_url(url),
+            headers=headers,
+            timeout=(self.connect_timeout, timeout),
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            
+            # Refuse before reading anything when the size is announced
+            content_length = response.headers.get('Content-Length')
+            if max_size and content_length and int(content_length) > max_size:
+                raise MediaTooLarge(int(content_length), max_size)
+            
+            size = 0
+            sha = hashlib.sha1()
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise MediaTooLarge(size, max_size)
+                sha.update(chunk)
+                fileobj.write(chunk)
+        
+        return size, sha.hexdigest()
+
     # ============================================================
     # SESSION MANAGEMENT
     # ============================================================
@@ -195,7 +335,23 @@ class WahaApi:
         
         return result
 
-    def send_image(self, chat_id, image_data, caption=None):
+    def _file_payload(self, mimetype, data=None, url=None, filename=None):
+        """
+        Build the file part of a send request
+        
+        With url, WAHA downloads the file itself and the content never
+        goes through this worker.
+        """
+        file = {'mimetype': mimetype}
+        if url:
+            file['url'] = url
+        else:
+            file['data'] = data
+        if filename:
+            file['filename'] = filename
+        return file
+
+    def send_image(self, chat_id, image_data=None, caption=None, url=None):
         """
         Send image message
         
@@ -203,21 +359,19 @@ class WahaApi:
             chat_id: WhatsApp chat ID
             image_data: Base64 encoded image data
             caption: Optional caption
+            url: URL WAHA downloads the image from, instead of image_data
         """
         data = {
             'session': self.session_name,
             'chatId': chat_id,
-            'file': {
-                'mimetype': 'image/jpeg',
-                'data': image_data
-            }
+            'file': self._file_payload('image/jpeg', image_data, url),
         }
         if caption:
             data['caption'] = caption
         
         return self._make_request('POST', '/api/sendImage', data=data)
 
-    def send_file(self, chat_id, file_data, filename, mimetype):
+    def send_file(self, chat_id, file_data, filename, mimetype, caption=None, url=None):
         """
         Send file/document message
         
@@ -226,41 +380,37 @@ class WahaApi:
             file_data: Base64 encoded file data
             filename: File name
             mimetype: MIME type
+            caption: Optional caption
+            url: URL WAHA downloads the file from, instead of file_data
         """
-        return self._make_request('POST', '/api/sendFile', data={
+        data = {
             'session': self.session_name,
             'chatId': chat_id,
-            'file': {
-                'filename': filename,
-                'mimetype': mimetype,
-                'data': file_data
-            }
-        })
+            'file': self._file_payload(mimetype, file_data, url, filename),
+        }
+        if caption:
+            data['caption'] = caption
+        
+        return self._make_request('POST', '/api/sendFile', data=data)
 
-    def send_video(self, chat_id, video_data, caption=None):
-        """Send video message"""
+    def send_video(self, chat_id, video_data=None, caption=None, url=None):
+        """Send video message (base64 video_data, or url downloaded by WAHA)"""
         data = {
             'session': self.session_name,
             'chatId': chat_id,
-            'file': {
-                'mimetype': 'video/mp4',
-                'data': video_data
-            }
+            'file': self._file_payload('video/mp4', video_data, url),
         }
         if caption:
             data['caption'] = caption
         
         return self._make_request('POST', '/api/sendVideo', data=data)
 
-    def send_audio(self, chat_id, audio_data):
-        """Send audio message"""
+    def send_audio(self, chat_id, audio_data=None, url=None):
+        """Send audio message (base64 audio_data, or url downloaded by WAHA)"""
         return self._make_request('POST', '/api/sendAudio', data={
             'session': self.session_name,
             'chatId': chat_id,
-            'file': {
-                'mimetype': 'audio/ogg',
-                'data': audio_data
-            }
+            'file': self._file_payload('audio/ogg', audio_data, url),
         })
 
     def send_location(self, chat_id, latitude, longitude, title=None):
@@ -303,11 +453,13 @@ class WahaApi:
             _logger.warning('get_contacts not available (non-critical): %s', str(e))
             return []
 
-    def get_contact(self, phone_number):
+    def get_contact(self, phone_number, contact_id=None):
         """Get a specific contact by phone number
         
         Args:
             phone_number: Phone number (with or without country code)
+            contact_id: Known WhatsApp ID of the contact (e.g., 987654@lid),
+                asked alone instead of trying every ID format
         
         Returns:
             Contact information dict or None if not found
@@ -317,7 +469,7 @@ class WahaApi:
             normalized_phone = str(phone_number).replace('+', '').replace(' ', '')
             
             # Try different WhatsApp ID formats
-            contact_ids = [
+            contact_ids = [contact_id] if contact_id else [
                 f"{normalized_phone}@c.us",
                 f"{normalized_phone}@lid",
                 normalized_phone,
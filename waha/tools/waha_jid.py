@@ -0,0 +1,85 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+"""
+WhatsApp JID helpers
+
+WhatsApp identifies the same person as 123@c.us (phone), 987@lid
+(linked identity, hiding the phone) or 123@s.whatsapp.net depending on
+the engine; these helpers bring them to one form and find them in
+message payloads.
+"""
+
+# Servers of the JIDs identifying a person (groups, broadcasts and
+# newsletters are not contacts)
+CONTACT_SERVERS = ('c.us', 'lid')
+
+# Other engines' names of the c.us server
+JID_SERVER_ALIASES = {
+    's.whatsapp.net': 'c.us',
+}
+
+# Payload values identifying the other side of a 1-1 chat
+# (WEBJS id.remote, NOWEB key.remoteJid/remoteJidAlt/senderPn, GOWS Info.Chat)
+CHAT_CONTACT_PATHS = (
+    ('_data', 'id', 'remote'),
+    ('_data', 'key', 'remoteJid'),
+    ('_data', 'key', 'remoteJidAlt'),
+    ('_data', 'key', 'senderPn'),
+    ('_data', 'Info', 'Chat'),
+)
+
+# Payload values identifying the sender of a message
+# (WEBJS id.participant/author, NOWEB key.participant*, GOWS Info.Sender*)
+SENDER_PATHS = (
+    ('participant',),
+    ('_data', 'id', 'participant'),
+    ('_data', 'author'),
+    ('_data', 'key', 'participant'),
+    ('_data', 'key', 'participantPn'),
+    ('_data', 'key', 'participantAlt'),
+    ('_data', 'Info', 'Sender'),
+    ('_data', 'Info', 'SenderAlt'),
+)
+
+
+def normalize_jid(value):
+    """
+    Normalize a WhatsApp JID of a person
+
+    Args:
+        value: JID string ('123:4@s.whatsapp.net') or WEBJS id dict
+
+    Returns:
+        str: 'user@c.us' or 'user@lid', or False for other JIDs
+    """
+    if isinstance(value, dict):
+        value = value.get('_serialized') or (
+            value.get('user') and value.get('server') and f"{value['user']}@{value['server']}"
+        )
+    if not value or not isinstance(value, str) or '@' not in value:
+        return False
+    user, server = value.strip().split('@', 1)
+    # Drop the device of multi-device JIDs
+    user = user.split(':')[0]
+    server = JID_SERVER_ALIASES.get(server, server)
+    if not user or server not in CONTACT_SERVERS:
+        return False
+    return f'{user}@{server}'
+
+
+def jid_phone(jid):
+    """Phone number (digits) of a c.us JID, False for LIDs"""
+    if jid and jid.endswith('@c.us'):
+        phone = jid.split('@')[0]
+        return phone if phone.isdigit() else False
+    return False
+
+
+def get_path(payload, path):
+    """Value of a payload at a path of keys, None if missing"""
+    value = payload
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
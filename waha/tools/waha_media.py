@@ -0,0 +1,235 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+"""
+Media fetching for WAHA messages
+
+Functions here run in the media worker threads: they only perform
+HTTP calls and conversions, never ORM access. Jobs are prepared and
+their results attached by waha.message (see _cron_process_media).
+"""
+
+import base64
+import hashlib
+import io
+import logging
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+from .audio_transcoder import TranscodeError
+from .waha_api import DOWNLOAD_CHUNK_SIZE, MediaTooLarge
+
+_logger = logging.getLogger(__name__)
+
+# Default maximum media sizes in MB, overridable per content type with
+# the waha.media_max_size_<content_type> system parameters (0 = no limit)
+DEFAULT_MAX_SIZES_MB = {
+    'image': 16,
+    'sticker': 1,
+    'audio': 16,
+    'video': 100,
+    'document': 100,
+}
+
+# Default preview width/height in pixels, overridable with
+# waha.media_preview_size (0 = no previews)
+DEFAULT_PREVIEW_SIZE = 512
+
+# Images smaller than this are shown as they are
+PREVIEW_MIN_IMAGE_SIZE = 100 * 1024
+
+
+def fetch_media(api, job, transcoder=None):
+    """
+    Get the content of a prepared media job into a temporary file
+
+    Images and videos are downloaded from their URL (the base64 of the
+    payload is only a thumbnail); other types use the payload base64
+    when available and fall back to the URL. Downloads are streamed to
+    disk, so memory use does not depend on the file size.
+
+    Args:
+        api: WahaApi of the message account
+        job: dict prepared by waha.message._prepare_media_job
+        transcoder: AudioTranscoder extracting video poster frames
+
+    Returns:
+        dict: path, size, checksum (sha1), mimetype, filename and preview
+        (WebP bytes or None). The caller owns the file at path and must
+        remove it.
+
+    Raises:
+        MediaTooLarge: If the file exceeds job['max_size']
+        Exception: If no content could be obtained
+    """
+    fd, path = tempfile.mkstemp(prefix='waha-media-')
+    try:
+        with os.fdopen(fd, 'wb') as media_file:
+            if job['url'] and (job['prefer_url'] or not job['data']):
+                _logger.info('Downloading %s from URL: %s', job['content_type'], job['url'])
+                size, checksum = api.download_to_file(
+                    job['url'], media_file, max_size=job['max_size'], timeout=job['timeout']
+                )
+            elif job['data']:
+                binary = base64.b64decode(job['data'])
+                if job['max_size'] and len(binary) > job['max_size']:
+                    raise MediaTooLarge(len(binary), job['max_size'])
+                media_file.write(binary)
+                size, checksum = len(binary), hashlib.sha1(binary).hexdigest()
+            else:
+                size = 0
+
+        if not size:
+            raise ValueError('No media content available for %s' % job['content_type'])
+
+        _logger.info('Fetched %s: %d bytes', job['content_type'], size)
+
+        preview = None
+        if job['preview_size']:
+            preview = make_preview(path, size, job['content_type'], job['preview_size'], transcoder)
+
+        return {
+            'path': path,
+            'size': size,
+            'checksum': checksum,
+            'mimetype': job['mimetype'],
+            'filename': job['filename'],
+            'preview': preview,
+        }
+    except Exception:
+        remove_file(path)
+        raise
+
+
+def make_preview(path, size, content_type, max_size, transcoder=None):
+    """
+    Make a small WebP preview of an image or video
+
+    Images are downscaled, videos get a poster frame. A failing preview
+    is not an error, the original is shown instead.
+
+    Args:
+        path: Path of the fetched file
+        size: Size of the file in bytes
+        content_type: image, video or another type (no preview)
+        max_size: Maximum width/height of the preview in pixels
+        transcoder: AudioTranscoder extracting the frame of videos
+
+    Returns:
+        bytes: WebP content, or None if no preview applies
+    """
+    try:
+        if content_type == 'image':
+            if size < PREVIEW_MIN_IMAGE_SIZE:
+                return None
+            image = Image.open(path)
+        elif content_type == 'video' and transcoder:
+            image = Image.open(io.BytesIO(transcoder.extract_frame(path, max_size)))
+        else:
+            return None
+
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        output = io.BytesIO()
+        image.save(output, 'WEBP', quality=75)
+        _logger.info('Preview of %s: %d bytes', content_type, output.tell())
+        return output.getvalue()
+    except Exception as e:
+        _logger.warning('Failed to make a preview of %s: %s', content_type, str(e))
+        return None
+
+
+def reduce_image(data, max_size, quality):
+    """
+    Downscale and recompress a JPEG or WebP image, keeping its format
+
+    Args:
+        data: Image content
+        max_size: Maximum width/height in pixels
+        quality: Compression quality, 1-95
+
+    Returns:
+        bytes: Reduced content, or None if the image is in another format
+        or would not get smaller
+    """
+    image = Image.open(io.BytesIO(data))
+    image_format = image.format
+    if image_format not in ('JPEG', 'WEBP'):
+        return None
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_size, max_size))
+    output = io.BytesIO()
+    image.save(output, image_format, quality=quality)
+    if output.tell() >= len(data):
+        return None
+    return output.getvalue()
+
+
+def hash_file(path):
+    """
+    Hash a file without loading it in memory
+
+    Returns:
+        tuple: (size in bytes, sha1 hex digest)
+    """
+    sha = hashlib.sha1()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            size += len(chunk)
+            sha.update(chunk)
+    return size, sha.hexdigest()
+
+
+def remove_file(path):
+    """Remove a temporary file, ignoring missing files"""
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def needs_transcoding(mimetype):
+    """Whether fetched media must be converted to MP3 (browsers do not all play OGG/Opus)"""
+    return bool(mimetype) and mimetype.startswith('audio/') and 'ogg' in mimetype.lower()
+
+
+def transcode_media(transcoder, media):
+    """
+    Convert fetched audio to MP3
+
+    ffmpeg reads the fetched file on stdin and writes the MP3 straight
+    into the file that will be moved to the filestore.
+
+    Args:
+        transcoder: tools.audio_transcoder.AudioTranscoder
+        media: dict returned by fetch_media, its file is consumed
+
+    Returns:
+        dict: The converted media, with source_checksum set to the
+        checksum of the original file. If the conversion fails, the
+        original media is returned (with source_checksum too, so that it
+        is not converted again).
+    """
+    result = dict(media, source_checksum=media['checksum'])
+    fd, path = tempfile.mkstemp(prefix='waha-media-', suffix='.mp3')
+    try:
+        with open(media['path'], 'rb') as source, os.fdopen(fd, 'wb') as output:
+            transcoder.transcode_file(source, output)
+    except (OSError, TranscodeError) as e:
+        remove_file(path)
+        _logger.warning('Failed to convert audio to MP3, using original: %s', str(e))
+        return result
+
+    remove_file(media['path'])
+    size, checksum = hash_file(path)
+    filename = media['filename']
+    if filename.endswith('.ogg'):
+        filename = filename[:-4] + '.mp3'
+    result.update(path=path, size=size, checksum=checksum,
+                  mimetype='audio/mpeg', filename=filename)
+    _logger.info('Audio converted to MP3 successfully: %d bytes', size)
+    return result
@@ -0,0 +1,72 @@
+# Part of Odoo. See LICENSE file for full copyright and licensing details.
+
+"""
+Raw WAHA payload slimming
+
+Media payloads embed the file content as base64 (media.data, and the
+WEBJS _data.body), a copy of what is stored as attachment. Before a
+payload is persisted, these values are replaced by a marker keeping
+their size and sha1, so the payload stays an honest record of what was
+received without carrying the file.
+"""
+
+import hashlib
+
+# Key identifying a stripped value
+STRIPPED_MARKER = '__waha_stripped__'
+
+# Default minimum size of a stripped value, overridable with
+# waha.payload_slim_min_size (characters of base64)
+DEFAULT_SLIM_MIN_SIZE = 1024
+
+# Payload values holding media content
+MEDIA_CONTENT_PATHS = (
+    ('media', 'data'),
+    ('_data', 'body'),
+)
+
+
+def strip_media_content(payload, min_size=DEFAULT_SLIM_MIN_SIZE):
+    """
+    Replace media content of a payload by markers
+
+    Only payloads with media are touched (the _data.body of a text
+    message is its text).
+
+    Args:
+        payload: WAHA message payload
+        min_size: Values shorter than this are kept
+
+    Returns:
+        dict: A slimmed copy of the payload, or the payload itself when
+        nothing was stripped
+    """
+    if not payload or not payload.get('hasMedia'):
+        return payload
+
+    slimmed = payload
+    for parent_key, key in MEDIA_CONTENT_PATHS:
+        parent = slimmed.get(parent_key)
+        if not isinstance(parent, dict):
+            continue
+        value = parent.get(key)
+        if not isinstance(value, str) or len(value) < min_size:
+            continue
+        if slimmed is payload:
+            slimmed = dict(payload)
+        slimmed[parent_key] = dict(parent, **{key: {
+            STRIPPED_MARKER: True,
+            'size': len(value),
+            'sha1': hashlib.sha1(value.encode()).hexdigest(),
+        }})
+    return slimmed
+
+
+def is_stripped(value):
+    """Whether a payload value was replaced by a marker"""
+    return isinstance(value, dict) and value.get(STRIPPED_MARKER, False)
+
+
+def stripped_to_none(value):
+    """The value, or None if it was stripped"""
+    return None if is_stripped(value) else value
@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import re
+from ast import literal_eval
+
 from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
 
@@ -14,7 +17,7 @@ class WahaComposer(models.TransientModel):
         required=True,
         domain=[('status', '=', 'connected')]
     )
-    mobile_number = fields.Char('Phone Number', required=True)
+    mobile_number = fields.Char('Phone Number')
     mobile_number_formatted = fields.Char(
         'Formatted Number',
         compute='_compute_mobile_number_formatted'
@@ -40,6 +43,11 @@ class WahaComposer(models.TransientModel):
     res_model = fields.Char('Related Model')
     res_id = fields.Integer('Related Record ID')
     
+    # Batch mode (server action on several records)
+    batch_mode = fields.Boolean('Batch Mode')
+    res_ids = fields.Char('Related Record IDs')
+    recipient_count = fields.Integer('Recipients', compute='_compute_recipient_count')
+    
     # Preview
     preview_body = fields.Html('Preview', compute='_compute_preview_body')
 
@@ -56,6 +64,12 @@ class WahaComposer(models.TransientModel):
             else:
                 composer.mobile_number_formatted = ''
 
+    @api.depends('batch_mode', 'res_ids')
+    def _compute_recipient_count(self):
+        """Count the records of a batch send"""
+        for composer in self:
+            composer.recipient_count = len(composer._get_batch_records()) if composer.batch_mode else 1
+
     @api.depends('body', 'wa_template_id', 'res_model', 'res_id')
     def _compute_preview_body(self):
         """Compute preview of message with variables replaced"""
@@ -87,98 +101,131 @@ class WahaComposer(models.TransientModel):
         if not self.use_template:
             self.wa_template_id = False
 
-    def action_send_message(self):
-        """Send WhatsApp message"""
+    def _get_batch_records(self):
+        """Records targeted by a batch send"""
         self.ensure_one()
+        if not self.res_model or not self.res_ids:
+            return self.env['res.partner']
+        return self.env[self.res_model].browse(literal_eval(self.res_ids)).exists()
+
+    def _get_message_bodies(self, records):
+        """
+        Plain text bodies, rendered per record when a template is used
+        
+        :param records: Recipient records (may be empty)
+        :return: dict mapping record id (False without record) to body
+        """
+        self.ensure_one()
+        if self.wa_template_id and records:
+            bodies = self.wa_template_id._render_bodies(records)
+        else:
+            body = self.preview_body or self.body or ''
+            bodies = {record.id: body for record in records} if records else {False: body}
+        return {key: re.sub(r'<[^>]+>', '', body).strip() for key, body in bodies.items()}
+
+    def _queue_messages(self, priority):
+        """
+        Queue the outbound messages of this composer
         
-        if not self.mobile_number:
-            raise ValidationError(_('Phone number is required'))
+        Single mode sends to mobile_number, batch mode to the phone
+        field (template phone field, default mobile) of every record.
+        Attachments are sent as separate file messages.
+        
+        Args:
+            priority: Outbox priority of the messages
+            
+        Returns:
+            waha.message recordset
+        """
+        self.ensure_one()
         
         if not self.body:
             raise ValidationError(_('Message body is required'))
         
-        # Clean HTML tags from body
-        import re
-        clean_body = re.sub(r'<[^>]+>', '', (self.preview_body or self.body)).strip()
+        WahaMessage = self.env['waha.message']
+        extra_vals = {'priority': priority}
+        if self.wa_template_id:
+            extra_vals['wa_template_id'] = self.wa_template_id.id
         
-        # Prepare message data
-        message_vals = {
-            'wa_account_id': self.wa_account_id.id,
-            'mobile_number': self.mobile_number,
-            'body': clean_body,
-            'message_type': 'outbound',
-        }
+        if self.batch_mode:
+            phone_field = self.wa_template_id.phone_field or 'mobile'
+            records = self._get_batch_records()
+            recipients = [
+                (record[phone_field] if phone_field in record._fields else False, record.id)
+                for record in records
+            ]
+        else:
+            if not self.mobile_number:
+                raise ValidationError(_('Phone number is required'))
+            records = self.env[self.res_model].browse(self.res_id) if self.res_model and self.res_id else None
+            recipients = [(self.mobile_number, records.id if records else False)]
         
-        if self.wa_template_id:
-            message_vals['wa_template_id'] = self.wa_template_id.id
+        bodies = self._get_message_bodies(records)
+        contact_jids = WahaMessage._get_outbound_jids(self.wa_account_id, [number for number, _id in recipients])
+        vals_list = []
+        vals_attachments = []  # attachment to link to each message, by position
+        for number, record_id in recipients:
+            body = bodies[record_id]
+            vals = WahaMessage._prepare_outbound_vals(
+                self.wa_account_id, number, body, contact_jids=contact_jids, **extra_vals
+            )
+            if not vals:
+                continue
+            vals_list.append(vals)
+            vals_attachments.append(None)
+            for attachment in self.attachment_ids:
+                vals_list.append(dict(vals, body=attachment.name, content_type='document'))
+                vals_attachments.append(attachment)
+        
+        if not vals_list:
+            raise ValidationError(_('No valid phone number to send the message to'))
         
-        # Create message
-        message = self.env['waha.message'].create(message_vals)
+        messages = WahaMessage.create(vals_list)
         
-        # Link to mail.message if we have a related record
-        if self.res_model and self.res_id:
+        # Link the attachments to their file messages
+        for message, attachment in zip(messages, vals_attachments):
+            if attachment:
+                attachment.copy({'res_model': 'waha.message', 'res_id': message.id})
+        
+        return messages
+
+    def action_send_message(self):
+        """Queue the WhatsApp message(s), sent right away by the outbox"""
+        self.ensure_one()
+        
+        messages = self._queue_messages(priority='0' if self.batch_mode else '1')
+        
+        # Log on the related record
+        if not self.batch_mode and self.res_model and self.res_id:
             try:
                 record = self.env[self.res_model].browse(self.res_id)
                 mail_message = record.message_post(
-                    body=clean_body,
+                    body=messages[0].body,
                     message_type='comment',
                     subtype_xmlid='mail.mt_comment',
                     author_id=self.env.user.partner_id.id,
                 )
-                message.mail_message_id = mail_message.id
+                messages[0].mail_message_id = mail_message.id
             except Exception:
                 pass
         
-        # Handle attachments
-        if self.attachment_ids:
-            for attachment in self.attachment_ids:
-                # Send file message for each attachment
-                try:
-                    message.wa_account_id._send_waha_message(
-                        self.mobile_number,
-                        body=self.preview_body or self.body,
-                        attachment=attachment
-                    )
-                except Exception as e:
-                    message.write({
-                        'state': 'error',
-                        'failure_reason': str(e)
-                    })
-        
-        # Send message
-        try:
-            message.action_send()
-            
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': _('Success'),
-                    'message': _('WhatsApp message sent successfully'),
-                    'type': 'success',
-                    'sticky': False,
-                }
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Success'),
+                'message': _('%s WhatsApp message(s) queued for sending', len(messages)),
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
             }
-        except Exception as e:
-            raise ValidationError(_('Failed to send message: %s') % str(e))
+        }
 
     def action_schedule_message(self):
-        """Schedule message to be sent later"""
+        """Queue the message(s) at bulk priority, after interactive messages"""
         self.ensure_one()
         
-        # Create message in outgoing state
-        message_vals = {
-            'wa_account_id': self.wa_account_id.id,
-            'mobile_number': self.mobile_number,
-            'body': self.preview_body or self.body,
-            'message_type': 'outbound',
-            'state': 'outgoing',
-        }
-        
-        if self.wa_template_id:
-            message_vals['wa_template_id'] = self.wa_template_id.id
-        
-        message = self.env['waha.message'].create(message_vals)
+        self._queue_messages(priority='0')
         
         return {
             'type': 'ir.actions.client',
@@ -188,5 +235,6 @@ class WahaComposer(models.TransientModel):
                 'message': _('Message scheduled to be sent'),
                 'type': 'info',
                 'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
             }
         }